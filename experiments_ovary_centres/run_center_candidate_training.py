@@ -97,6 +97,7 @@ CENTER_PARAMS = {
     'classif': 'RandForest',
     # 'classif': 'SVM',
     'nb_classif_search': 50,
+    'classif_search_type': 'halving',
     'dict_relabel': None,
     # 'dict_relabel': {0: [0], 1: [1], 2: [2, 3]},
     'center_dist_thr': 50,  # distance to from annotated center as a point
@@ -188,7 +189,7 @@ def is_drawing(path_out):
 
 
 def find_match_images_segms_centers(path_pattern_imgs, path_pattern_segms,
-                                    path_pattern_center=None):
+                                    path_pattern_center=None, path_manifest=None):
     """ walk over dir with images and segmentation and pair those with the same
     name and if the folder with centers exists also add to each par a center
     NOTE: returns just paths
@@ -196,11 +197,13 @@ def find_match_images_segms_centers(path_pattern_imgs, path_pattern_segms,
     :param str path_pattern_imgs:
     :param str path_pattern_segms:
     :param str path_pattern_center:
+    :param str|None path_manifest: JSON manifest caching directory listings
     :return DF: DF<path_img, path_segm, path_center>
     """
     logging.info('find match images-segms-centres...')
     list_paths = [path_pattern_imgs, path_pattern_segms, path_pattern_center]
-    df_paths = tl_data.find_files_match_names_across_dirs(list_paths)
+    df_paths = tl_data.find_files_match_names_across_dirs(
+        list_paths, path_manifest=path_manifest)
 
     if not path_pattern_center:
         df_paths.columns = ['path_image', 'path_segm']
@@ -249,8 +252,7 @@ def load_image_segm_center(idx_row, path_out=None, dict_relabel=None):
 
     seg_ext = os.path.splitext(os.path.basename(row_path['path_segm']))[-1]
     if seg_ext == '.npz':
-        with np.load(row_path['path_segm']) as npzfile:
-            segm = npzfile[npzfile.files[0]]
+        segm = tl_data.load_segm_soft(row_path['path_segm'])
         if dict_relabel is not None:
             segm = seg_lbs.merge_probab_labeling_2d(segm, dict_relabel)
     else:
@@ -689,7 +691,8 @@ def load_df_paths(params):
         else:
             df_paths = find_match_images_segms_centers(params['path_images'],
                                                        params['path_segms'],
-                                                       params['path_centers'])
+                                                       params['path_centers'],
+                                                       params.get('path_manifest'))
         df_paths.to_csv(path_csv, encoding='utf-8')
     df_paths.index = list(range(len(df_paths)))
     return df_paths, path_csv
@@ -748,14 +751,19 @@ def main_train(params):
     classif, params['path_classif'] = seg_clf.create_classif_search_train_export(
         params['classif'], features, labels, cross_val=cv, params=params,
         feature_names=feature_names, nb_search_iter=params['nb_classif_search'],
+        search_type=params.get('classif_search_type', 'random'),
         pca_coef=params.get('pca_coef', None), nb_workers=params['nb_workers'],
         path_out=params['path_expt'])
     nb_holdout = int(np.ceil(len(sizes) * CROSS_VAL_LEAVE_OUT_EVAL))
     cv = seg_clf.CrossValidateGroups(sizes, nb_holdout)
+    # the folds are trained once and shared by both evaluations
+    fold_cache = {}
     seg_clf.eval_classif_cross_val_scores(params['classif'], classif, features, labels,
-                                          cross_val=cv, path_out=params['path_expt'])
+                                          cross_val=cv, path_out=params['path_expt'],
+                                          fold_cache=fold_cache)
     seg_clf.eval_classif_cross_val_roc(params['classif'], classif, features, labels,
-                                       cross_val=cv, path_out=params['path_expt'])
+                                       cross_val=cv, path_out=params['path_expt'],
+                                       fold_cache=fold_cache)
 
     if RUN_LEAVE_ONE_OUT:
         experiment_loo(classif, dict_imgs, dict_segms, dict_centers, dict_slics,
@@ -50,6 +50,19 @@ DEFAULT_PARAMS['path_centers'] = os.path.join(DEFAULT_PARAMS['path_output'],
                                               'classifier_RandForest.pkl')
 
 
+#: classifier loaded once in each worker process, see `init_worker_classif`
+WORKER_CLASSIF = None
+
+
+def init_worker_classif(path_classif):
+    """ load the (memory-mapped) classifier once per worker process
+
+    :param str path_classif: path to the exported classifier
+    """
+    global WORKER_CLASSIF
+    WORKER_CLASSIF = seg_clf.load_classifier(path_classif)['clf_pipeline']
+
+
 def load_compute_detect_centers(idx_row, params, classif=None, path_classif='',
                                 path_output=''):
     """ complete pipeline fon input image and seg_pipe, such that load them,
@@ -66,8 +79,9 @@ def load_compute_detect_centers(idx_row, params, classif=None, path_classif='',
     dict_center = dict(row)
 
     if not classif:
-        dict_classif = seg_clf.load_classifier(path_classif)
-        classif = dict_classif['clf_pipeline']
+        if WORKER_CLASSIF is None:
+            init_worker_classif(path_classif)
+        classif = WORKER_CLASSIF
 
     try:
         path_show_in = os.path.join(path_output, FOLDER_INPUTS)
@@ -147,7 +161,8 @@ def main(params):
                                 params['path_images'], params['path_segms'],
                                 force_reload=FORCE_RERUN)
 
-    dict_classif = seg_clf.load_classifier(params['path_classif'])
+    dict_classif = seg_clf.load_classifier(params['path_classif'],
+                                           load_model=False)
     params_clf = dict_classif['params']
     params_clf.update(params)
     logging.info(tl_expt.string_dict(params, desc='UPDATED PARAMETERS'))
@@ -158,7 +173,9 @@ def main(params):
                                  path_classif=params['path_classif'],
                                  path_output=params['path_expt'])
     iterate = tl_expt.WrapExecuteSequence(_wrapper_detection, df_paths.iterrows(),
-                                          nb_workers=params['nb_workers'])
+                                          nb_workers=params['nb_workers'],
+                                          initializer=init_worker_classif,
+                                          initargs=(params['path_classif'], ))
     for dict_center in iterate:
         df_stat = df_stat.append(dict_center, ignore_index=True)
         df_stat.to_csv(os.path.join(params['path_expt'], NAME_CSV_TRIPLES_TEMP))
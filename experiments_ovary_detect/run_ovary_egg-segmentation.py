@@ -75,8 +75,12 @@ INIT_MASK_BORDER = 50.
 MIN_ELLIPSE_DAIM = 25.
 # subfigure size for experting images
 MAX_FIGURE_SIZE = 14
+# draw visualisations as matplotlib figures (slow) instead of raster images
+VISUAL_MATPLOTLIB = False
 # threshold if two segmentation overlap more, keep just one of them
 SEGM_OVERLAP = 0.5
+# confidence for adaptive stopping of the RANSAC ellipse fitting
+RANSAC_STOP_PROBA = 0.99
 # paramters for SLIC segmentation
 SLIC_SIZE = 40
 SLIC_REGUL = 0.3
@@ -110,6 +114,8 @@ SEGM_PARAMS = {
     'path_multi-models': os.path.join(PATH_DATA, 'RG2SP_eggs_mixture-model.pkl'),
     'gc-pixel_regul': 3.,
     'gc-slic_regul': 2.,
+    # half size of window around each egg centre for pixel GraphCut, None for full image
+    'gc-pixel_roi': None,
     'RG2SP-shape': 5.,
     'RG2SP-pairwise': 3.,
     'RG2SP-swap': True,
@@ -196,6 +202,32 @@ def path_out_img(params, dir_name, name):
     return os.path.join(params['path_exp'], dir_name, name + '.png')
 
 
+def render_image_segm(img, segm=None, segm_obj=None, centers=None):
+    """ fast raster variant of the visualisation of image and segmentation
+
+    :param ndarray img:
+    :param ndarray segm:
+    :param ndarray segm_obj:
+    :param ndarray centers:
+    :return ndarray: np.array<height, width, 3> of uint8
+    """
+    img_visu = tl_visu.image_to_rgb8(img)
+    if img.ndim == 2:  # the same as `Greys` colormap
+        img_visu = 255 - img_visu
+    if segm is not None:
+        tl_visu.draw_boundaries(img_visu, segm, tl_visu.draw_colormap(
+            segm, plt.cm.viridis))
+    if segm_obj is not None:
+        img_obj = tl_visu.draw_colormap(segm_obj, plt.cm.viridis)
+        img_visu = (0.9 * img_visu + 0.1 * img_obj).round().astype(np.uint8)
+        tl_visu.draw_boundaries(img_visu, segm_obj, tl_visu.draw_colormap(
+            segm_obj, plt.cm.jet_r))
+    if centers is not None:
+        tl_visu.draw_points(img_visu, centers,
+                            radius=max(3, int(max(img.shape[:2]) / 150.)))
+    return img_visu
+
+
 def export_draw_image_segm(path_fig, img, segm=None, segm_obj=None, centers=None):
     """ draw and export visualisation of image and segmentation
 
@@ -205,6 +237,10 @@ def export_draw_image_segm(path_fig, img, segm=None, segm_obj=None, centers=None
     :param ndarray segm_obj:
     :param ndarray centers:
     """
+    if not VISUAL_MATPLOTLIB:
+        tl_data.save_image_png(path_fig, render_image_segm(img, segm, segm_obj,
+                                                           centers))
+        return
     size = np.array(img.shape[:2][::-1], dtype=float)
     fig, ax = plt.subplots(figsize=(size / size.max() * MAX_FIGURE_SIZE))
     ax.imshow(img, alpha=1., cmap=plt.cm.Greys)
@@ -431,7 +467,7 @@ def segment_fit_ellipse_ransac(seg, centers, fn_preproc_points, nb_inliers=0.6,
 
 def segment_fit_ellipse_ransac_segm(seg, centers, fn_preproc_points,
                                     table_p, nb_inliers=0.35,
-                                    thr_overlap=SEGM_OVERLAP):
+                                    thr_overlap=SEGM_OVERLAP, nb_workers=1):
     """ segment eggs using ellipse fitting and RANDSAC strategy on segmentation
 
     :param ndarray seg: input image / segmentation
@@ -440,6 +476,8 @@ def segment_fit_ellipse_ransac_segm(seg, centers, fn_preproc_points,
     :param [[float]] table_p: table of probabilities being foreground / background
     :param float nb_inliers: ratio of inliers for RANSAC
     :param float thr_overlap: threshold for removing overlapping segmentations
+    :param int nb_workers: number of processes fitting centres in parallel,
+        keep 1 if the images are already processed in parallel
     :return (ndarray, [[int, int]]): resulting segmentation, updated centres
     """
     slic, points_all, labels = ell_fit.get_slic_points_labels(seg, slic_size=15,
@@ -447,17 +485,20 @@ def segment_fit_ellipse_ransac_segm(seg, centers, fn_preproc_points,
     points_centers = fn_preproc_points(seg, centers)
     weights = np.bincount(slic.ravel())
 
-    centres_new, ell_params = [], []
-    segm = np.zeros_like(seg)
-    for i, points in enumerate(points_centers):
-        lb = i + 1
-        ransac_model, _ = ell_fit.ransac_segm(points,
+    ransac_fits = ell_fit.ransac_segm_centers(points_centers,
                                               ell_fit.EllipseModelSegm,
                                               points_all, weights,
                                               labels, table_p,
                                               min_samples=nb_inliers,
                                               residual_threshold=25,
-                                              max_trials=250)
+                                              max_trials=250,
+                                              stop_probability=RANSAC_STOP_PROBA,
+                                              nb_workers=nb_workers)
+
+    centres_new, ell_params = [], []
+    segm = np.zeros_like(seg)
+    for i, (ransac_model, _) in enumerate(ransac_fits):
+        lb = i + 1
         if not ransac_model:
             continue
         logging.debug('ellipse params: %r', ransac_model.params)
@@ -474,7 +515,7 @@ def segment_fit_ellipse_ransac_segm(seg, centers, fn_preproc_points,
 
 def segment_graphcut_pixels(seg, centers, labels_fg_prob, gc_regul=1.,
                             seed_size=10, coef_shape=0.,
-                            shape_mean_std=(50., 10.)):
+                            shape_mean_std=(50., 10.), roi_size=None):
     """ wrapper for segment global GraphCut optimisations
 
     :param ndarray seg: input image / segmentation
@@ -484,17 +525,18 @@ def segment_graphcut_pixels(seg, centers, labels_fg_prob, gc_regul=1.,
     :param int seed_size:
     :param float coef_shape:
     :param (float, float) shape_mean_std:
+    :param int roi_size: half size of window around each centre, None for full image
     :return (ndarray, [[int, int]]): resulting segmentation, updated centres
     """
     segm_obj = seg_rg.object_segmentation_graphcut_pixels(
         seg, centers, labels_fg_prob, gc_regul, seed_size, coef_shape,
-        shape_mean_std=shape_mean_std)
+        shape_mean_std=shape_mean_std, roi_size=roi_size)
     return segm_obj, centers, None
 
 
 def segment_graphcut_slic(slic, seg, centers, labels_fg_prob, gc_regul=1.,
                           multi_seed=True, coef_shape=0., edge_weight=1.,
-                          shape_mean_std=(50., 10.)):
+                          shape_mean_std=(50., 10.), gc_context=None):
     """ wrapper for segment global GraphCut optimisations on superpixels
 
     :param ndarray slic:
@@ -506,16 +548,37 @@ def segment_graphcut_slic(slic, seg, centers, labels_fg_prob, gc_regul=1.,
     :param float coef_shape:
     :param float edge_weight:
     :param shape_mean_std:
+    :param {} gc_context: cached superpixel graph shared among calls
     :return (ndarray, [[int, int]]): resulting segmentation, updated centres
     """
     gc_labels = seg_rg.object_segmentation_graphcut_slic(
         slic, seg, centers, labels_fg_prob, gc_regul, edge_weight,
         add_neighbours=multi_seed, coef_shape=coef_shape,
-        shape_mean_std=shape_mean_std)
+        shape_mean_std=shape_mean_std, gc_context=gc_context)
     segm_obj = np.array(gc_labels)[slic]
     return segm_obj, centers, None
 
 
+def export_rg2sp_debug(path_dir, seg, slic, dict_debug, nb_iter):
+    """ export visualisation of each region growing iteration
+
+    :param str path_dir: path to output directory
+    :param ndarray seg: segmentation
+    :param ndarray slic: superpixels
+    :param dict dict_debug: dictionary with debug history
+    :param int nb_iter: number of iterations
+    """
+    for i in range(nb_iter):
+        path_fig = os.path.join(path_dir, 'iter_%03d.png' % i)
+        if VISUAL_MATPLOTLIB:
+            fig = tl_visu.figure_rg2sp_debug_complete(seg, slic, dict_debug, i)
+            fig.savefig(path_fig)
+            plt.close(fig)
+        else:
+            tl_data.save_image_png(path_fig, tl_visu.render_rg2sp_debug_complete(
+                seg, slic, dict_debug, i))
+
+
 def segment_rg2sp_greedy(slic, seg, centers, labels_fg_prob, path_model,
                          coef_shape, coef_pairwise=5, allow_obj_swap=True,
                          prob_label_trans=(0.1, 0.03),
@@ -536,10 +599,7 @@ def segment_rg2sp_greedy(slic, seg, centers, labels_fg_prob, path_model,
 
     if dict_debug is not None:
         nb_iter = len(dict_debug['energy'])
-        for i in range(nb_iter):
-            fig = tl_visu.figure_rg2sp_debug_complete(seg, slic, dict_debug, i)
-            fig.savefig(os.path.join(debug_export, 'iter_%03d' % i))
-            plt.close(fig)
+        export_rg2sp_debug(debug_export, seg, slic, dict_debug, nb_iter)
 
     segm_obj = labels_greedy[slic]
     return segm_obj, centers, None
@@ -565,10 +625,7 @@ def segment_rg2sp_graphcut(slic, seg, centers, labels_fg_prob, path_model,
 
     if dict_debug is not None:
         nb_iter = len(dict_debug['energy'])
-        for i in range(nb_iter):
-            fig = tl_visu.figure_rg2sp_debug_complete(seg, slic, dict_debug, i)
-            fig.savefig(os.path.join(debug_export, 'iter_%03d' % i))
-            plt.close(fig)
+        export_rg2sp_debug(debug_export, seg, slic, dict_debug, nb_iter)
 
     segm_obj = labels_gc[slic]
     return segm_obj, centers, None
@@ -613,7 +670,10 @@ def create_dict_segmentation(params, slic, segm, img, centers):
                        params['label_trans'], params['RG2SP_theshold'])
     tab_proba_gc = params['tab-proba_graphcut']
     gc_regul_px = params['gc-pixel_regul']
+    gc_roi_px = params.get('gc-pixel_roi', None)
     gc_regul_slic = params['gc-slic_regul']
+    # the superpixel graph is the same for all GC_slic-* methods on an image
+    gc_slic_context = {}
     seg_simple = simplify_segm_3cls(segm) if segm is not None else None
 
     dict_segment = {
@@ -638,17 +698,23 @@ def create_dict_segmentation(params, slic, segm, img, centers):
                                   params['tab-proba_ellipse'])),
 
         'GC_pixels-small': (segment_graphcut_pixels,
-                            (segm, centers, tab_proba_gc, gc_regul_px, 10)),
+                            (segm, centers, tab_proba_gc, gc_regul_px, 10, 0.,
+                             (50., 10.), gc_roi_px)),
         'GC_pixels-large': (segment_graphcut_pixels,
-                            (segm, centers, tab_proba_gc, gc_regul_px, 30)),
+                            (segm, centers, tab_proba_gc, gc_regul_px, 30, 0.,
+                             (50., 10.), gc_roi_px)),
         'GC_pixels-shape': (segment_graphcut_pixels, (segm, centers,
-                            tab_proba_gc, gc_regul_px, 10, 0.1)),
+                            tab_proba_gc, gc_regul_px, 10, 0.1,
+                            (50., 10.), gc_roi_px)),
         'GC_slic-small': (segment_graphcut_slic, (slic, segm, centers,
-                          tab_proba_gc, gc_regul_slic, False)),
+                          tab_proba_gc, gc_regul_slic, False, 0., 1.,
+                          (50., 10.), gc_slic_context)),
         'GC_slic-large': (segment_graphcut_slic, (slic, segm, centers,
-                          tab_proba_gc, gc_regul_slic, True)),
+                          tab_proba_gc, gc_regul_slic, True, 0., 1.,
+                          (50., 10.), gc_slic_context)),
         'GC_slic-shape': (segment_graphcut_slic,
-                          (slic, segm, centers, tab_proba_gc, 1., False, 0.1)),
+                          (slic, segm, centers, tab_proba_gc, 1., False, 0.1,
+                           1., (50., 10.), gc_slic_context)),
 
         'RG2SP_greedy-single': (segment_rg2sp_greedy, params_rg_single),
         'RG2SP_greedy-mixture': (segment_rg2sp_greedy, params_rg_multi),
@@ -10,12 +10,22 @@ SAMPLE run:
     --img_type 2d_split \
     --slic_size 20 --slic_regul 0.25 --slico
 
+benchmark several superpixel sizes and regularisations, the image
+pre-processing is computed only once per image:
+>> python run_eval_superpixels.py \
+    -imgs "data_images/drosophila_ovary_slice/image/*.jpg" \
+    -segm "data_images/drosophila_ovary_slice/annot_eggs/*.png" \
+    --img_type 2d_split --nb_workers 1 \
+    --slic_size 10 20 30 --slic_regul 0.1 0.25 --slic_backend skimage
+
 Copyright (C) 2017 Jiri Borovec <jiri.borovec@fel.cvut.cz>
 """
 
 import os
 import sys
+import time
 import argparse
+import itertools
 import logging
 import multiprocessing as mproc
 from functools import partial
@@ -45,6 +55,9 @@ PATH_IMAGES = os.path.join(tl_data.update_path('data_images'),
 PATH_RESULTS = tl_data.update_path('results', absolute=True)
 NAME_CSV_DISTANCES = 'measured_boundary_distances' \
                      '_SLIC_size-%i_regul-%.2f_slico-%i.csv'
+NAME_CSV_DISTANCES_LABELS = 'measured_boundary_distances-labels' \
+                            '_SLIC_size-%i_regul-%.2f_slico-%i.csv'
+NAME_CSV_TIMING = 'superpixels_timing_SLIC_slico-%i_%s.csv'
 DEFAULT_PARAMS = {
     'path_images': os.path.join(PATH_IMAGES, 'image', '*.jpg'),
     'path_segms': os.path.join(PATH_IMAGES, 'annot_eggs', '*.png'),
@@ -71,12 +84,16 @@ def arg_parse_params(params):
     parser.add_argument('--img_type', type=str, required=False,
                         default=params['img_type'], choices=TYPES_LOAD_IMAGE,
                         help='type of image to be loaded')
-    parser.add_argument('--slic_size', type=int, required=False,
-                        default=20, help='superpixels size')
-    parser.add_argument('--slic_regul', type=float, required=False,
-                        default=0.25, help='superpixel regularization')
+    parser.add_argument('--slic_size', type=int, required=False, nargs='+',
+                        default=[20], help='superpixels size(s)')
+    parser.add_argument('--slic_regul', type=float, required=False, nargs='+',
+                        default=[0.25], help='superpixel regularization(s)')
     parser.add_argument('--slico', action='store_true', required=False,
                         default=False, help='using SLICO (ASLIC)')
+    parser.add_argument('--slic_backend', type=str, required=False,
+                        default=seg_spx.SLIC_BACKEND_DEFAULT,
+                        choices=list(seg_spx.SLIC_BACKENDS),
+                        help='implementation of SLIC superpixels')
     parser.add_argument('--nb_workers', type=int, required=False, default=NB_THREADS,
                         help='number of processes in parallel')
     params = vars(parser.parse_args())
@@ -94,31 +111,56 @@ def arg_parse_params(params):
 
 def compute_boundary_distance(idx_row, params, path_out=''):
     """ compute nearest distance between two segmentation contours
+    for all combinations of superpixel sizes and regularizations,
+    the image pre-processing for SLIC is computed only once
 
     :param (int, str) idx_row:
     :param {} params:
     :param str path_out:
-    :return (str, float):
+    :return (str, [{}], [DF]): name, distance and timing per SLIC parameters
+        and statistic per label
     """
     _, row = idx_row
     name = os.path.splitext(os.path.basename(row['path_image']))[0]
     img = load_image(row['path_image'], params['img_type'])
     segm = load_image(row['path_segm'], '2d_segm')
 
-    logging.debug('segment SLIC...')
-    slic = seg_spx.segment_slic_img2d(img,
-                                      params['slic_size'],
-                                      params['slic_regul'],
-                                      params['slico'])
-    _, dists = seg_lbs.compute_boundary_distances(segm, slic)
-
-    if os.path.isdir(path_out):
-        logging.debug('visualise results...')
-        fig = tl_visu.figure_segm_boundary_dist(segm, slic)
-        fig.savefig(os.path.join(path_out, name + '.jpg'))
-        plt.close(fig)
-
-    return name, np.mean(dists)
+    logging.debug('prepare SLIC...')
+    t_start = time.time()
+    engine = seg_spx.SlicSuperpixels(img, backend=params['slic_backend'])
+    time_prepare = time.time() - t_start
+
+    slic_params = list(itertools.product(params['slic_size'],
+                                         params['slic_regul']))
+    list_dist, list_stats = [], []
+    for slic_size, slic_regul in slic_params:
+        logging.debug('segment SLIC size=%i & regul=%f...', slic_size, slic_regul)
+        t_start = time.time()
+        slic = engine.segment(slic_size, slic_regul, params['slico'])
+        time_slic = time.time() - t_start
+
+        df_stat = pd.DataFrame(seg_lbs.compute_boundary_distance_stats(segm, slic))
+        df_stat.insert(0, 'name', name)
+        # mean over all reference boundary points
+        nb_points = df_stat['nb_ref2segm']
+        dist = np.nansum(df_stat['mean_ref2segm'] * nb_points) / float(nb_points.sum())
+        list_dist.append({'name': name, 'slic_size': slic_size,
+                          'slic_regul': slic_regul,
+                          'mean boundary distance': dist,
+                          'nb superpixels': len(np.unique(slic)),
+                          'time prepare': time_prepare,
+                          'time SLIC': time_slic})
+        list_stats.append(df_stat)
+
+        if os.path.isdir(path_out):
+            logging.debug('visualise results...')
+            suffix = '_SLIC_size-%i_regul-%.2f' % (slic_size, slic_regul) \
+                if len(slic_params) > 1 else ''
+            fig = tl_visu.figure_segm_boundary_dist(segm, slic)
+            fig.savefig(os.path.join(path_out, name + suffix + '.jpg'))
+            plt.close(fig)
+
+    return name, list_dist, list_stats
 
 
 def main(params):
@@ -133,25 +175,47 @@ def main(params):
     df_paths = tl_data.find_files_match_names_across_dirs(list_paths)
     df_paths.columns = ['path_image', 'path_segm']
 
-    df_dist = pd.DataFrame()
+    list_dist, list_stats = [], []
 
     _wrapper_eval = partial(compute_boundary_distance, params=params,
                             path_out=params['path_out'])
     iterate = tl_expt.WrapExecuteSequence(_wrapper_eval, df_paths.iterrows(),
                                           nb_workers=params['nb_workers'],
                                           desc='evaluate SLIC')
-    for name, dist in iterate:
-        df_dist = df_dist.append({'name': name, 'mean boundary distance': dist},
-                                 ignore_index=True)
-    df_dist.set_index('name', inplace=True)
-
+    for name, dists, df_stats in iterate:
+        list_dist += dists
+        list_stats += df_stats
+    df_dist = pd.DataFrame(list_dist)
+    if df_dist.empty:
+        logging.warning('no images to be evaluated')
+        return
+
+    # the statistics are aligned with rows of the distance table
+    df_groups = df_dist.groupby(['slic_size', 'slic_regul'])
+    for (slic_size, slic_regul), df_param in df_groups:
+        # tidy table - a row per image and label
+        df_labels = pd.concat([list_stats[i] for i in df_param.index],
+                              ignore_index=True)
+        df_param = df_param.drop(columns=['slic_size', 'slic_regul'])
+        df_param.set_index('name', inplace=True)
+
+        if os.path.isdir(params['path_out']):
+            slic_params = (slic_size, slic_regul, params['slico'])
+            df_param.to_csv(os.path.join(params['path_out'],
+                                         NAME_CSV_DISTANCES % slic_params))
+            df_labels.to_csv(os.path.join(params['path_out'],
+                                          NAME_CSV_DISTANCES_LABELS % slic_params))
+        logging.info('STATISTIC for SLIC size=%i & regul=%.2f:',
+                     slic_size, slic_regul)
+        logging.info(df_param.describe())
+
+    # benchmark - mean time and distance per SLIC parameters
+    df_timing = df_dist.drop(columns=['name']).groupby(
+        ['slic_size', 'slic_regul']).mean()
     if os.path.isdir(params['path_out']):
-        csv_name = NAME_CSV_DISTANCES % (params['slic_size'],
-                                         params['slic_regul'],
-                                         params['slico'])
-        df_dist.to_csv(os.path.join(params['path_out'], csv_name))
-    logging.info('STATISTIC:')
-    logging.info(df_dist.describe())
+        name_csv = NAME_CSV_TIMING % (params['slico'], params['slic_backend'])
+        df_timing.to_csv(os.path.join(params['path_out'], name_csv))
+    logging.info('TIMING (%s):\n%r', params['slic_backend'], df_timing)
 
 
 if __name__ == '__main__':
@@ -40,7 +40,6 @@ if os.environ.get('DISPLAY', '') == '':
     print('No display found. Using non-interactive Agg backend.')
     matplotlib.use('Agg')
 
-from PIL import Image
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -61,7 +60,8 @@ import imsegm.superpixels as seg_spx
 import imsegm.graph_cuts as seg_gc
 from run_segm_slic_model_graphcut import (arg_parse_params, load_image,
                                           parse_imgs_idx_path, get_idx_name,
-                                          write_skip_file)
+                                          get_exporter, write_skip_file,
+                                          export_segm_graphcut_debug)
 
 NAME_EXPERIMENT = 'experiment_segm-Supervised'
 NB_THREADS = max(1, int(mproc.cpu_count() * 0.9))
@@ -106,6 +106,8 @@ CROSS_VAL_LEAVE_OUT_SEARCH = 0.2
 CROSS_VAL_LEAVE_OUT_EVAL = 0.1
 # run prediction on training data, should be overfiting
 RUN_TRAIN_PREDICT = False
+# number of images per worker with features kept in memory at once in prediction
+PREDICT_CHUNK_PER_WORKER = 4
 
 
 FEATURES_SET_COLOR = {'color': ('mean', 'std', 'energy')}
@@ -301,13 +303,43 @@ def save_dump_data(path_dump_data, imgs, annot, slics, features, labels,
                         feature_names=feature_names)
 
 
-def export_draw_image_segm_contour(img, segm, path_out, name, suffix=''):
+def export_draw_image_segm_contour(img, segm, path_out, name, suffix='',
+                                   exporter=None, use_matplotlib=False):
     logging.debug('export draw image segmentation countours: %s', name)
+    path_fig = os.path.join(path_out, name + suffix + '.png')
+    if not use_matplotlib:
+        if exporter is None:
+            tl_data.save_image_png(
+                path_fig, tl_visu.render_image_segm_results(img, segm))
+        else:
+            exporter.save_render_png(path_fig, tl_visu.render_image_segm_results,
+                                     img, segm)
+        return
     fig = tl_visu.figure_image_segm_results(img, segm)
-    fig.savefig(os.path.join(path_out, name + suffix + '.png'))
+    if exporter is None:
+        fig.savefig(path_fig)
+    else:
+        exporter.save_image_png(path_fig, tl_visu.figure_to_image(fig))
     plt.close(fig)
 
 
+def load_image_compute_features(imgs_idx_path, params):
+    """ load image and compute superpixels and their features
+
+    :param (int, str) imgs_idx_path:
+    :param {str: ...} params: segmentation parameters
+    :return (str, ndarray, ndarray, ndarray):
+    """
+    idx, path_img = parse_imgs_idx_path(imgs_idx_path)
+    logging.debug('segmenting image: "%s"', path_img)
+    idx_name = get_idx_name(idx, path_img)
+    img = load_image(path_img, params['img_type'])
+    slic, features = seg_pipe.compute_color2d_superpixels_features(
+        img, dict_features=params['features'], sp_size=params['slic_size'],
+        sp_regul=params['slic_regul'])
+    return idx_name, img, slic, features
+
+
 def segment_image(imgs_idx_path, params, classif, path_out, path_visu=None,
                   show_debug_imgs=SHOW_DEBUG_IMAGES):
     """ perform image segmentation on input image with given paramters
@@ -321,12 +353,29 @@ def segment_image(imgs_idx_path, params, classif, path_out, path_visu=None,
     :param bool show_debug_imgs: whether show debug images
     :return (str, ndarray, ndarray):
     """
-    idx, path_img = parse_imgs_idx_path(imgs_idx_path)
-    logging.debug('segmenting image: "%s"', path_img)
-    idx_name = get_idx_name(idx, path_img)
-    img = load_image(path_img, params['img_type'])
+    idx_name, img, slic, features = load_image_compute_features(imgs_idx_path,
+                                                                params)
+    proba = classif.predict_proba(features)
+    return segment_image_proba((idx_name, img, slic, features, proba), params,
+                               getattr(classif, 'classes_', None),
+                               path_out, path_visu, show_debug_imgs)
 
-    debug_visual = dict() if show_debug_imgs else None
+
+def segment_image_proba(name_img_slic_fts_proba, params, classes, path_out,
+                        path_visu=None, show_debug_imgs=SHOW_DEBUG_IMAGES):
+    """ perform graphCut segmentation on already predicted probabilities
+    of superpixels, and save results
+
+    :param (str, ndarray, ndarray, ndarray, ndarray) name_img_slic_fts_proba:
+    :param {str: ...} params: segmentation parameters
+    :param ndarray classes: classes of the trained classifier
+    :param str path_out: path for output
+    :param str path_visu: the existing patch means export also visualisation
+    :param bool show_debug_imgs: whether show debug images
+    :return (str, ndarray, ndarray):
+    """
+    idx_name, img, slic, features, proba = name_img_slic_fts_proba
+    debug_visual = tl_visu.LazyDebugVisual() if show_debug_imgs else None
 
     gc_regul = params['gc_regul']
     if params['gc_use_trans']:
@@ -334,39 +383,38 @@ def segment_image(imgs_idx_path, params, classif, path_out, path_visu=None,
             params['label_transitions'])
         gc_regul = (gc_regul * label_penalty)
 
-    segm_gc, segm_soft = seg_pipe.segment_color2d_slic_features_model_graphcut(
-        img, classif, sp_size=params['slic_size'], sp_regul=params['slic_regul'],
-        dict_features=params['features'], gc_regul=gc_regul,
-        gc_edge_type=params['gc_edge_type'],
+    segm_gc, segm_soft = seg_pipe.segment_color2d_slic_proba_graphcut(
+        img, slic, features, proba, gc_regul=gc_regul,
+        gc_edge_type=params['gc_edge_type'], classes=classes,
         debug_visual=debug_visual)
     segm_map = np.argmax(segm_soft, axis=-1)
+    exporter = get_exporter(params)
 
     for segm, suffix in [(segm_gc, ''), (segm_map, '_MAP')]:
         path_img = os.path.join(path_out, idx_name + suffix + '.png')
         logging.debug('export segmentation: %s', path_img)
         if np.max(segm) <= 1:
-            img_seg = Image.fromarray((segm * 255).astype(np.uint8))
+            img_seg = (segm * 255).astype(np.uint8)
         else:
-            img_seg = Image.fromarray(segm.astype(np.uint8))
-        img_seg.convert('L').save(path_img)
+            img_seg = segm.astype(np.uint8)
+        exporter.save_image_png(path_img, img_seg)
         # io.imsave(path_img, segm_gc)
 
     path_npz = os.path.join(path_out, idx_name + '.npz')
-    np.savez_compressed(path_npz, segm_soft)
+    exporter.save_segm_soft(path_npz, segm_soft)
 
     # plt.imsave(os.path.join(path_out, idx_name + '_rgb.png'), seg_pipe)
     if params.get('visual', False) and path_visu is not None \
             and os.path.isdir(path_visu):
+        use_mpl = params.get('visual_matplotlib', False)
         export_draw_image_segm_contour(img, segm_gc, path_visu,
-                                       idx_name, '_GC')
+                                       idx_name, '_GC', exporter, use_mpl)
         export_draw_image_segm_contour(img, segm_map, path_visu,
-                                       idx_name, '_MAP')
+                                       idx_name, '_MAP', exporter, use_mpl)
         if show_debug_imgs and debug_visual is not None:
             path_fig = os.path.join(path_visu, str(idx_name) + '_debug.png')
             logging.debug('exporting (debug) visualization: %s', path_fig)
-            fig = tl_visu.figure_segm_graphcut_debug(debug_visual)
-            fig.savefig(path_fig, bbox_inches='tight', pad_inches=0.1)
-            plt.close(fig)
+            export_segm_graphcut_debug(path_fig, debug_visual, exporter, use_mpl)
     gc.collect()
     time.sleep(1)
     return idx_name, segm_map, segm_gc
@@ -571,12 +619,16 @@ def load_train_classifier(params, features, labels, feature_names, sizes,
             nb_workers=params['nb_workers'], path_out=params['path_exp'])
     params['path_classif'] = path_classif
     cv = seg_clf.CrossValidateGroups(sizes, nb_hold_out=nb_holdout)
+    # the folds are trained once and shared by both evaluations
+    fold_cache = {}
     seg_clf.eval_classif_cross_val_scores(params['classif'], classif,
                                           features, labels, cross_val=cv,
-                                          path_out=params['path_exp'])
+                                          path_out=params['path_exp'],
+                                          fold_cache=fold_cache)
     seg_clf.eval_classif_cross_val_roc(params['classif'], classif,
                                        features, labels, cross_val=cv,
-                                       path_out=params['path_exp'])
+                                       path_out=params['path_exp'],
+                                       fold_cache=fold_cache)
     return params, classif, path_classif
 
 
@@ -750,17 +802,78 @@ def prepare_output_dir(path_pattern_imgs, path_out, name, visual=True):
     return path_out, path_visu
 
 
-def try_segment_image(img_idx_path, params, classif, path_out, path_visu,
-                      show_debug_imgs=SHOW_DEBUG_IMAGES):
+def try_load_image_compute_features(img_idx_path, params):
     try:
-        return segment_image(img_idx_path, params, classif,
-                             path_out, path_visu,
-                             show_debug_imgs=show_debug_imgs)
+        return load_image_compute_features(img_idx_path, params)
     except Exception:
-        logging.exception('segment_image')
+        logging.exception('load_image_compute_features')
+        return None
+
+
+def try_segment_image_proba(name_img_slic_fts_proba, params, classes,
+                            path_out, path_visu,
+                            show_debug_imgs=SHOW_DEBUG_IMAGES):
+    try:
+        return segment_image_proba(name_img_slic_fts_proba, params, classes,
+                                   path_out, path_visu,
+                                   show_debug_imgs=show_debug_imgs)
+    except Exception:
+        logging.exception('segment_image_proba')
         return '', None, None
 
 
+def segment_images_batch_predict(list_img_path, params, classif, path_out,
+                                 path_visu, show_debug_imgs=SHOW_DEBUG_IMAGES):
+    """ segment images in batches - compute features in parallel, predict
+    probabilities for all images in a batch by single classifier call
+    and perform graphCut in parallel; batch size is limited by memory budget
+    `params['predict_batch_memory_mb']`
+
+    The images are processed in chunks (`PREDICT_CHUNK_PER_WORKER` images
+    per worker), so just features of a single chunk are held in memory,
+    and all stages share the same pool of workers.
+
+    :param [(int, str)] list_img_path: list of pairs with index and image path
+    :param {str: ...} params: segmentation parameters
+    :param obj classif: trained classifier
+    :param str path_out: path for output
+    :param str path_visu: the existing patch means export also visualisation
+    :param bool show_debug_imgs: whether show debug images
+    """
+    memory_mb = params.get('predict_batch_memory_mb',
+                           seg_pipe.BATCH_PREDICT_MEMORY_MB)
+    classes = getattr(classif, 'classes_', None)
+    _wrapper_features = partial(try_load_image_compute_features, params=params)
+    _wrapper_segment = partial(try_segment_image_proba, params=params,
+                               classes=classes, path_out=path_out,
+                               path_visu=path_visu,
+                               show_debug_imgs=show_debug_imgs)
+    nb_workers = params['nb_workers']
+    chunk_size = max(1, nb_workers) * PREDICT_CHUNK_PER_WORKER
+    pool = mproc.Pool(nb_workers) if nb_workers > 1 else None
+    for i in range(0, len(list_img_path), chunk_size):
+        chunk = list_img_path[i:i + chunk_size]
+        iterate = tl_expt.WrapExecuteSequence(
+            _wrapper_features, chunk, nb_workers=nb_workers, pool=pool,
+            desc='computing features of %i images' % len(chunk))
+        list_features = [r for r in iterate if r is not None]
+        for batch in seg_pipe.iterate_batches_memory(list_features, memory_mb):
+            list_proba = seg_pipe.predict_proba_batch(classif,
+                                                      [b[3] for b in batch])
+            batch = [b + (proba,) for b, proba in zip(batch, list_proba)]
+            iterate_segm = tl_expt.WrapExecuteSequence(
+                _wrapper_segment, batch, nb_workers=nb_workers, pool=pool,
+                desc='segmenting batch of %i images' % len(batch))
+            for _ in iterate_segm:
+                gc.collect()
+        del list_features
+    if pool is not None:
+        pool.close()
+        pool.join()
+    # the workers flush own exports on exit, this one is for a single process
+    get_exporter(params).flush()
+
+
 def main_predict(path_classif, path_pattern_imgs, path_out, name='SEGMENT___',
                  params_local=None):
     """ given trained classifier segment new images
@@ -792,16 +905,9 @@ def main_predict(path_classif, path_pattern_imgs, path_out, name='SEGMENT___',
 
     logging.debug('run prediction...')
     show_debug_imgs = params.get('visual', False)
-    _wrapper_segment = partial(try_segment_image, params=params, classif=classif,
-                               path_out=path_out, path_visu=path_visu,
-                               show_debug_imgs=show_debug_imgs)
     list_img_path = list(zip([None] * len(paths_img), paths_img))
-    iterate = tl_expt.WrapExecuteSequence(_wrapper_segment, list_img_path,
-                                          nb_workers=params['nb_workers'],
-                                          desc='segmenting images')
-    for _ in iterate:
-        gc.collect()
-        time.sleep(1)
+    segment_images_batch_predict(list_img_path, params, classif, path_out,
+                                 path_visu, show_debug_imgs=show_debug_imgs)
 
     logging.info('prediction DONE')
 
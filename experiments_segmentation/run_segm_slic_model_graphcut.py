@@ -36,7 +36,6 @@ if os.environ.get('DISPLAY', '') == '':
     matplotlib.use('Agg')
 
 import yaml
-from PIL import Image
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -97,6 +96,8 @@ SEGM_PARAMS = {
     # 'spacing': (12, 1, 1),
     'features': FEATURES_SET_COLOR,
     'estim_model': 'GMM',
+    # OPTIONS: None, 'online', 'reservoir' - for large groups of images
+    'estim_stream': None,
     'pca_coef': None,
     'gc_regul': 2.0,
     'gc_edge_type': 'model',
@@ -263,8 +264,41 @@ def get_idx_name(idx, path_img):
         return im_name
 
 
+def get_exporter(params):
+    """ get the background export service of the current process
+
+    :param {str: ...} params: segmentation parameters
+    :return ImageExportService:
+    """
+    return tl_data.get_export_service(
+        compress_level=params.get('export_compress_level',
+                                  tl_data.EXPORT_PNG_COMPRESS_LEVEL),
+        soft_dtype=params.get('export_soft_dtype', tl_data.EXPORT_SOFT_DTYPE))
+
+
+def export_segm_graphcut_debug(path_fig, debug_visual, exporter,
+                               use_matplotlib=False):
+    """ export debug visualisation of the graphCut segmentation
+
+    :param str path_fig: path to the output image
+    :param debug_visual: dictionary with debug images
+    :param ImageExportService exporter: background export service
+    :param bool use_matplotlib: draw the slow matplotlib figure with titles
+    """
+    if not use_matplotlib:
+        # the lazy debug images are rendered in the export thread
+        exporter.save_render_png(path_fig, tl_visu.render_segm_graphcut_debug,
+                                 debug_visual)
+        return
+    fig = tl_visu.figure_segm_graphcut_debug(debug_visual)
+    exporter.save_image_png(path_fig, tl_visu.figure_to_image(
+        fig, crop_tight=True, pad_inches=0.1))
+    plt.close(fig)
+
+
 def export_visual(idx_name, img, segm, debug_visual=None,
-                  path_out=None, path_visu=None):
+                  path_out=None, path_visu=None, exporter=None,
+                  use_matplotlib=False):
     """ export visualisations
 
     :param str idx_name:
@@ -273,31 +307,38 @@ def export_visual(idx_name, img, segm, debug_visual=None,
     :param debug_visual: dictionary with debug images
     :param str path_out: path to dir with segmentation
     :param str path_visu: path to dir with debug images
+    :param ImageExportService exporter: background export service,
+        None means the shared one of the current process
+    :param bool use_matplotlib: draw the slow matplotlib figures with titles
     """
     logging.info('export results and visualization...')
+    if exporter is None:
+        exporter = tl_data.get_export_service()
     if set(np.unique(segm)) <= {0, 1}:
         segm *= 255
 
     path_img = os.path.join(path_out, str(idx_name) + '.png')
     logging.debug('exporting segmentation: %s', path_img)
-    im_seg = Image.fromarray(segm.astype(np.uint8))
-    im_seg.convert('L').save(path_img)
+    exporter.save_image_png(path_img, segm.astype(np.uint8))
     # io.imsave(path_img, segm)
 
     if path_visu is not None and os.path.isdir(path_visu):
         path_fig = os.path.join(path_visu, str(idx_name) + '.png')
         logging.debug('exporting segmentation results: %s', path_fig)
-        fig = tl_visu.figure_image_segm_results(img, segm)
-        fig.savefig(path_fig)
-        plt.close(fig)
+        if use_matplotlib:
+            fig = tl_visu.figure_image_segm_results(img, segm)
+            exporter.save_image_png(path_fig, tl_visu.figure_to_image(fig))
+            plt.close(fig)
+        else:
+            exporter.save_render_png(path_fig, tl_visu.render_image_segm_results,
+                                     img, segm)
 
     if path_visu is not None and os.path.isdir(path_visu) \
             and debug_visual is not None:
         path_fig = os.path.join(path_visu, str(idx_name) + '_debug.png')
         logging.debug('exporting (debug) visualization: %s', path_fig)
-        fig = tl_visu.figure_segm_graphcut_debug(debug_visual)
-        fig.savefig(path_fig, bbox_inches='tight', pad_inches=0.1)
-        plt.close(fig)
+        export_segm_graphcut_debug(path_fig, debug_visual, exporter,
+                                   use_matplotlib)
 
 
 def segment_image_independent(img_idx_path, params, path_out, path_visu=None,
@@ -315,10 +356,11 @@ def segment_image_independent(img_idx_path, params, path_out, path_visu=None,
     idx_name = get_idx_name(idx, path_img)
     img = load_image(path_img, params['img_type'])
 
+    exporter = get_exporter(params)
     path_img = os.path.join(params['path_exp'], FOLDER_IMAGE, idx_name + '.png')
-    tl_data.io_imsave(path_img, img.astype(np.uint8))
+    exporter.save_image_png(path_img, img.astype(np.uint8))
 
-    debug_visual = dict() if show_debug_imgs else None
+    debug_visual = tl_visu.LazyDebugVisual() if show_debug_imgs else None
     try:
         segm, segm_soft = seg_pipe.pipe_color2d_slic_features_model_graphcut(
             img, nb_classes=params['nb_classes'],
@@ -328,7 +370,7 @@ def segment_image_independent(img_idx_path, params, path_out, path_visu=None,
             gc_edge_type=params['gc_edge_type'],
             debug_visual=debug_visual)
         path_npz = os.path.join(path_out, idx_name + '.npz')
-        np.savez_compressed(path_npz, segm_soft)
+        exporter.save_segm_soft(path_npz, segm_soft)
     except Exception:
         logging.exception('pipe_color2d_slic_features_model_graphcut(...)')
         segm = np.zeros(img.shape[:2])
@@ -337,7 +379,8 @@ def segment_image_independent(img_idx_path, params, path_out, path_visu=None,
     segm = seg_lbs.assume_bg_on_boundary(segm, bg_label=0,
                                          boundary_size=boundary_size)
 
-    export_visual(idx_name, img, segm, debug_visual, path_out, path_visu)
+    export_visual(idx_name, img, segm, debug_visual, path_out, path_visu,
+                  exporter, params.get('visual_matplotlib', False))
 
     # gc.collect(), time.sleep(1)
     return idx_name, segm
@@ -362,10 +405,11 @@ def segment_image_model(imgs_idx_path, params, model, path_out=None,
     idx_name = get_idx_name(idx, path_img)
     img = load_image(path_img, params['img_type'])
 
+    exporter = get_exporter(params)
     path_img = os.path.join(params['path_exp'], FOLDER_IMAGE, idx_name + '.png')
-    tl_data.io_imsave(path_img, img.astype(np.uint8))
+    exporter.save_image_png(path_img, img.astype(np.uint8))
 
-    debug_visual = dict() if show_debug_imgs else None
+    debug_visual = tl_visu.LazyDebugVisual() if show_debug_imgs else None
 
     try:
         segm, segm_soft = seg_pipe.segment_color2d_slic_features_model_graphcut(
@@ -374,7 +418,7 @@ def segment_image_model(imgs_idx_path, params, model, path_out=None,
             gc_edge_type=params['gc_edge_type'],
             debug_visual=debug_visual)
         path_npz = os.path.join(path_out, idx_name + '.npz')
-        np.savez_compressed(path_npz, segm_soft)
+        exporter.save_segm_soft(path_npz, segm_soft)
     except Exception:
         logging.exception('segment_color2d_slic_features_model_graphcut(...)')
         segm = np.zeros(img.shape[:2])
@@ -383,7 +427,8 @@ def segment_image_model(imgs_idx_path, params, model, path_out=None,
     segm = seg_lbs.assume_bg_on_boundary(segm, bg_label=0,
                                          boundary_size=boundary_size)
 
-    export_visual(idx_name, img, segm, debug_visual, path_out, path_visu)
+    export_visual(idx_name, img, segm, debug_visual, path_out, path_visu,
+                  exporter, params.get('visual_matplotlib', False))
 
     # gc.collect(), time.sleep(1)
     return idx_name, segm
@@ -432,9 +477,10 @@ def experiment_single_gmm(params, paths_img, path_out, path_visu,
 
 def experiment_group_gmm(params, paths_img, path_out, path_visu,
                          show_debug_imgs=SHOW_DEBUG_IMAGES):
-    logging.info('load all images')
-    list_images = [load_image(path_img, params['img_type'])
-                   for path_img in paths_img]
+    # the images are loaded ahead while the features of previous are computed
+    loader = tl_data.ImagePrefetchLoader(
+        paths_img, load_func=partial(load_image, img_type=params['img_type']),
+        nb_workers=params['nb_workers'], with_names=False)
     imgs_idx_path = list(zip([None] * len(paths_img), paths_img))
     logging.info('Estimate image segmentation from whole sequence of images')
     params['path_model'] = os.path.join(params['path_exp'], NAME_DUMP_MODEL)
@@ -442,10 +488,15 @@ def experiment_group_gmm(params, paths_img, path_out, path_visu,
         model, _, _ = load_model(params['path_model'])
     else:
         model, _ = seg_pipe.estim_model_classes_group(
-            list_images, nb_classes=params['nb_classes'],
+            loader, nb_classes=params['nb_classes'],
             dict_features=params['features'], sp_size=params['slic_size'],
             sp_regul=params['slic_regul'], pca_coef=params['pca_coef'],
-            model_type=params['estim_model'])
+            model_type=params['estim_model'],
+            stream=params.get('estim_stream', None),
+            nb_samples=params.get('estim_stream_samples',
+                                  seg_pipe.STREAM_NB_SAMPLES),
+            nb_workers=params['nb_workers'])
+        logging.info('loading images took: %r', loader.timing)
         save_model(params['path_model'], model)
 
     logging.info('Perform image segmentation from group model')
@@ -541,6 +592,8 @@ def main(params):
         df_ars.to_csv(_path_expt(NAME_CSV_ARS_CORES))
         logging.info(df_ars.describe())
 
+    # the workers flush own exports on exit, this one is for a single process
+    get_exporter(params).flush()
     return params
 
 
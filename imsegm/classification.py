@@ -21,7 +21,7 @@ import pandas as pd
 from scipy import interp
 from scipy.stats import randint as sp_randint
 from scipy.stats import uniform as sp_random
-from sklearn.base import clone
+from sklearn.base import clone, BaseEstimator, ClassifierMixin
 from sklearn import preprocessing, feature_selection, decomposition
 from sklearn import cluster, metrics
 from sklearn import ensemble, neighbors, svm, tree
@@ -31,12 +31,26 @@ try:  # due to some chnages in between versions
     from sklearn.grid_search import GridSearchCV, RandomizedSearchCV
 except Exception:
     from sklearn.model_selection import GridSearchCV, RandomizedSearchCV
+try:
+    import joblib
+except ImportError:  # older sklearn has bundled joblib
+    from sklearn.externals import joblib
+try:  # successive halving is available since sklearn 0.24
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV
+except ImportError:
+    HalvingRandomSearchCV = None
 
 from imsegm.labeling import relabel_max_overlap_unique
 from imsegm.utilities.experiments import WrapExecuteSequence
 
 # NAME_FILE_RESULTS = 'results.csv'
 TEMPLATE_NAME_CLF = 'classifier_{}.pkl'
+TEMPLATE_NAME_CLF_MODEL = 'classifier_{}_model.joblib'
+#: version of the exported classifier artefact, legacy pickles have none
+CLASSIF_ARTEFACT_VERSION = 2
+#: number of samples traversing the flat trees at once (bounds the memory)
+FLAT_TREES_BATCH_SIZE = 4096
 DEFAULT_CLASSIF_NAME = 'RandForest'
 DEFAULT_CLUSTERING = 'kMeans'
 # DEFAULT_MIN_NB_SPL = 25
@@ -50,7 +64,11 @@ METRIC_AVERAGES = ('macro', 'weighted')
 METRIC_SCORING = ('f1_macro', 'accuracy', 'precision_macro', 'recall_macro')
 # rounding unique features, in case to detail precision
 ROUND_UNIQUE_FTS_DIGITS = 3
+# min batch size for MiniBatchKMeans used for down-sampling features
+KMEANS_MIN_BATCH_SIZE = 1024
 NB_THREADS_SERACH = min(1, mproc.cpu_count() * 0.5)
+# in each halving step keep 1 / factor candidates with factor more samples
+HALVING_SEARCH_FACTOR = 3
 
 
 DICT_SCORING = {
@@ -536,17 +554,165 @@ def feature_scoring_selection(features, labels, names=None, path_out=''):
     return indices, df_scoring
 
 
+class FlatTreeEnsembleClassifier(BaseEstimator, ClassifierMixin):
+    """ read-only prediction of a fitted decision tree or random forest
+    from flat node arrays concatenated over all trees
+
+    The sklearn `Tree` copies its nodes into private heap memory when it is
+    unpickled, so a memory-mapped forest would still be duplicated in each
+    process; these plain arrays stay memory-mapped by `joblib.load`.
+    The wrapped (unfitted) tree classifier keeps the parameters, so the flat
+    model can be cloned and refitted as any other sklearn classifier.
+
+    >>> np.random.seed(0)
+    >>> fts = np.random.random((100, 3))
+    >>> lbs = (fts[:, 0] > 0.5).astype(int) + (fts[:, 1] > 0.5)
+    >>> forest = ensemble.RandomForestClassifier(n_estimators=5, random_state=0)
+    >>> flat = FlatTreeEnsembleClassifier(forest).fit(fts, lbs)
+    >>> flat.classes_
+    array([0, 1, 2])
+    >>> forest = forest.fit(fts, lbs)
+    >>> np.allclose(flat.predict_proba(fts), forest.predict_proba(fts))
+    True
+    >>> np.array_equal(flat.predict(fts), forest.predict(fts))
+    True
+    >>> clone(flat)  # doctest: +ELLIPSIS
+    FlatTreeEnsembleClassifier(estimator=RandomForestClassifier(...))
+    """
+
+    def __init__(self, estimator):
+        """ initialise the flat model
+
+        :param estimator: DecisionTreeClassifier or forest of them
+        """
+        self.estimator = estimator
+
+    def fit(self, features, labels, **fit_params):
+        """ fit the wrapped tree classifier and flatten it
+
+        :param ndarray features: np.array<nb_samples, nb_features>
+        :param ndarray labels: np.array<nb_samples>
+        :return FlatTreeEnsembleClassifier:
+        """
+        classif = clone(self.estimator).fit(features, labels, **fit_params)
+        return self.set_fitted(classif)
+
+    def set_fitted(self, classif):
+        """ flatten already fitted tree classifier
+
+        :param classif: fitted DecisionTreeClassifier or forest of them
+        :return FlatTreeEnsembleClassifier:
+        """
+        trees = getattr(classif, 'estimators_', [classif])
+        self.classes_ = np.asarray(classif.classes_)
+        self.n_features_in_ = trees[0].tree_.n_features
+        lists = {k: [] for k in ('left', 'right', 'feature', 'threshold', 'value')}
+        roots, offset = [], 0
+        for tree_ in (t.tree_ for t in trees):
+            assert tree_.n_outputs == 1, 'only single output trees are supported'
+            roots.append(offset)
+            for name, vals in (('left', tree_.children_left),
+                               ('right', tree_.children_right)):
+                lists[name].append(np.where(vals < 0, -1, vals + offset))
+            lists['feature'].append(tree_.feature)
+            lists['threshold'].append(tree_.threshold)
+            # normalised class probabilities in each node
+            value = tree_.value[:, 0, :].astype(float)
+            norm = value.sum(axis=1, keepdims=True)
+            lists['value'].append(value / np.where(norm == 0, 1, norm))
+            offset += tree_.node_count
+        self.roots_ = np.array(roots, dtype=np.intp)
+        self.children_left_ = np.hstack(lists['left']).astype(np.intp)
+        self.children_right_ = np.hstack(lists['right']).astype(np.intp)
+        self.feature_ = np.hstack(lists['feature']).astype(np.intp)
+        self.threshold_ = np.hstack(lists['threshold'])
+        self.value_ = np.vstack(lists['value'])
+        return self
+
+    def predict_proba(self, features):
+        """ average the leaf class probabilities over all trees
+
+        :param ndarray features: np.array<nb_samples, nb_features>
+        :return ndarray: np.array<nb_samples, nb_classes>
+        """
+        # sklearn compares the features in single precision
+        features = np.asarray(features, dtype=np.float32)
+        nb_fts = features.shape[1]
+        proba = np.empty((len(features), len(self.classes_)))
+        for i in range(0, len(features), FLAT_TREES_BATCH_SIZE):
+            fts = features[i:i + FLAT_TREES_BATCH_SIZE]
+            leaves = np.tile(self.roots_, len(fts))
+            # descend with the (sample, tree) pairs which did not reach a leaf
+            pos = np.flatnonzero(self.children_left_[leaves] >= 0)
+            nodes = leaves[pos]
+            offsets = pos // len(self.roots_) * nb_fts
+            fts_flat = fts.ravel()
+            while len(nodes):
+                go_left = fts_flat[offsets + self.feature_[nodes]] <= self.threshold_[nodes]
+                nodes = np.where(go_left, self.children_left_[nodes],
+                                 self.children_right_[nodes])
+                done = self.children_left_[nodes] < 0
+                leaves[pos[done]] = nodes[done]
+                nodes, pos, offsets = nodes[~done], pos[~done], offsets[~done]
+            proba[i:i + len(fts)] = self.value_[leaves.reshape(len(fts), -1)].mean(axis=1)
+        return proba
+
+    def predict(self, features):
+        """ predict the most probable class
+
+        :param ndarray features: np.array<nb_samples, nb_features>
+        :return ndarray: np.array<nb_samples>
+        """
+        return self.classes_[np.argmax(self.predict_proba(features), axis=1)]
+
+
+def flatten_tree_classifier(classif):
+    """ replace fitted tree classifiers (also the final step of a pipeline)
+    by their flat variant, other classifiers are returned as they are
+
+    :param classif: sklearn classifier or pipeline
+    :return: classifier which can be memory-mapped
+
+    >>> clf = create_classifiers()['RandForest']
+    >>> flatten_tree_classifier(clf) is clf
+    True
+    >>> clf = clf.fit(np.random.random((20, 2)), [0, 1] * 10)
+    >>> type(flatten_tree_classifier(clf)).__name__
+    'FlatTreeEnsembleClassifier'
+    """
+    if isinstance(classif, pipeline.Pipeline):
+        name, clf = classif.steps[-1]
+        clf_flat = flatten_tree_classifier(clf)
+        if clf_flat is clf:
+            return classif
+        return pipeline.Pipeline(classif.steps[:-1] + [(name, clf_flat)])
+    is_forest = isinstance(classif, (ensemble.RandomForestClassifier,
+                                     ensemble.ExtraTreesClassifier)) \
+        and hasattr(classif, 'estimators_')
+    is_tree = isinstance(classif, tree.DecisionTreeClassifier) or is_forest
+    if not is_tree or not hasattr(classif, 'classes_') \
+            or np.ndim(classif.classes_) != 1:
+        return classif
+    return FlatTreeEnsembleClassifier(clone(classif)).set_fitted(classif)
+
+
 def save_classifier(path_out, classif, clf_name, params, feature_names=None,
                     label_names=None):
     """ estimate classif for all data and export it
 
+    The artefact is split into two files - a small pickle with metadata
+    (parameters, feature and label names) and an uncompressed joblib dump
+    of the classifier, so its numpy buffers can be memory-mapped on load.
+    Fitted tree classifiers are exported as :class:`FlatTreeEnsembleClassifier`
+    since the sklearn trees would copy the memory-mapped nodes.
+
     :param str path_out: path for exporting trained classofier
     :param classif: sklearn classif.
     :param str clf_name: name of selected classifier
     :param [str] feature_names: list of string names
     :param {} params: extra parameters
     :param [str] label_names: list of string names of label_names
-    :return str:
+    :return str: path to the metadata file
 
     >>> clf = create_classifiers()['RandForest']
     >>> p_clf = save_classifier('.', clf, 'TESTINNG', {})
@@ -554,34 +720,52 @@ def save_classifier(path_out, classif, clf_name, params, feature_names=None,
     './classifier_TESTINNG.pkl'
     >>> d_clf = load_classifier(p_clf)
     >>> sorted(d_clf.keys())
-    ['clf_pipeline', 'features', 'label_names', 'name', 'params']
+    ['clf_model', 'clf_pipeline', 'features', 'label_names', 'name', 'params', 'version']
     >>> d_clf['clf_pipeline']  # doctest: +ELLIPSIS
     RandomForestClassifier(...)
     >>> d_clf['name']
     'TESTINNG'
+    >>> d_clf = load_classifier(p_clf, load_model=False)
+    >>> d_clf['clf_pipeline'] is None
+    True
     >>> os.remove(p_clf)
+    >>> os.remove(os.path.join('.', d_clf['clf_model']))
     """
     assert os.path.isdir(path_out), 'missing folder: %r' % path_out
+    name_model = TEMPLATE_NAME_CLF_MODEL.format(clf_name)
+    path_model = os.path.join(path_out, name_model)
+    logging.info('export classif. %r to "%s"', classif, path_model)
+    # no compression, otherwise the arrays could not be memory-mapped
+    joblib.dump(flatten_tree_classifier(classif), path_model, compress=0)
+
     dict_classif = {
+        'version': CLASSIF_ARTEFACT_VERSION,
         'params': params,
         'name': clf_name,
-        'clf_pipeline': classif,
+        # relative to the metadata so the experiment folder can be moved
+        'clf_model': name_model,
         'features': feature_names,
         'label_names': label_names,
     }
-
     path_clf = os.path.join(path_out, TEMPLATE_NAME_CLF.format(clf_name))
-    logging.info('export classif. of %s to "%s"', dict_classif, path_clf)
+    logging.info('export classif. metadata %s to "%s"', dict_classif, path_clf)
     with open(path_clf, 'wb') as f:
         pickle.dump(dict_classif, f)
     logging.debug('export finished')
     return path_clf
 
 
-def load_classifier(path_classif):
+def load_classifier(path_classif, load_model=True, mmap_mode='r'):
     """ estimate classifier for all data and export it
 
+    The metadata are read without touching the model weights, the classifier
+    is loaded only if requested and its numpy buffers are memory-mapped
+    read-only, so parallel workers share the same pages.
+    Legacy artefacts (single pickle with the classifier) are loaded as they are.
+
     :param str path_classif: path to the exported classifier
+    :param bool load_model: whether load also the classifier, not only metadata
+    :param str|None mmap_mode: memory-mapping mode passed to `joblib.load`
     :return {str: ...}:
 
     >>> load_classifier('none.abc')
@@ -592,7 +776,15 @@ def load_classifier(path_classif):
         return None
     with open(path_classif, 'rb') as f:
         dict_clf = pickle.load(f)
-    # dict_clf['name'] = classif_name
+    if 'version' not in dict_clf:
+        logging.debug('load legacy classifier: %r', dict_clf.keys())
+        return dict_clf
+
+    dict_clf['clf_pipeline'] = None
+    if load_model:
+        path_model = os.path.join(os.path.dirname(path_classif),
+                                  dict_clf['clf_model'])
+        dict_clf['clf_pipeline'] = joblib.load(path_model, mmap_mode=mmap_mode)
     logging.debug('load classifier: %r', dict_clf.keys())
     return dict_clf
 
@@ -623,6 +815,24 @@ def export_results_clf_search(path_out, clf_name, clf_search):
         rows = ['{:30s} {}'.format('"{}":'.format(k), params[k]) for k in params]
         fp.write('\n'.join(rows))
 
+    # successive halving - number of candidates, samples and times per stage
+    cv_results = getattr(clf_search, 'cv_results_', {})
+    if 'iter' in cv_results and 'n_resources' in cv_results:
+        df_stages = pd.DataFrame({k: cv_results[k] for k in
+                                  ('iter', 'n_resources', 'mean_fit_time',
+                                   'mean_score_time', 'mean_test_score')})
+        df_stages['nb_candidates'] = 1
+        nb_splits = getattr(clf_search, 'n_splits_', 1)
+        time_candidate = df_stages['mean_fit_time'] + df_stages['mean_score_time']
+        df_stages['total_time'] = time_candidate * nb_splits
+        df_stages = df_stages.groupby('iter').agg(
+            {'n_resources': 'first', 'nb_candidates': 'sum', 'mean_fit_time': 'mean',
+             'mean_score_time': 'mean', 'total_time': 'sum', 'mean_test_score': 'max'})
+        for _, row in df_stages.iterrows():
+            logging.info('halving stage: %r', dict(row))
+        with open(_fn_path_out('search_params_stages'), 'w') as fp:
+            fp.write(df_stages.to_string())
+
 
 def relabel_sequential(labels, uq_labels=None):
     """ relabel sequential vector staring from 0
@@ -657,7 +867,9 @@ def create_classif_search_train_export(clf_name, features, labels, cross_val=10,
     :param ndarray features: features in dimension nb_samples x nb_features
     :param [int] labels: annotation for samples
     :param int|obj cross_val: Cross validation
-    :param str search_type: search type
+    :param str search_type: search type - 'grid', 'random' or 'halving'
+        (random candidates scored on subsampled data and only the best
+        of them on the whole training set)
     :param str eval_metric: evaluation metric
     :param {} params: extra parameters
     :param float pca_coef: sklearn PCA - int/float/None
@@ -691,6 +903,11 @@ def create_classif_search_train_export(clf_name, features, labels, cross_val=10,
     ['./classif_RandForest_search_params_best.txt',
      './classif_RandForest_search_params_scores.txt']
     >>> for p in files: os.remove(p)
+    >>> clf, p_clf = create_classif_search_train_export('RandForest', fts, lbs,
+    ...     nb_search_iter=9, path_out='', search_type='halving')  # doctest: +ELLIPSIS
+    n_iterations: ...
+    >>> clf  # doctest: +ELLIPSIS
+    Pipeline(...)
     """
     assert list(labels), 'some labels has to be given'
     features = np.nan_to_num(features)
@@ -740,9 +957,90 @@ def create_classif_search_train_export(clf_name, features, labels, cross_val=10,
     return clf_pipeline, path_classif
 
 
+class _CachedFoldPredictor(object):
+    """ mimic fitted classifier returning cached predictions of a single fold,
+    so the sklearn scorers can be used without predicting again
+    """
+
+    def __init__(self, classes, predict, proba):
+        self.classes_ = classes
+        self._predict = predict
+        self._proba = proba
+
+    def predict(self, features):
+        assert len(features) == len(self._predict), 'not the cached test fold'
+        return self._predict
+
+    def predict_proba(self, features):
+        assert len(features) == len(self._proba), 'not the cached test fold'
+        return self._proba
+
+
+def compute_classif_cross_val_folds(classif, features, labels, cross_val=10,
+                                    fold_cache=None):
+    """ train the classifier (whole pipeline incl. preprocessing) once on each
+    training fold and predict the test fold; the fitted models and predictions
+    are stored in a cache keyed by the classifier parameters and fold indexes,
+    so evaluating several statistics on the same folds does not refit anything
+
+    :param obj classif: sklearn classifier
+    :param ndarray features: features in dimension nb_samples x nb_features
+    :param [int] labels: annotation for samples
+    :param int|obj cross_val: Cross validation
+    :param {} fold_cache: cache of fold results (for the same features and
+        labels), it is filled by computed folds and reused in following calls
+    :return [{str: ...}]: for each fold the train and test indexes,
+        fitted classifier, predicted labels and probabilities
+
+    >>> np.random.seed(0)
+    >>> labels = np.array([0] * 50 + [1] * 40)
+    >>> data = np.tile(labels, (3, 1)).T + np.random.random((len(labels), 3))
+    >>> classif = create_classifiers()['LogistRegr']
+    >>> fold_cache = {}
+    >>> folds = compute_classif_cross_val_folds(classif, data, labels,
+    ...                                         CrossValidate(90, 30), fold_cache)
+    >>> len(folds), len(fold_cache)
+    (3, 3)
+    >>> sorted(folds[0].keys())
+    ['classif', 'predict', 'proba', 'test', 'train']
+    >>> folds[0]['proba'].shape
+    (30, 2)
+    >>> folds_2 = compute_classif_cross_val_folds(classif, data, labels,
+    ...                                           CrossValidate(90, 30), fold_cache)
+    >>> folds_2[0]['classif'] is folds[0]['classif']
+    True
+    """
+    features = np.asarray(features)
+    labels = np.asarray(labels)
+    if fold_cache is None:
+        fold_cache = {}
+    # since version change the CV is not iterable by default
+    cross_val = model_selection.check_cv(cross_val, labels, classifier=True)
+    key_classif = joblib.hash(clone(classif).get_params(deep=True))
+
+    folds = []
+    for train, test in cross_val.split(features, labels):
+        train, test = np.asarray(train), np.asarray(test)
+        key = (key_classif, joblib.hash((train, test)))
+        if key not in fold_cache:
+            classif_cv = clone(classif)
+            classif_cv.fit(np.copy(features[train], order='C'),
+                           np.copy(labels[train], order='C'))
+            features_test = np.copy(features[test], order='C')
+            fold_cache[key] = {
+                'train': train,
+                'test': test,
+                'classif': classif_cv,
+                'predict': classif_cv.predict(features_test),
+                'proba': classif_cv.predict_proba(features_test),
+            }
+        folds.append(fold_cache[key])
+    return folds
+
+
 def eval_classif_cross_val_scores(clf_name, classif, features, labels,
                                   cross_val=10, path_out=None,
-                                  scorings=METRIC_SCORING):
+                                  scorings=METRIC_SCORING, fold_cache=None):
     """ compute statistic on cross-validation schema
 
     http://scikit-learn.org/stable/modules/generated/sklearn.model_selection.cross_val_score.html
@@ -754,6 +1052,8 @@ def eval_classif_cross_val_scores(clf_name, classif, features, labels,
     :param object cross_val:
     :param str path_out: path for exporting statistic
     :param [str] scorings: list of used scorings
+    :param {} fold_cache: cache of fitted folds,
+        see :func:`compute_classif_cross_val_folds`
     :return DF:
 
     >>> labels = np.array([0] * 150 + [1] * 100 + [2] * 50)
@@ -788,22 +1088,35 @@ def eval_classif_cross_val_scores(clf_name, classif, features, labels,
     >>> [os.remove(p) for p in p_files]  # doctest: +ELLIPSIS
     [...]
     """
+    features, labels = np.asarray(features), np.asarray(labels)
+    folds = compute_classif_cross_val_folds(classif, features, labels,
+                                            cross_val, fold_cache)
+    uq_labels = np.unique(labels)
+    # ValueError: pos_label=1 is not a valid label: array([0, 2])
+    relabel = len(uq_labels) <= 2
+
+    def _relabel(lbs):
+        # NOTE, this is temporal just for purposes of computing stat.
+        return np.asarray(relabel_sequential(lbs, uq_labels)) if relabel else lbs
+
     df_scoring = pd.DataFrame()
     for scoring in scorings:
         try:
-            uq_labels = np.unique(labels)
-            # ValueError: pos_label=1 is not a valid label: array([0, 2])
-            if len(uq_labels) <= 2:
-                # NOTE, this is temporal just for purposes of computing stat.
-                labels = relabel_sequential(labels, uq_labels)
-            scores = model_selection.cross_val_score(classif, features, labels,
-                                                     cv=cross_val,
-                                                     scoring=scoring)
+            scorer = metrics.get_scorer(scoring)
+            scores = []
+            for fold in folds:
+                classes = fold['classif'].classes_
+                classif_cv = _CachedFoldPredictor(_relabel(classes),
+                                                  _relabel(fold['predict']),
+                                                  fold['proba'])
+                scores.append(scorer(classif_cv, features[fold['test']],
+                                     _relabel(labels[fold['test']])))
+            scores = np.array(scores)
             logging.info('Cross-Val score (%s = %f):\n %r',
                          scoring, np.mean(scores), scores)
             df_scoring[scoring] = scores
         except Exception:
-            logging.exception('model_selection.cross_val_score')
+            logging.exception('cross-validation score: %s', scoring)
 
     if path_out is not None:
         assert os.path.exists(path_out), 'missing: "%s"' % path_out
@@ -825,7 +1138,8 @@ def eval_classif_cross_val_scores(clf_name, classif, features, labels,
 
 
 def eval_classif_cross_val_roc(clf_name, classif, features, labels,
-                               cross_val, path_out=None, nb_steps=100):
+                               cross_val, path_out=None, nb_steps=100,
+                               fold_cache=None):
     """ compute mean ROC curve on cross-validation schema
 
     http://scikit-learn.org/0.15/auto_examples/plot_roc_crossval.html
@@ -837,6 +1151,8 @@ def eval_classif_cross_val_roc(clf_name, classif, features, labels,
     :param object cross_val:
     :param str path_out: path for exporting statistic
     :param int nb_steps: number of thresholds
+    :param {} fold_cache: cache of fitted folds,
+        see :func:`compute_classif_cross_val_folds`
     :return:
 
     >>> np.random.seed(0)
@@ -882,6 +1198,7 @@ def eval_classif_cross_val_roc(clf_name, classif, features, labels,
     >>> import shutil
     >>> shutil.rmtree(path_out, ignore_errors=True)
     """
+    features, labels = np.asarray(features), np.asarray(labels)
     mean_tpr = 0.0
     mean_fpr = np.linspace(0, 1, nb_steps)
     labels_bin = np.zeros((len(labels), np.max(labels) + 1))
@@ -891,15 +1208,11 @@ def eval_classif_cross_val_roc(clf_name, classif, features, labels,
     for lb in unique_labels:
         labels_bin[:, lb] = (labels == lb)
 
-    # since version change the CV is not iterable by default
-    if not hasattr(cross_val, '__iter__'):
-        cross_val = cross_val.split(features, labels)
+    folds = compute_classif_cross_val_folds(classif, features, labels,
+                                            cross_val, fold_cache)
     count = 0.
-    for train, test in cross_val:
-        classif_cv = clone(classif)
-        classif_cv.fit(np.copy(features[train], order='C'),
-                       np.copy(labels[train], order='C'))
-        proba = classif_cv.predict_proba(np.copy(features[test], order='C'))
+    for fold in folds:
+        test, proba = fold['test'], fold['proba']
         # Compute ROC curve and area the curve
         for i, lb in enumerate(unique_labels):
             fpr, tpr, _ = metrics.roc_curve(labels_bin[test, lb], proba[:, i])
@@ -960,9 +1273,10 @@ def create_classif_search(name_clf, clf_pipeline, nb_labels,
     """ create sklearn search depending on spec. random or grid
 
     :param int nb_labels: number of labels
-    :param str search_type: hyper-params search type
+    :param str search_type: hyper-params search type - 'grid', 'random'
+        or 'halving' (successive halving over the number of samples)
     :param str eval_metric: evaluation metric
-    :param int nb_iter: for random number of tries
+    :param int nb_iter: for random and halving number of tries
     :param str name_clf: name of classif.
     :param obj clf_pipeline: object
     :param obj cross_val: obj specific CV for fix train-test
@@ -978,7 +1292,23 @@ def create_classif_search(name_clf, clf_pipeline, nb_labels,
         clf_search = GridSearchCV(
             clf_pipeline, clf_parameters, scoring=scoring, cv=cross_val,
             n_jobs=nb_workers, verbose=1, refit=True)
+    elif search_type == 'halving' and HalvingRandomSearchCV is not None:
+        clf_parameters = create_clf_param_search_distrib(name_clf)
+        nb_iter = search_params_cut_down_max_nb_iter(clf_parameters, nb_iter)
+        logging.info('init Successive halving search...')
+        if not isinstance(cross_val, int) and not hasattr(cross_val, 'split'):
+            # the halving subsamples train indexes of each fold as arrays
+            cross_val = [(np.asarray(train), np.asarray(test))
+                         for train, test in cross_val]
+        clf_search = HalvingRandomSearchCV(
+            clf_pipeline, clf_parameters, scoring=scoring, cv=cross_val,
+            n_jobs=nb_workers, n_candidates=nb_iter, resource='n_samples',
+            factor=HALVING_SEARCH_FACTOR, min_resources='exhaust',
+            verbose=1, refit=True)
     else:
+        if search_type == 'halving':
+            logging.warning('successive halving is not supported by this'
+                            ' sklearn version, using randomized search')
         clf_parameters = create_clf_param_search_distrib(name_clf)
         nb_iter = search_params_cut_down_max_nb_iter(clf_parameters, nb_iter)
         logging.info('init Randomized search...')
@@ -1072,12 +1402,14 @@ def down_sample_dict_features_random(dict_features, nb_samples):
     return dict_features_new
 
 
-def down_sample_dict_features_kmean(dict_features, nb_samples):
+def down_sample_dict_features_kmean(dict_features, nb_samples, method='minibatch'):
     """ cluser with kmeans the features with nb cluster == given nb_samples
     and the retirn features which are closer to each cluster center
 
     :param {} dict_features: {int: [[float] * nb_features] * nb}
     :param int nb_samples:
+    :param str method: clustering 'minibatch' - MiniBatchKMeans (fast)
+        or 'full' - KMeans on all samples (reference)
     :return {}: {int: [[float] * nb_features] * nb_samples}
 
     >>> np.random.seed(0)
@@ -1086,16 +1418,27 @@ def down_sample_dict_features_kmean(dict_features, nb_samples):
     >>> d_fts['a'].shape
     (5, 3)
     """
+    assert method in ('minibatch', 'full'), 'not supported method "%s"' % method
     dict_features_new = dict()
     for label in dict_features:
         features = dict_features[label]
         if len(features) <= nb_samples:
             dict_features_new[label] = features.copy()
             continue
-        kmeans = cluster.KMeans(n_clusters=nb_samples, init='random', n_init=3,
-                                max_iter=5, n_jobs=-1)
-        dist = kmeans.fit_transform(features)
-        find_min = np.argmin(dist, axis=0)
+        if method == 'full':
+            kmeans = cluster.KMeans(n_clusters=nb_samples, init='random', n_init=3,
+                                    max_iter=5, n_jobs=-1)
+            dist = kmeans.fit_transform(features)
+            find_min = np.argmin(dist, axis=0)
+        else:
+            batch_size = min(len(features), max(KMEANS_MIN_BATCH_SIZE, 2 * nb_samples))
+            kmeans = cluster.MiniBatchKMeans(n_clusters=nb_samples, init='random',
+                                             n_init=3, max_iter=5,
+                                             batch_size=batch_size)
+            kmeans.fit(features)
+            # the closest sample to each cluster centre, computed by chunks
+            find_min = metrics.pairwise_distances_argmin(kmeans.cluster_centers_,
+                                                         features)
         dict_features_new[label] = features[find_min, :]
     return dict_features_new
 
@@ -1109,12 +1452,31 @@ def down_sample_dict_features_kmean(dict_features, nb_samples):
 #     return unique_matrix
 
 
-def unique_rows(data):
+def unique_rows(data, method='hash'):
     """ with matrix detect unique row and return only them
 
     :param ndarray data: np.array
+    :param str method: 'hash' - hash table in linear time keeping the order
+        of first occurrence or 'sort' - sorted unique rows (reference)
     :return ndarray: np.array
+
+    >>> data = np.array([[1, 0.5], [0, 0.], [1, 0.5], [-0., 0.], [0, 1.]])
+    >>> unique_rows(data)
+    array([[ 1. ,  0.5],
+           [ 0. ,  0. ],
+           [ 0. ,  1. ]])
+    >>> unique_rows(data, method='sort')
+    array([[ 0. ,  0. ],
+           [ 0. ,  1. ],
+           [ 1. ,  0.5]])
     """
+    assert method in ('hash', 'sort'), 'not supported method "%s"' % method
+    if method == 'hash':
+        data = np.asarray(data)
+        # unify the negative and positive zeros
+        data = data + np.zeros(1, dtype=data.dtype) if data.dtype.kind == 'f' else data
+        mask_duplic = pd.DataFrame(data).duplicated(keep='first').values
+        return data[~mask_duplic]
     # preventing: ValueError: new type not compatible with array.
     # https://docs.scipy.org/doc/numpy/reference/generated/numpy.ndarray.view.html
     data = data.copy()
@@ -1122,10 +1484,11 @@ def unique_rows(data):
     return uniq.view(data.dtype).reshape(-1, data.shape[1])
 
 
-def down_sample_dict_features_unique(dict_features):
+def down_sample_dict_features_unique(dict_features, method='hash'):
     """ browse all label features and take unique features
 
     :param {} dict_features: {int: [[float] * nb_features] * nb_samples}
+    :param str method: deduplication method, see :func:`unique_rows`
     :return {}: {int: [[float] * nb_features] * nb}
 
     >>> np.random.seed(0)
@@ -1137,7 +1500,7 @@ def down_sample_dict_features_unique(dict_features):
     dict_features_new = dict()
     for label in dict_features:
         features = np.round(dict_features[label], ROUND_UNIQUE_FTS_DIGITS)
-        unique_fts = np.array(unique_rows(features))
+        unique_fts = np.array(unique_rows(features, method))
         assert features.ndim == unique_fts.ndim, 'feature dim matching'
         assert features.shape[1] == unique_fts.shape[1], \
             'features: %i <> %i' % (features.shape[1], unique_fts.shape[1])
@@ -1151,7 +1514,8 @@ def balance_dataset_by_(features, labels, balance_type='random',
 
     :param ndarray features: features in dimension nb_samples x nb_features
     :param [int] labels: annotation for samples
-    :param str balance_type: type of balancing dataset
+    :param str balance_type: type of balancing dataset - 'random', 'kmeans',
+        'unique' or the slow reference versions 'kmeans_full' and 'unique_sort'
     :param int|None min_samples: if None take the smallest class
     :return (ndarray, ndarray):
 
@@ -1172,11 +1536,13 @@ def balance_dataset_by_(features, labels, balance_type='random',
     if balance_type.lower() == 'random':
         dict_features = down_sample_dict_features_random(dict_features,
                                                          min_samples)
-    elif balance_type.lower() == 'kmeans':
+    elif balance_type.lower() in ('kmeans', 'kmeans_full'):
+        method = 'full' if balance_type.lower() == 'kmeans_full' else 'minibatch'
         dict_features = down_sample_dict_features_kmean(dict_features,
-                                                        min_samples)
-    elif balance_type.lower() == 'unique':
-        dict_features = down_sample_dict_features_unique(dict_features)
+                                                        min_samples, method)
+    elif balance_type.lower() in ('unique', 'unique_sort'):
+        method = 'sort' if balance_type.lower() == 'unique_sort' else 'hash'
+        dict_features = down_sample_dict_features_unique(dict_features, method)
     else:
         logging.warning('not defined balancing method "%s"', balance_type)
 
@@ -4,17 +4,20 @@ Framework for ellipse fitting
 Copyright (C) 2014-2018 Jiri Borovec <jiri.borovec@fel.cvut.cz>
 """
 
+from functools import partial
+
 import numpy as np
 from scipy import ndimage, spatial
 from skimage import morphology
 
 from skimage.measure import fit as sk_fit
 # from skimage.measure.fit import EllipseModel  # fix in future skimage>0.13.0
-from imsegm.utilities.drawing import ellipse
+from imsegm.utilities.drawing import ellipse_row_spans, ellipse_spans_indices
 from imsegm.descriptors import (reduce_close_points, compute_ray_features_segm_2d,
                                 reconstruct_ray_features_2d)
 from imsegm.superpixels import (segment_slic_img2d, superpixel_centers,
                                 make_graph_segm_connect_grid2d_conn4)
+from imsegm.utilities.experiments import WrapExecuteSequence
 
 INIT_MASK_BORDER = 50.
 MIN_ELLIPSE_DAIM = 25.
@@ -22,6 +25,12 @@ MAX_FIGURE_SIZE = 14
 SEGM_OVERLAP = 0.5
 STRUC_ELEM_BG = 15
 STRUC_ELEM_FG = 5
+# number of candidate models evaluated together in single RANSAC batch
+RANSAC_BATCH_SIZE = 25
+# number of samples on ellipse perimeter used to initialise the closest point
+NB_RESIDUAL_SAMPLES = 36
+# number of Newton iterations refining the closest point on ellipse perimeter
+NB_RESIDUAL_ITER = 4
 
 
 class EllipseModelSegm(sk_fit.EllipseModel):
@@ -105,43 +114,235 @@ class EllipseModelSegm(sk_fit.EllipseModel):
         ...              table_prob)   # doctest: +ELLIPSIS
         -70.311...
         """
-        assert len(points) == len(weights) == len(labels), \
-            'different sizes for points %i and weights %i and labels %i' \
-            % (len(points), len(weights), len(labels))
-        table_prob = np.array(table_prob)
-        if table_prob.ndim == 1 or table_prob.shape[0] == 1:
-            if table_prob.shape[0] == 1:
-                table_prob = table_prob[0]
-            table_prob = np.array([table_prob, 1. - table_prob])
-        assert table_prob.shape[0] == 2, 'table shape %r' % table_prob.shape
-        assert np.max(labels) < table_prob.shape[1], \
-            'labels (%i) exceed the table %r' % (np.max(labels), table_prob.shape)
-
-        r_pos, c_pos = points[:, 0], points[:, 1]
-        r_org, c_org, r_rad, c_rad, phi = self.params
+        return self.criterion_batch([self.params], points, weights, labels,
+                                    table_prob)[0]
+
+    @staticmethod
+    def residuals_batch(params, points, nb_samples=NB_RESIDUAL_SAMPLES,
+                        nb_iter=NB_RESIDUAL_ITER):
+        """ Determine residuals of data to several models at once.
+
+        The closest point on each ellipse is initialised from regular samples
+        along the perimeter and refined by few Newton steps, all vectorised
+        over models and points instead of solving least squares per point.
+
+        :param [[float]] params: list of K ellipse parameters (xc, yc, a, b, theta)
+        :param ndarray points: points coordinates of size (N, 2)
+        :param int nb_samples: number of perimeter samples for initialisation
+        :param int nb_iter: number of Newton iterations
+        :return ndarray: distances of size (K, N)
+
+        >>> params = 20, 30, 12, 16, np.deg2rad(30)
+        >>> xy = EllipseModelSegm().predict_xy(np.linspace(0, 2 * np.pi, 25), params)
+        >>> res = EllipseModelSegm.residuals_batch([params, (20, 30, 14, 18, params[-1])], xy)
+        >>> res.shape
+        (2, 25)
+        >>> np.round(res.max(axis=1), 5)
+        array([ 0.,  2.])
+        >>> el = EllipseModelSegm()
+        >>> el.params = (20, 30, 10, 20, params[-1])
+        >>> np.allclose(el.residuals(xy), el.residuals_batch([el.params], xy)[0])
+        True
+        """
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        points = np.asarray(points, dtype=float)
+        x_c, y_c, rad_a, rad_b, theta = [params[:, i, np.newaxis] for i in range(5)]
+        sin_th, cos_th = np.sin(theta), np.cos(theta)
+        d_x, d_y = points[np.newaxis, :, 0] - x_c, points[np.newaxis, :, 1] - y_c
+        # points transformed into the ellipse coordinate frame
+        pos_u = d_x * cos_th + d_y * sin_th
+        pos_v = d_y * cos_th - d_x * sin_th
+
+        # initialise by the closest sample along the perimeter
+        angles = np.linspace(0, 2 * np.pi, nb_samples, endpoint=False)
+        dists = (pos_u[..., np.newaxis] - rad_a[..., np.newaxis] * np.cos(angles)) ** 2 \
+            + (pos_v[..., np.newaxis] - rad_b[..., np.newaxis] * np.sin(angles)) ** 2
+        angle = angles[np.argmin(dists, axis=-1)]
+
+        # refine by Newton steps on the derivative of squared distance
+        diff_ab = rad_b ** 2 - rad_a ** 2
+        for _ in range(nb_iter):
+            sin_t, cos_t = np.sin(angle), np.cos(angle)
+            grad = diff_ab * sin_t * cos_t + rad_a * pos_u * sin_t \
+                - rad_b * pos_v * cos_t
+            hess = diff_ab * (cos_t ** 2 - sin_t ** 2) + rad_a * pos_u * cos_t \
+                + rad_b * pos_v * sin_t
+            step = np.zeros_like(angle)
+            np.divide(grad, hess, out=step, where=hess > 0)
+            angle -= np.clip(step, -np.pi / nb_samples, np.pi / nb_samples)
+
+        dist_u = pos_u - rad_a * np.cos(angle)
+        dist_v = pos_v - rad_b * np.sin(angle)
+        residuals = np.sqrt(dist_u ** 2 + dist_v ** 2)
+        return residuals
+
+    @staticmethod
+    def criterion_batch(params, points, weights, labels, table_prob=(0.1, 0.9)):
+        """ Determine the segmentation criterion for several models at once.
+
+        :param [[float]] params: list of K ellipse parameters (xc, yc, a, b, theta)
+        :param points: points coordinates
+        :param weights: weight for each point represent the region size
+        :param labels: vector of labels for each point
+        :param table_prob: table of foreground / background probabilities,
+            see :meth:`EllipseModelSegm.criterion`
+        :return ndarray: criterion values of size (K, )
+
+        >>> seg = np.zeros((10, 15), dtype=int)
+        >>> r, c = np.meshgrid(range(seg.shape[1]), range(seg.shape[0]))
+        >>> seg[2:7, 4:11] = 1
+        >>> params = [[4, 7, 3, 6, np.deg2rad(10)], [4, 7, 1, 2, 0]]
+        >>> crit = EllipseModelSegm.criterion_batch(
+        ...     params, np.array([r.ravel(), c.ravel()]).T,
+        ...     np.ones(seg.size), seg.ravel(), [[0.1, 0.9]])
+        >>> np.round(crit, 3)
+        array([ 17.578,   6.592])
+        """
+        costs = compute_points_costs(points, weights, labels, table_prob)
+
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        r_org, c_org, r_rad, c_rad, phi = [params[:, i, np.newaxis] for i in range(5)]
         sin_phi, cos_phi = np.sin(phi), np.cos(phi)
-        r, c = (r_pos - r_org), (c_pos - c_org)
+        r = points[np.newaxis, :, 0] - r_org
+        c = points[np.newaxis, :, 1] - c_org
         dist_1 = ((r * cos_phi + c * sin_phi) / r_rad) ** 2
         dist_2 = ((r * sin_phi - c * cos_phi) / c_rad) ** 2
         inside = ((dist_1 + dist_2) <= 1)
 
-        # import matplotlib.pyplot as plt
-        # plt.imshow(labels.reshape((10, 15)), interpolation='nearest')
-        # plt.contour(inside.reshape((10, 15)))
+        residuals = np.dot(inside, costs)
+        return residuals
 
-        table_q = - np.log(table_prob)
-        labels_in = labels[inside].astype(int)
+    @staticmethod
+    def criterion_cumsum(params, table_cumsum):
+        """ Determine the segmentation criterion for several models at once
+        from precomputed table of row-wise cumulative sums of point costs,
+        each model costs O(ellipse height) regardless the number of points.
 
-        diff = table_q[0, labels_in] - table_q[1, labels_in]
-        residual = np.sum(weights[labels_in] * diff)
+        :param [[float]] params: list of K ellipse parameters (xc, yc, a, b, theta)
+        :param ndarray table_cumsum: see :func:`create_criterion_cumsum_table`
+        :return ndarray: criterion values of size (K, )
 
-        return residual
+        >>> seg = np.zeros((10, 15), dtype=int)
+        >>> r, c = np.meshgrid(range(seg.shape[1]), range(seg.shape[0]))
+        >>> seg[2:7, 4:11] = 1
+        >>> table = create_criterion_cumsum_table(
+        ...     np.array([r.ravel(), c.ravel()]).T, np.ones(seg.size),
+        ...     seg.ravel(), [[0.1, 0.9]])
+        >>> params = [[4, 7, 3, 6, np.deg2rad(10)], [4, 7, 1, 2, 0]]
+        >>> np.round(EllipseModelSegm.criterion_cumsum(params, table), 3)
+        array([ 17.578,   6.592])
+        """
+        shape = (table_cumsum.shape[0], table_cumsum.shape[1] - 1)
+        residuals = np.zeros(len(params))
+        for i, (r_org, c_org, r_rad, c_rad, phi) in enumerate(params):
+            rows, begins, ends = ellipse_row_spans(r_org, c_org, r_rad, c_rad,
+                                                   phi, shape, inclusive=True)
+            costs = table_cumsum[rows, ends] - table_cumsum[rows, begins]
+            residuals[i] = np.sum(costs)
+        return residuals
+
+
+def compute_points_costs(points, weights, labels, table_prob):
+    """ compute the contribution of each point to the segmentation criterion
+    if the point is inside of the model
+
+    :param points: points coordinates
+    :param weights: weight for each point represent the region size
+    :param labels: vector of labels for each point
+    :param table_prob: table of foreground / background probabilities,
+        see :meth:`EllipseModelSegm.criterion`
+    :return ndarray: cost for each point
+
+    >>> np.round(compute_points_costs(np.zeros((3, 2)), [1, 2, 3], [0, 1, 1],
+    ...                               [[0.1, 0.9]]), 3)
+    array([ 2.197, -4.394, -4.394])
+    """
+    assert len(points) == len(weights) == len(labels), \
+        'different sizes for points %i and weights %i and labels %i' \
+        % (len(points), len(weights), len(labels))
+    table_prob = np.array(table_prob)
+    if table_prob.ndim == 1 or table_prob.shape[0] == 1:
+        if table_prob.shape[0] == 1:
+            table_prob = table_prob[0]
+        table_prob = np.array([table_prob, 1. - table_prob])
+    assert table_prob.shape[0] == 2, 'table shape %r' % table_prob.shape
+    assert np.max(labels) < table_prob.shape[1], \
+        'labels (%i) exceed the table %r' % (np.max(labels), table_prob.shape)
+
+    table_q = - np.log(table_prob)
+    labels = np.asarray(labels).astype(int)
+    diff = table_q[0, labels] - table_q[1, labels]
+    costs = np.asarray(weights)[labels] * diff
+    return costs
+
+
+def create_criterion_cumsum_table(points, weights, labels, table_prob,
+                                  shape=None):
+    """ create per-image table of row-wise cumulative sums of point costs,
+    the points are expected to be integer positions in the image
+
+    :param ndarray points: points coordinates of size (N, 2)
+    :param weights: weight for each point represent the region size
+    :param labels: vector of labels for each point
+    :param table_prob: table of foreground / background probabilities,
+        see :meth:`EllipseModelSegm.criterion`
+    :param (int, int) shape: image size, by default bounding all points
+    :return ndarray: table of size (H, W + 1) with leading zero column
+
+    >>> table = create_criterion_cumsum_table(np.array([[0, 1], [1, 0], [1, 2]]),
+    ...                                       [1, 1, 1], [0, 1, 1], [[0.1, 0.9]])
+    >>> np.round(table, 2)
+    array([[ 0.  ,  0.  ,  2.2 ,  2.2 ],
+           [ 0.  , -2.2 , -2.2 , -4.39]])
+    """
+    costs = compute_points_costs(points, weights, labels, table_prob)
+    points = np.round(points).astype(int)
+    if shape is None:
+        shape = np.max(points, axis=0) + 1
+    table_cumsum = np.zeros((shape[0], shape[1] + 1))
+    np.add.at(table_cumsum, (points[:, 0], points[:, 1] + 1), costs)
+    table_cumsum = np.cumsum(table_cumsum, axis=1)
+    return table_cumsum
+
+
+def _ransac_dynamic_max_trials(nb_inliers, nb_points, min_samples, probability):
+    """ estimate the number of trials needed to draw outlier-free sample set
+    with given probability, the adaptive RANSAC stopping criterion
+
+    :param int nb_inliers: number of inliers of the best model
+    :param int nb_points: total number of points
+    :param int min_samples: number of samples for model estimate
+    :param float probability: required confidence
+    :return float: number of trials
+
+    >>> _ransac_dynamic_max_trials(50, 100, 4, 0.99)
+    72.0
+    >>> _ransac_dynamic_max_trials(50, 100, 4, 1.)
+    inf
+    >>> _ransac_dynamic_max_trials(100, 100, 4, 0.99)
+    1.0
+    """
+    if nb_inliers == 0 or probability >= 1:
+        return np.inf
+    inlier_ratio = nb_inliers / float(nb_points)
+    denom = 1. - inlier_ratio ** min_samples
+    if denom <= 0:
+        return 1.
+    elif denom >= 1:
+        return np.inf
+    return float(np.ceil(np.log(1. - probability) / np.log(denom)))
 
 
 def ransac_segm(points, model_class, points_all, weights, labels, table_prob,
-                min_samples, residual_threshold=1, max_trials=100):
+                min_samples, residual_threshold=1, max_trials=100,
+                stop_probability=1., batch_size=RANSAC_BATCH_SIZE, rand_seed=None,
+                table_cumsum=None):
     """ Fit a model to points with the RANSAC (random sample consensus).
 
+    The candidate models are drawn and evaluated in batches, if the model class
+    provides ``residuals_batch`` and ``criterion_batch`` the evaluation is
+    vectorised over the whole batch.
+
     Parameters
     ----------
     points : [list, tuple of] (N, D) array
@@ -172,6 +373,18 @@ def ransac_segm(points, model_class, points_all, weights, labels, table_prob,
         Maximum distance for a points point to be classified as an inlier.
     max_trials : int, optional
         Maximum number of iterations for random sample selection.
+    stop_probability : float, optional
+        RANSAC iteration stops if at least one outlier-free set of the
+        points is sampled with given probability, the number of trials
+        is adapted according the inlier ratio of the best model.
+    batch_size : int, optional
+        Number of candidate models evaluated together.
+    rand_seed : int, RandomState, optional
+        Seed for random sample selection, use for deterministic results.
+    table_cumsum : ndarray, optional
+        Precomputed table of cumulative point costs, see
+        :func:`create_criterion_cumsum_table`, so the criterion is computed
+        by ``criterion_cumsum`` instead of testing all points.
 
 
     Returns
@@ -202,6 +415,19 @@ def ransac_segm(points, model_class, points_all, weights, labels, table_prob,
     array([60, 75, 40, 65])
     >>> np.round(ransac_model.params[4], 1)
     0.5
+    >>> ransac_model, _ = ransac_segm(points, EllipseModelSegm,
+    ...                               points_all, weights, labels, table_prob,
+    ...                               0.6, 3, max_trials=50, rand_seed=0,
+    ...                               stop_probability=0.99, batch_size=5)
+    >>> np.round(ransac_model.params[:4]).astype(int)
+    array([60, 75, 40, 65])
+    >>> table = create_criterion_cumsum_table(points_all, weights, labels,
+    ...                                       table_prob, seg.shape)
+    >>> ransac_model, _ = ransac_segm(points, EllipseModelSegm,
+    ...                               points_all, weights, labels, table_prob,
+    ...                               0.6, 3, max_trials=15, table_cumsum=table)
+    >>> np.round(ransac_model.params[:4]).astype(int)
+    array([60, 75, 40, 65])
     """
 
     best_model = None
@@ -219,37 +445,72 @@ def ransac_segm(points, model_class, points_all, weights, labels, table_prob,
     if max_trials < 0:
         raise ValueError("`max_trials` must be greater than zero")
 
+    if not (0 <= stop_probability <= 1):
+        raise ValueError("`stop_probability` must be in range [0, 1]")
+
     # make sure points is list and not tuple, so it can be modified below
     points = np.array(points)
-
-    for _ in range(max_trials):
-        # choose random sample set
-        random_idxs = np.random.randint(0, len(points), min_samples)
-        samples = points[random_idxs]
-        # for d in points:
-        #     samples.append(d[random_idxs])
-
-        # estimate model for current random sample set
-        model = model_class()
-        success = model.estimate(samples)
-
-        if success is not None:  # backwards compatibility
-            if not success:
-                continue
-
-        model_residuals = np.abs(model.residuals(points))
-        # consensus set / inliers
-        model_inliers = model_residuals < residual_threshold
-        model_fit = model.criterion(points_all, weights, labels, table_prob)
-
-        # choose as new best model if number of inliers is maximal
-        sample_inlier_num = np.sum(model_inliers)
-        if model_fit < best_model_fit:
-            best_model = model
-            best_model_fit = model_fit
-            if sample_inlier_num > best_inlier_num:
-                best_inliers = model_inliers
-                best_inlier_num = sample_inlier_num
+    if isinstance(rand_seed, np.random.RandomState):
+        rand_state = rand_seed
+    elif rand_seed is not None:
+        rand_state = np.random.RandomState(rand_seed)
+    else:
+        rand_state = np.random.mtrand._rand
+    is_batch = all(hasattr(model_class, n)
+                   for n in ('residuals_batch', 'criterion_batch', 'criterion_cumsum'))
+
+    nb_trials = 0
+    dyn_max_trials = max_trials
+    while nb_trials < dyn_max_trials:
+        nb_batch = int(min(batch_size, dyn_max_trials - nb_trials))
+        nb_trials += nb_batch
+        models = []
+        for _ in range(nb_batch):
+            # choose random sample set
+            random_idxs = rand_state.randint(0, len(points), min_samples)
+            samples = points[random_idxs]
+
+            # estimate model for current random sample set
+            model = model_class()
+            success = model.estimate(samples)
+
+            if success is not None:  # backwards compatibility
+                if not success:
+                    continue
+            models.append(model)
+        if not models:
+            continue
+
+        if is_batch:
+            params = [m.params for m in models]
+            batch_residuals = np.abs(model_class.residuals_batch(params, points))
+            if table_cumsum is not None:
+                batch_fit = model_class.criterion_cumsum(params, table_cumsum)
+            else:
+                batch_fit = model_class.criterion_batch(params, points_all,
+                                                        weights, labels, table_prob)
+        else:
+            batch_residuals = [np.abs(m.residuals(points)) for m in models]
+            batch_fit = [m.criterion(points_all, weights, labels, table_prob)
+                         for m in models]
+
+        for model, model_residuals, model_fit in zip(models, batch_residuals,
+                                                     batch_fit):
+            # consensus set / inliers
+            model_inliers = model_residuals < residual_threshold
+
+            # choose as new best model if number of inliers is maximal
+            sample_inlier_num = np.sum(model_inliers)
+            if model_fit < best_model_fit:
+                best_model = model
+                best_model_fit = model_fit
+                if sample_inlier_num > best_inlier_num:
+                    best_inliers = model_inliers
+                    best_inlier_num = sample_inlier_num
+
+        dyn_trials = _ransac_dynamic_max_trials(best_inlier_num, len(points),
+                                                min_samples, stop_probability)
+        dyn_max_trials = min(max_trials, dyn_trials)
 
     # estimate final model using all inliers
     if best_inliers is not None:
@@ -259,6 +520,89 @@ def ransac_segm(points, model_class, points_all, weights, labels, table_prob,
     return best_model, best_inliers
 
 
+def _ransac_segm_centre(idx_points_seed, model_class, points_all, weights,
+                        labels, table_prob, **kwargs):
+    """ wrapper for running RANSAC on single centre with own random seed """
+    idx, points, rand_seed = idx_points_seed
+    model, inliers = ransac_segm(points, model_class, points_all, weights,
+                                 labels, table_prob, rand_seed=rand_seed,
+                                 **kwargs)
+    return idx, model, inliers
+
+
+def ransac_segm_centers(points_centers, model_class, points_all, weights,
+                        labels, table_prob, min_samples, nb_workers=1,
+                        **kwargs):
+    """ run RANSAC fitting for set of points related to several centres,
+    each centre has deterministic random seed derived from its index
+    so the results do not depend on the number of parallel workers,
+    for integer points the criterion table is computed once for all centres
+
+    The integer `rand_seed` (default 0) is shifted by the centre index,
+    for `RandomState` the seeds for all centres are drawn from it in advance
+    and `None` keeps all centres non-deterministic.
+
+    :param [ndarray] points_centers: list of points for each centre
+    :param model_class: model class, see :func:`ransac_segm`
+    :param ndarray points_all: all points coordinates
+    :param [float] weights: weight for each point represent the region size
+    :param [int] labels: vector of labels for each point
+    :param table_prob: table of foreground / background probabilities
+    :param int|float min_samples: minimal number of sampled points
+    :param int nb_workers: number of processes in parallel
+    :param kwargs: other parameters passed to :func:`ransac_segm`
+    :return [(model, ndarray)]: list of models and inliers in the same order
+
+    >>> seg = np.zeros((120, 150), dtype=int)
+    >>> seg = add_overlap_ellipse(seg, (40, 40, 25, 30, 0.), 1)
+    >>> seg = add_overlap_ellipse(seg, (75, 110, 30, 25, 0.), 1)
+    >>> slic, points_all, labels = get_slic_points_labels(seg, slic_size=10,
+    ...                                                   slic_regul=0.3)
+    >>> points_centers = prepare_boundary_points_ray_dist(
+    ...     seg, [(40, 40), (75, 110)], 2, sel_bg=1, sel_fg=0)
+    >>> table_prob = [[0.01, 0.75, 0.95, 0.9], [0.99, 0.25, 0.05, 0.1]]
+    >>> weights = np.bincount(slic.ravel())
+    >>> fits = ransac_segm_centers(points_centers, EllipseModelSegm, points_all,
+    ...                            weights, labels, table_prob, 0.6,
+    ...                            residual_threshold=3, max_trials=25)
+    >>> [np.round(m.params[:2]).astype(int).tolist() for m, _ in fits]
+    [[40, 40], [75, 110]]
+    >>> for seed in (None, np.random.RandomState(0)):
+    ...     fits = ransac_segm_centers(points_centers, EllipseModelSegm, points_all,
+    ...                                weights, labels, table_prob, 0.6,
+    ...                                residual_threshold=3, max_trials=25,
+    ...                                rand_seed=seed)
+    ...     print([np.round(m.params[:2]).astype(int).tolist() for m, _ in fits])
+    [[40, 40], [75, 110]]
+    [[40, 40], [75, 110]]
+    """
+    points_centers = list(points_centers)
+    rand_seed = kwargs.pop('rand_seed', 0)
+    if isinstance(rand_seed, np.random.RandomState):
+        # drawn in advance, so the seeds do not depend on the workers
+        seeds = rand_seed.randint(0, np.iinfo(np.int32).max,
+                                  len(points_centers)).tolist()
+    elif rand_seed is None:
+        seeds = [None] * len(points_centers)
+    else:
+        seeds = [rand_seed + i for i in range(len(points_centers))]
+    points_all = np.asarray(points_all)
+    if 'table_cumsum' not in kwargs and hasattr(model_class, 'criterion_cumsum') \
+            and np.issubdtype(points_all.dtype, np.integer):
+        kwargs['table_cumsum'] = create_criterion_cumsum_table(
+            points_all, weights, labels, table_prob)
+    _wrapper_ransac = partial(_ransac_segm_centre, model_class=model_class,
+                              points_all=points_all, weights=weights,
+                              labels=labels, table_prob=table_prob,
+                              min_samples=min_samples, **kwargs)
+    iterate = WrapExecuteSequence(_wrapper_ransac,
+                                  list(zip(range(len(points_centers)),
+                                           points_centers, seeds)),
+                                  nb_workers=nb_workers, desc=None)
+    fits = sorted(iterate, key=lambda r: r[0])
+    return [(model, inliers) for _, model, inliers in fits]
+
+
 def get_slic_points_labels(segm, img=None, slic_size=20, slic_regul=0.1):
     """ run SLIC on image or supepixels and return superpixels, their centers
     and also lebels (label from segmentation in position of superpixel centre)
@@ -327,24 +671,25 @@ def add_overlap_ellipse(segm, ellipse_params, label, thr_overlap=1.):
     """
     if not ellipse_params:
         return segm
-    mask = np.zeros(segm.shape)
     c1, c2, h, w, phi = ellipse_params
-    rr, cc = ellipse(int(c1), int(c2), int(h), int(w), orientation=phi, shape=segm.shape)
-    mask[rr, cc] = 1
+    rr, cc = ellipse_spans_indices(*ellipse_row_spans(
+        int(c1), int(c2), int(h), int(w), orientation=phi, shape=segm.shape))
+    if len(rr) == 0:
+        return segm
 
     # filter overlapping ellipses
-    for lb in range(1, int(np.max(segm) + 1)):
-        overlap = np.sum(np.logical_and(segm == lb, mask == 1))
-        # together = np.sum(np.logical_or(segm == lb, mask == 1))
-        # ratio = float(overlap) / float(together)
-        sizes = [s for s in [np.sum(segm == lb), np.sum(mask == 1)] if s > 0]
-        if not sizes:
-            return segm
-        ratio = float(overlap) / float(min(sizes))
+    max_label = int(np.max(segm))
+    if max_label > 0:
+        overlaps = np.bincount(segm[rr, cc].astype(int).ravel(),
+                               minlength=max_label + 1)
+        sizes = np.bincount(segm.astype(int).ravel(), minlength=max_label + 1)
+        # overlap related to the smaller from existing object and the ellipse
+        sizes = np.minimum(sizes[1:], len(rr))
+        ratios = overlaps[1:] / np.maximum(sizes, 1).astype(float)
         # if there is already ellipse with such size, return just the segment
-        if ratio > thr_overlap:
+        if np.any(ratios > thr_overlap):
             return segm
-    segm[mask == 1] = label
+    segm[rr, cc] = label
     return segm
 
 
@@ -8,17 +8,15 @@ import logging
 
 import numpy as np
 from gco import cut_general_graph
-from skimage import filters
 from sklearn import metrics, preprocessing
 from sklearn import pipeline, cluster, mixture, decomposition
 
 from imsegm.utilities.drawing import (
     draw_graphcut_unary_cost_segments, draw_graphcut_weighted_edges,
-    draw_color_labeling)
+    draw_color_labeling, set_debug_image)
 from imsegm.superpixels import (
     make_graph_segm_connect_grid2d_conn4, make_graph_segm_connect_grid3d_conn6,
-    superpixel_centers)
-from imsegm.descriptors import compute_selected_features_img2d
+    superpixel_centers_array)
 
 DEFAULT_GC_ITERATIONS = 25
 COEF_INT_CONVERSION = 1e6
@@ -27,6 +25,14 @@ MIN_UNARY_PROB = 0.01
 MAX_PAIRWISE_COST = 1e5
 # max is this value and min is inverse (1 / val)
 MIN_MAX_EDGE_WEIGHT = 1e3
+# edge types which are divided by relative spatial distance of segments
+EDGE_TYPES_SPATIAL = ('model', 'features', 'color', 'spatial')
+#: number of histogram bins for the Otsu thresholds
+OTSU_NB_BINS = 256
+#: number of samples used for initialisation of streaming model estimation
+STREAM_NB_WARMUP_SAMPLES = 2048
+#: decay of the step size in online EM, 1 means plain running average
+STREAM_STEP_DECAY = 0.6
 
 
 def estim_gmm_params(features, prob):
@@ -130,7 +136,8 @@ def estim_class_model(features, nb_classes, estim_model='GMM', pca_coef=None,
     elif estim_model == 'kmeans':
         # http://scikit-learn.org/stable/modules/generated/sklearn.mixture.GMM.html
         mm.set_params(max_iter=1)
-        init_type = 'quantiles' if init_type == 'quantiles' else 'k-means++'
+        if init_type not in ('quantiles', 'Otsu'):
+            init_type = 'k-means++'
         _, y = estim_class_model_kmeans(features, nb_classes,
                                         init_type=init_type, max_iter=max_iter)
 
@@ -158,12 +165,227 @@ def estim_class_model(features, nb_classes, estim_model='GMM', pca_coef=None,
     return model
 
 
-def compute_multivarian_otsu(features):
+def _iterate_warmup_blocks(iter_blocks, nb_warmup):
+    """ merge leading blocks to have at least given number of samples
+    in the first one, the rest of blocks is passed as it is """
+    iter_blocks = iter(iter_blocks)
+    buffer, size = [], 0
+    for block in iter_blocks:
+        buffer.append(block)
+        size += len(block)
+        if size >= nb_warmup:
+            break
+    assert buffer, 'no features were given'
+    yield np.concatenate(buffer, axis=0)
+    for block in iter_blocks:
+        yield block
+
+
+def _update_gmm_from_statistics(gmm, stat_weight, stat_mean, stat_cov):
+    """ set the GMM parameters from (normalised) sufficient statistics """
+    stat_weight = np.maximum(stat_weight, 10 * np.finfo(float).eps)
+    gmm.weights_ = stat_weight / np.sum(stat_weight)
+    gmm.means_ = stat_mean / stat_weight[:, np.newaxis]
+    covs = stat_cov / stat_weight[:, np.newaxis, np.newaxis]
+    covs -= np.einsum('ki,kj->kij', gmm.means_, gmm.means_)
+    covs += gmm.reg_covar * np.eye(covs.shape[-1])
+    gmm.covariances_ = covs
+    gmm.precisions_cholesky_ = np.array([np.linalg.inv(np.linalg.cholesky(c)).T
+                                         for c in covs])
+    gmm.precisions_ = np.einsum('kij,klj->kil', gmm.precisions_cholesky_,
+                                gmm.precisions_cholesky_)
+    return gmm
+
+
+def estim_class_model_online(iter_features, nb_classes, estim_model='GMM',
+                             pca_coef=None, use_scaler=True,
+                             nb_warmup=STREAM_NB_WARMUP_SAMPLES,
+                             step_decay=STREAM_STEP_DECAY):
+    """ estimate the model (scaler, PCA, GMM) from a stream of feature blocks,
+    typically one block per image, without keeping all features in memory
+
+    The first blocks are merged to have at least `nb_warmup` samples,
+    the scaler and PCA are fitted on them and the mixture is initialised
+    by k-means. Then each block updates the sufficient statistics by stepwise
+    online EM with the step `(block_size / nb_seen) ** step_decay`;
+    for 'kmeans' the assignment is hard to the closest mean.
+
+    :param iter_features: iterator over feature blocks of shape [N, F]
+    :param int nb_classes: number of expected classes
+    :param str estim_model: used model, 'GMM' or 'kmeans' (with any suffix)
+    :param float pca_coef: range (0, 1) or None
+    :param bool use_scaler: whether use a scaler
+    :param int nb_warmup: number of samples for initialisation
+    :param float step_decay: step decay in range (0.5, 1)
+    :return: pipeline compatible with :func:`estim_class_model`
+
+    >>> np.random.seed(0)
+    >>> fts = np.row_stack([np.random.random((500, 3)) - 1,
+    ...                     np.random.random((500, 3)) + 1])
+    >>> np.random.shuffle(fts)
+    >>> mm = estim_class_model_online(np.array_split(fts, 10), 2, nb_warmup=200)
+    >>> mm.predict_proba(fts).shape
+    (1000, 2)
+    >>> y = mm.predict(fts)
+    >>> np.array_equal(y == y[0], (fts[:, 0] < 0) == (fts[0, 0] < 0))
+    True
+    >>> mm = estim_class_model_online(np.array_split(fts, 10), 2, 'kmeans',
+    ...                               pca_coef=0.95, nb_warmup=200)
+    >>> mm.predict_proba(fts).shape
+    (1000, 2)
+    """
+    estim_model = estim_model.split('_')[0]
+    assert estim_model in ('GMM', 'kmeans'), \
+        'not supported model for online estimation: %s' % estim_model
+    components = []
+    if use_scaler:
+        components += [('std_scaler', preprocessing.StandardScaler())]
+    if pca_coef is not None:
+        components += [('reduce_dim', decomposition.PCA(pca_coef))]
+    gmm = mixture.GaussianMixture(n_components=nb_classes,
+                                  covariance_type='full')
+
+    def _transform(data):
+        for _, comp in components:
+            data = comp.transform(data)
+        return data
+
+    nb_seen = 0
+    stats = None
+    for i, block in enumerate(_iterate_warmup_blocks(iter_features, nb_warmup)):
+        block = np.nan_to_num(np.asarray(block, dtype=float))
+        if len(block) == 0:
+            continue
+        if i == 0:
+            for _, comp in components:
+                block = comp.fit_transform(block)
+            kmeans = cluster.KMeans(n_clusters=nb_classes, init='k-means++')
+            resp = np.eye(nb_classes)[kmeans.fit_predict(block)]
+        else:
+            block = _transform(block)
+            if estim_model == 'kmeans':
+                dists = metrics.pairwise.euclidean_distances(block, gmm.means_)
+                resp = np.eye(nb_classes)[np.argmin(dists, axis=1)]
+            else:
+                resp = gmm.predict_proba(block)
+        nb_seen += len(block)
+        block_stats = (np.mean(resp, axis=0),
+                       np.dot(resp.T, block) / len(block),
+                       np.einsum('nk,ni,nj->kij', resp, block, block) / len(block))
+        if stats is None:
+            stats = block_stats
+        else:
+            step = (len(block) / float(nb_seen)) ** step_decay
+            stats = [(1 - step) * st + step * bst
+                     for st, bst in zip(stats, block_stats)]
+        _update_gmm_from_statistics(gmm, *stats)
+    gmm.converged_, gmm.n_iter_ = True, nb_seen
+
+    model = pipeline.Pipeline(components + [('model', gmm)])
+    return model
+
+
+def reservoir_subsample(iter_features, nb_samples, rand_seed=None):
+    """ uniformly sample fixed number of rows from a stream of feature blocks
+    (reservoir sampling) so the memory does not depend on the stream length
+
+    :param iter_features: iterator over feature blocks of shape [N, F]
+    :param int nb_samples: size of the reservoir
+    :param int rand_seed: random seed
+    :return ndarray: sampled features of shape [min(nb_samples, N_total), F]
+
+    >>> blocks = [np.arange(i * 10, (i + 1) * 10)[:, np.newaxis] for i in range(50)]
+    >>> sample = reservoir_subsample(blocks, 25, rand_seed=0)
+    >>> sample.shape
+    (25, 1)
+    >>> len(np.unique(sample)), np.max(sample) > 100
+    (25, True)
+    >>> reservoir_subsample(blocks[:2], 25).shape
+    (20, 1)
+    """
+    rnd = np.random.RandomState(rand_seed)
+    reservoir, nb_seen, nb_filled = None, 0, 0
+    for block in iter_features:
+        block = np.asarray(block)
+        if len(block) == 0:
+            continue
+        if reservoir is None:
+            reservoir = np.empty((nb_samples,) + block.shape[1:], dtype=block.dtype)
+        # fill the reservoir first
+        nb_fill = min(nb_samples - nb_filled, len(block))
+        reservoir[nb_filled:nb_filled + nb_fill] = block[:nb_fill]
+        nb_filled += nb_fill
+        nb_seen += nb_fill
+        block = block[nb_fill:]
+        if len(block) == 0:
+            continue
+        # each next sample replaces a random one with prob. nb_samples / nb_seen
+        idxs = rnd.randint(0, nb_seen + np.arange(1, len(block) + 1))
+        mask = idxs < nb_samples
+        reservoir[idxs[mask]] = block[mask]
+        nb_seen += len(block)
+    if reservoir is None:
+        return np.empty((0, 0))
+    return reservoir[:nb_filled]
+
+
+def compute_otsu_thresholds(features, nb_bins=OTSU_NB_BINS):
+    """ compute Otsu threshold for each feature dimension at once
+    from histograms with equal bins spanning the range of each dimension,
+    which equals to `skimage.filters.threshold_otsu` per column
+
+    :param ndarray features: features of shape [N, F]
+    :param int nb_bins: number of histogram bins
+    :return ndarray: thresholds of shape [F]
+
+    >>> np.random.seed(0)
+    >>> fts = np.column_stack([np.random.random(100) + np.arange(100) // 50,
+    ...                        np.zeros(100)])
+    >>> compute_otsu_thresholds(fts).round(2).tolist()
+    [0.95, 0.0]
+    >>> from skimage import filters
+    >>> float(filters.threshold_otsu(fts[:, 0]).round(2))
+    0.95
+    """
+    features = np.asarray(features, dtype=float)
+    nb_fts = features.shape[1]
+    f_min, f_max = np.min(features, axis=0), np.max(features, axis=0)
+    const = f_min == f_max
+    # the same bin edges and binning as `np.histogram` with last bin closed
+    edges = np.array([np.linspace(f_min[i], f_max[i], nb_bins + 1)
+                      for i in range(nb_fts)])
+    bins = np.array([np.searchsorted(edges[i], features[:, i], side='right')
+                     for i in range(nb_fts)]) - 1
+    bins[bins >= nb_bins] = nb_bins - 1
+    bins += np.arange(nb_fts)[:, np.newaxis] * nb_bins
+    hist = np.bincount(bins.ravel(), minlength=nb_fts * nb_bins)
+    hist = hist.reshape(nb_fts, nb_bins).astype(float)
+    centers = (edges[:, :-1] + edges[:, 1:]) / 2.
+
+    weight1 = np.cumsum(hist, axis=1)
+    weight2 = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean1 = np.cumsum(hist * centers, axis=1) / weight1
+        cumsum2 = np.cumsum((hist * centers)[:, ::-1], axis=1)
+        mean2 = (cumsum2 / weight2[:, ::-1])[:, ::-1]
+    variance12 = weight1[:, :-1] * weight2[:, 1:] \
+        * (mean1[:, :-1] - mean2[:, 1:]) ** 2
+    idx = np.argmax(np.nan_to_num(variance12), axis=1)
+    thresholds = centers[np.arange(nb_fts), idx]
+    thresholds[const] = f_min[const]
+    return thresholds
+
+
+def compute_multivarian_otsu(features, nb_bins=OTSU_NB_BINS):
     """ compute otsu individually over each sample dimension
     WARNING: this compute only localy  and since it does compare all
     combinations of orienting the asign for tight cases it may not decide
 
+    All thresholds are computed at once from histograms and the orientation
+    of all dimensions is aligned together (keeping the first one).
+
     :param ndarray features:
+    :param int nb_bins: number of histogram bins
     :return [bool]:
 
     >>> np.random.seed(0)
@@ -173,19 +395,17 @@ def compute_multivarian_otsu(features):
     >>> compute_multivarian_otsu(fts).astype(int)
     array([0, 0, 0, 0, 0, 1, 1, 1, 1, 1])
     """
-    ys = np.zeros(features.shape)
-    for i in range(features.shape[-1]):
-        thr = filters.threshold_otsu(features[:, i])
-        asign = features[:, i] > thr
-        if i > 0:
-            m = np.mean(ys[:, :i], axis=1)
-            d1 = np.mean(np.abs(asign - m))
-            d2 = np.mean(np.abs(~asign - m))
-            # check if for this dimension it wount be better to swap it
-            if d2 < d1:
-                asign = ~asign
-        ys[:, i] = asign
-    y = np.mean(ys, axis=1) > 0.5
+    thresholds = compute_otsu_thresholds(features, nb_bins)
+    asign = features > thresholds
+    signs = 2. * asign - 1.
+    # orientation maximising mutual agreement of dimensions is approximated
+    # by signs of the leading eigenvector of the agreement matrix
+    _, eig_vecs = np.linalg.eigh(np.dot(signs.T, signs))
+    flip = eig_vecs[:, -1] < 0
+    if flip[0]:
+        flip = ~flip
+    asign ^= flip
+    y = np.mean(asign, axis=1) > 0.5
     return y
 
 
@@ -265,6 +485,9 @@ def estim_class_model_kmeans(features, nb_classes, init_type='k-means++',
     (100,)
     >>> mm.predict_proba(fts).shape
     (100, 2)
+    >>> mm, y = estim_class_model_kmeans(fts, 2, init_type='Otsu')
+    >>> y[:50].tolist() == [y[0]] * 50 and y[50:].tolist() == [1 - y[0]] * 50
+    True
     """
     logging.debug('estimate Gaussian from k-means clustering for all given '
                   'features %r and %i components', features.shape, nb_classes)
@@ -273,6 +496,15 @@ def estim_class_model_kmeans(features, nb_classes, init_type='k-means++',
         quntiles = np.linspace(5, 95, nb_classes).tolist()
         init_perc = np.array(np.percentile(features, quntiles, axis=0))
         kmeans = cluster.KMeans(nb_classes, init=init_perc, max_iter=2, n_jobs=-1)
+    elif init_type == 'Otsu':
+        assert nb_classes == 2, 'Otsu initialisation is only for 2 classes'
+        y_init = compute_multivarian_otsu(features)
+        if np.all(y_init) or not np.any(y_init):
+            y_init = features[:, 0] > np.median(features[:, 0])
+        init_means = np.array([np.mean(features[~y_init], axis=0),
+                               np.mean(features[y_init], axis=0)])
+        kmeans = cluster.KMeans(nb_classes, init=init_means, max_iter=max_iter,
+                                n_init=1, n_jobs=-1)
     else:
         nb_inits = max(1, int(np.sqrt(max_iter)))
         kmeans = cluster.KMeans(nb_classes, init=init_type, max_iter=max_iter,
@@ -302,7 +534,8 @@ def get_vertexes_edges(segments):
 def compute_spatial_dist(centres, edges, relative=False):
     """ compute spatial distance between all neighbouring segments
 
-    :param [[int, int]] centres: superpixel centres
+    :param [[int, int]] centres: superpixel centres, it can be also an array
+        with a row per superpixel (faster, no patching of missing centres)
     :param [[int, int]] edges:
     :param bool relative: normalise the distances to mean distance
     :return:
@@ -316,21 +549,24 @@ def compute_spatial_dist(centres, edges, relative=False):
     array([ 2.5 ,  3.5 ,  3.  ,  3.  ,  1.12,  1.41,  1.12])
     >>> np.round(compute_spatial_dist(centres, edges, relative=True), 2)
     array([ 1.12,  1.57,  1.34,  1.34,  0.5 ,  0.63,  0.5 ])
+    >>> centres = superpixel_centers_array(segments)
+    >>> np.round(compute_spatial_dist(centres, edges, relative=True), 2)
+    array([ 1.12,  1.57,  1.34,  1.34,  0.5 ,  0.63,  0.5 ])
     """
     assert np.max(edges) < len(centres), \
         'max vertex %i exceed size of centres %i'\
         % (np.max(edges), len(centres))
-    ndim = np.max([len(c) for c in centres if c is not None])
-    # replace empy segments by a empty vector
-    for i, c in enumerate(centres):
-        if c is None or len(c) == 0:
-            centres[i] = [np.NaN] * ndim
-    centres = np.nan_to_num(centres)
-
-    vertex_1 = centres[np.asarray(edges)[:, 0]]
-    vertex_2 = centres[np.asarray(edges)[:, 1]]
-
-    dist = metrics.pairwise.paired_euclidean_distances(vertex_1, vertex_2)
+    if not isinstance(centres, np.ndarray) or centres.dtype == object:
+        ndim = np.max([len(c) for c in centres if c is not None])
+        # replace empy segments by a empty vector
+        for i, c in enumerate(centres):
+            if c is None or len(c) == 0:
+                centres[i] = [np.NaN] * ndim
+    centres = np.nan_to_num(np.asarray(centres, dtype=float))
+    edges = np.asarray(edges)
+
+    diff = centres[edges[:, 0]] - centres[edges[:, 1]]
+    dist = np.sqrt(np.sum(diff ** 2, axis=1))
     if relative:
         dist = dist / np.mean(dist)
     return dist
@@ -554,26 +790,159 @@ def compute_pairwise_cost(gc_regul, proba_shape,
     return pairwise_cost
 
 
+def _draw_graph_edges_debug(debug_visual, segments, edges, edge_weights):
+    """ draw graph edges over the mean image if it is in debug images """
+    img = debug_visual.get('slic_mean', None)
+    centres = superpixel_centers_array(segments)
+    return draw_graphcut_weighted_edges(segments, centres, edges,
+                                        edge_weights, img_bg=img)
+
+
 def insert_gc_debug_images(debug_visual, segments, graph_labels, unary_cost,
                            edges, edge_weights):
-    """ wrapper for placing intermediate variable to a dictionary """
+    """ wrapper for placing intermediate variable to a dictionary,
+    the images are rendered on demand if it is `LazyDebugVisual`
+    """
     if debug_visual is None:
         return
     debug_visual['segments'] = segments
     debug_visual['edges'] = edges
     debug_visual['edge_weights'] = edge_weights
-    debug_visual['imgs_unary_cost'] = draw_graphcut_unary_cost_segments(segments,
-                                                                        unary_cost)
-    img = debug_visual.get('slic_mean', None)
-    list_centres = superpixel_centers(segments)
-    debug_visual['img_graph_edges'] = \
-        draw_graphcut_weighted_edges(segments, list_centres, edges,
-                                     edge_weights, img_bg=img)
-    debug_visual['img_graph_segm'] = draw_color_labeling(segments, graph_labels)
+    set_debug_image(debug_visual, 'imgs_unary_cost',
+                    draw_graphcut_unary_cost_segments, segments, unary_cost)
+    set_debug_image(debug_visual, 'img_graph_edges', _draw_graph_edges_debug,
+                    debug_visual, segments, edges, edge_weights)
+    set_debug_image(debug_visual, 'img_graph_segm', draw_color_labeling,
+                    segments, graph_labels)
+
+
+def compute_segments_mean(segments, image):
+    """ compute mean value (colour) of each segment
+
+    :param ndarray segments: superpixels
+    :param ndarray image: input gray or color image
+    :return ndarray: np.array<nb_segments, nb_channels>
+
+    >>> segments = np.array([[0] * 3 + [1] * 3, [0] * 3 + [1] * 3])
+    >>> img = np.array([[0, 1, 2, 3, 4, 5], [6, 7, 8, 9, 10, 11]], dtype=float)
+    >>> compute_segments_mean(segments, img)
+    array([[ 4.],
+           [ 7.]])
+    >>> compute_segments_mean(segments, np.dstack([img, 2 * img]))
+    array([[  4.,   8.],
+           [  7.,  14.]])
+    """
+    nb_channels = image.shape[-1] if image.ndim > segments.ndim else 1
+    image = np.nan_to_num(np.reshape(image, (-1, nb_channels)))
+    segm_flat = segments.ravel()
+    nb_segments = np.max(segm_flat) + 1
+    counts = np.bincount(segm_flat, minlength=nb_segments).astype(float)
+    counts[counts == 0] = 1
+    means = np.empty((nb_segments, nb_channels))
+    for i in range(nb_channels):
+        means[:, i] = np.bincount(segm_flat, weights=image[:, i],
+                                  minlength=nb_segments) / counts
+    return means
+
+
+def _compute_edge_weights_dist(vertex_1, vertex_2, metric='l2'):
+    """ edge weight from distance between paired vertex values
+
+    :param ndarray vertex_1: values of the first vertex of all edges
+    :param ndarray vertex_2: values of the second vertex of all edges
+    :param str metric: type of the distance - 'l1', 'l2', 'lT'
+    :return ndarray:
+    """
+    diff = vertex_1 - vertex_2
+    if metric == 'l1':
+        dist = np.sum(np.abs(diff), axis=1)
+    elif metric == 'l2':
+        dist = np.sqrt(np.sum(diff ** 2, axis=1))
+    else:
+        dist = np.max(diff ** 2, axis=1)
+    return np.exp(- dist / (2 * np.std(dist) ** 2))
+
+
+def compute_edge_weights_types(edges, edge_types, centres=None, proba=None,
+                               colors=None, features=None):
+    """ compute edge weights for several types from precomputed
+    segment (superpixel) descriptors in a single pass
+
+    :param ndarray edges: np.array<nb_edges, 2>
+    :param [str] edge_types: list of edge types, see :func:`compute_edge_weights`
+    :param ndarray centres: centres of segments, see `superpixel_centers_array`
+    :param ndarray proba: probability of each superpixel and class
+    :param ndarray colors: mean colour for each segment
+    :param ndarray features: features for each segment (superpixel)
+    :return {str: ndarray}: edge weights for each edge type
+
+    >>> segments = np.array([[0] * 3 + [1] * 5 + [2] * 4,
+    ...                      [4] * 4 + [5] * 5 + [6] * 3])
+    >>> edges = np.array(get_vertexes_edges(segments)[1])
+    >>> np.random.seed(0)
+    >>> proba = np.random.random((segments.max() + 1, 2))
+    >>> weights = compute_edge_weights_types(
+    ...     edges, ['', 'spatial', 'model', 'model_l1'], proba=proba,
+    ...     centres=superpixel_centers_array(segments))
+    >>> sorted(weights.keys())
+    ['', 'model', 'model_l1', 'spatial']
+    >>> np.round(weights['spatial'], 3).tolist()
+    [0.776, 0.69, 2.776, 0.853, 2.194, 0.853, 0.69, 2.776, 0.776]
+    >>> np.round(weights['model_l1'], 3).tolist()
+    [0.026, 0.01, 0.001, 0.001, 0.035, 0.001, 0.006, 0.001, 0.001]
+    """
+    edges = np.asarray(edges)
+    vertexes = {}
+    spatial = None
+    dict_weights = {}
+    for edge_type in edge_types:
+        if edge_type.startswith('model'):
+            assert proba is not None, '"proba" is required'
+            metric = edge_type.split('_')[-1] if '_' in edge_type else 'lT'
+            values, metric = np.asarray(proba), metric
+        elif edge_type == 'color':
+            assert colors is not None, '"colors" is required'
+            values, metric = np.asarray(colors, dtype=float), 'l1'
+        elif edge_type == 'features':
+            assert features is not None, '"features" is required'
+            values = preprocessing.StandardScaler().fit_transform(features)
+            metric = 'l2'
+        else:
+            values, metric = None, None
+
+        if values is None:
+            edge_weights = np.ones(len(edges))
+        elif metric not in ('l1', 'l2', 'lT'):
+            logging.error('not implemented for: %s', metric)
+            edge_weights = np.ones(len(edges))
+        else:
+            if edge_type not in vertexes:
+                assert np.max(edges) < len(values), \
+                    'max vertex %i exceed size of values %r' \
+                    % (np.max(edges), values.shape)
+                vertexes[edge_type] = (values[edges[:, 0]],
+                                       values[edges[:, 1]])
+            edge_weights = _compute_edge_weights_dist(*vertexes[edge_type],
+                                                      metric=metric)
+
+        edge_weights = np.array(edge_weights, dtype=float)
+        if edge_type in EDGE_TYPES_SPATIAL:
+            if spatial is None:
+                assert centres is not None, '"centres" is required'
+                spatial = compute_spatial_dist(centres, edges, relative=True)
+            edge_weights /= spatial
+
+        # set the threshold for min edge weight
+        min_weight = 1. / MIN_MAX_EDGE_WEIGHT
+        max_weight = MIN_MAX_EDGE_WEIGHT
+        edge_weights[edge_weights < min_weight] = min_weight
+        edge_weights[edge_weights > max_weight] = max_weight
+        dict_weights[edge_type] = edge_weights
+    return dict_weights
 
 
 def compute_edge_weights(segments, image=None, features=None, proba=None,
-                         edge_type=''):
+                         edge_type='', centres=None, colors=None):
     """
     pp 32, http://www.coe.utah.edu/~cs7640/readings/graph_cuts_intro.pdf
     exp(- norm value diff) * (geom dist vertex)**-1
@@ -582,8 +951,11 @@ def compute_edge_weights(segments, image=None, features=None, proba=None,
     :param ndarry image: input image
     :param ndarry features: features for each segment (superpixel)
     :param ndarry proba: probability of each superpixel and class
-    :param str edge_type: contains edge type, if 'model', after '_' you can
-        specify the metric, eg. 'model_l2'
+    :param str|[str] edge_type: contains edge type, if 'model', after '_'
+        you can specify the metric, eg. 'model_l2'; if a list of types is
+        given, the weights are returned as a dictionary
+    :param ndarray centres: precomputed centres of segments
+    :param ndarray colors: precomputed mean colour of segments
     :return [[int, int]], [float]:
 
     >>> segments = np.array([[0] * 3 + [1] * 5 + [2] * 4,
@@ -613,52 +985,34 @@ def compute_edge_weights(segments, image=None, features=None, proba=None,
     ...                                        edge_type='model')
     >>> np.round(weights, 3).tolist()
     [0.001, 0.028, 1.122, 0.038, 0.117, 0.688, 0.487, 1.152, 0.282]
+    >>> edges, weights = compute_edge_weights(segments, img, features, proba,
+    ...                                       edge_type=['color', 'model'])
+    >>> sorted(weights.keys())
+    ['color', 'model']
+    >>> np.round(weights['model'], 3).tolist()
+    [0.001, 0.028, 1.122, 0.038, 0.117, 0.688, 0.487, 1.152, 0.282]
     """
     logging.debug('extraction segment connectivity...')
     _, edges = get_vertexes_edges(segments)
     # convert variables
-    edges = np.array(edges, dtype=np.int32)
+    edges = np.asarray(edges, dtype=np.int32)
     logging.debug('graph edges %r', edges.shape)
 
-    if edge_type.startswith('model'):
-        assert proba is not None, '"proba" is required'
-        metric = edge_type.split('_')[-1] if '_' in edge_type else 'lT'
-        edge_weights = compute_edge_model(edges, proba, metric)
-    elif edge_type == 'color':
+    edge_types = [edge_type] if isinstance(edge_type, str) else list(edge_type)
+    if 'color' in edge_types and colors is None:
         assert image is not None, '"image" is required'
         image_float = np.array(image, dtype=float)
         if np.max(image) > 1:
             image_float /= 255.
-        color, _ = compute_selected_features_img2d(image_float, segments,
-                                                   {'color': ['mean']})
-        vertex_1 = color[edges[:, 0]]
-        vertex_2 = color[edges[:, 1]]
-        dist = metrics.pairwise.paired_manhattan_distances(vertex_1, vertex_2)
-        weights = dist.astype(float) / (2 * np.std(dist) ** 2)
-        edge_weights = np.exp(- weights)
-    elif edge_type == 'features':
-        assert features is not None, '"features" is required'
-        features_norm = preprocessing.StandardScaler().fit_transform(features)
-        vertex_1 = features_norm[edges[:, 0]]
-        vertex_2 = features_norm[edges[:, 1]]
-        dist = metrics.pairwise.paired_euclidean_distances(vertex_1, vertex_2)
-        weights = dist.astype(float) / (2 * np.std(dist) ** 2)
-        edge_weights = np.exp(- weights)
-    else:
-        edge_weights = np.ones(len(edges))
-
-    edge_weights = np.array(edge_weights, dtype=float)
-    if edge_type in ['model', 'features', 'color', 'spatial']:
-        centres = superpixel_centers(segments)
-        spatial = compute_spatial_dist(centres, edges, relative=True)
-        edge_weights /= spatial
+        colors = compute_segments_mean(segments, image_float)
+    if centres is None and any(tp in EDGE_TYPES_SPATIAL for tp in edge_types):
+        centres = superpixel_centers_array(segments)
 
-    # set the threshold for min edge weight
-    min_weight = 1. / MIN_MAX_EDGE_WEIGHT
-    max_weight = MIN_MAX_EDGE_WEIGHT
-    edge_weights[edge_weights < min_weight] = min_weight
-    edge_weights[edge_weights > max_weight] = max_weight
-    return edges, edge_weights
+    dict_weights = compute_edge_weights_types(edges, edge_types, centres,
+                                              proba, colors, features)
+    if isinstance(edge_type, str):
+        return edges, dict_weights[edge_type]
+    return edges, dict_weights
 
 
 def segment_graph_cut_general(segments, proba, image=None, features=None,
@@ -739,7 +1093,7 @@ def segment_graph_cut_general(segments, proba, image=None, features=None,
                                          n_iter=-1)
 
     insert_gc_debug_images(debug_visual, segments, graph_labels,
-                           compute_unary_cost(proba), edges, edge_weights)
+                           unary_cost, edges, edge_weights)
     return graph_labels
 
 
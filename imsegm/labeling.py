@@ -12,6 +12,9 @@ import skimage.segmentation as sk_segm
 
 from imsegm.utilities.data_io import get_image2d_boundary_color
 
+#: percentiles of boundary distances reported by evaluation
+BOUNDARY_DIST_PERCENTILES = (50, 95)
+
 
 def neighbour_connect4(seg, label, pos):
     """ check incoherent part of the segmentation
@@ -31,6 +34,116 @@ def neighbour_connect4(seg, label, pos):
     return neighbour
 
 
+def contour_boundary_mask(seg, connectivity=1, include_boundary=False):
+    """ get boundaries of all labels at once, a pixel is on the boundary if
+    any of its neighbours has a different label; it works for 2D and 3D
+
+    :param ndarray seg: integer images, typically a segmentation
+    :param int connectivity: neighbourhood as in `ndimage.generate_binary_structure`
+        1 for 4-connectivity in 2D (6 in 3D), `seg.ndim` for 8 (26 in 3D)
+    :param bool include_boundary: assume that the object end with image boundary
+    :return ndarray: boolean boundary mask
+
+    >>> img = np.zeros((6, 6), dtype=int)
+    >>> img[1:5, 2:] = 1
+    >>> contour_boundary_mask(img).astype(int)
+    array([[0, 0, 0, 0, 0, 0],
+           [0, 1, 1, 1, 1, 0],
+           [0, 1, 1, 0, 0, 0],
+           [0, 1, 1, 0, 0, 0],
+           [0, 1, 1, 1, 1, 0],
+           [0, 0, 0, 0, 0, 0]])
+    >>> img = np.zeros((5, 5), dtype=int)
+    >>> img[:2, :2] = 1
+    >>> contour_boundary_mask(img, connectivity=1).astype(int)
+    array([[0, 0, 0, 0, 0],
+           [0, 1, 1, 0, 0],
+           [0, 1, 0, 0, 0],
+           [0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0]])
+    >>> contour_boundary_mask(img, connectivity=2).astype(int)
+    array([[0, 0, 0, 0, 0],
+           [0, 1, 1, 0, 0],
+           [0, 1, 1, 0, 0],
+           [0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0]])
+    """
+    seg = np.asarray(seg)
+    mask = np.zeros(seg.shape, dtype=bool)
+    struct = ndimage.generate_binary_structure(seg.ndim, connectivity)
+    # take just half of the symmetric neighbourhood and mark both sides
+    offsets = np.array(np.nonzero(struct)).T - 1
+    offsets = offsets[:len(offsets) // 2]
+    for offset in offsets:
+        sl_a = tuple(slice(max(-o, 0), seg.shape[i] - max(o, 0))
+                     for i, o in enumerate(offset))
+        sl_b = tuple(slice(max(o, 0), seg.shape[i] - max(-o, 0))
+                     for i, o in enumerate(offset))
+        diff = seg[sl_a] != seg[sl_b]
+        mask[sl_a] |= diff
+        mask[sl_b] |= diff
+    # pixels on the image boundary
+    for i in range(seg.ndim):
+        idx_border = [slice(None)] * seg.ndim
+        idx_border[i] = [0, -1]
+        mask[tuple(idx_border)] = include_boundary
+    return mask
+
+
+def contour_labels(seg, labels=None, connectivity=1, include_boundary=False,
+                   output='coords'):
+    """ get boundaries for several labels in a single pass
+
+    :param ndarray seg: integer images, typically a segmentation
+    :param [int] labels: selected labels, None for all in the segmentation
+    :param int connectivity: neighbourhood, see :func:`contour_boundary_mask`
+    :param bool include_boundary: assume that the object end with image boundary
+    :param str output: type of returned boundaries - 'mask' as binary images,
+        'coords' as array of coordinates or 'indices' as flat indices
+    :return {int: ndarray}: boundaries for each label
+
+    >>> img = np.zeros((6, 6), dtype=int)
+    >>> img[1:5, 2:] = 1
+    >>> img[2:4, 3:5] = 2
+    >>> contours = contour_labels(img, output='coords')
+    >>> sorted(contours.keys())
+    [0, 1, 2]
+    >>> contours[2].tolist()
+    [[2, 3], [2, 4], [3, 3], [3, 4]]
+    >>> contour_labels(img, labels=[1], output='indices')
+    {1: array([ 8,  9, 10, 14, 20, 26, 27, 28])}
+    >>> contour_labels(img, labels=[2], output='mask')[2].astype(int)
+    array([[0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 1, 1, 0],
+           [0, 0, 0, 1, 1, 0],
+           [0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0]])
+    """
+    assert output in ('mask', 'coords', 'indices'), \
+        'not supported output "%s"' % output
+    seg = np.asarray(seg)
+    mask = contour_boundary_mask(seg, connectivity, include_boundary)
+    if labels is None:
+        labels = np.unique(seg)
+
+    if output == 'mask':
+        return {lb: np.logical_and(mask, seg == lb) for lb in labels}
+
+    # sort boundary indices by label so each label is a continuous block
+    indices = np.flatnonzero(mask)
+    idx_labels = seg.ravel()[indices]
+    order = np.argsort(idx_labels, kind='mergesort')
+    indices, idx_labels = indices[order], idx_labels[order]
+    begins = np.searchsorted(idx_labels, labels, side='left')
+    ends = np.searchsorted(idx_labels, labels, side='right')
+    contours = {lb: indices[b:e] for lb, b, e in zip(labels, begins, ends)}
+    if output == 'coords':
+        contours = {lb: np.array(np.unravel_index(contours[lb], seg.shape)).T
+                    for lb in contours}
+    return contours
+
+
 def contour_binary_map(seg, label=1, include_boundary=False):
     """ get object boundaries
 
@@ -56,26 +169,10 @@ def contour_binary_map(seg, label=1, include_boundary=False):
            [0, 0, 1, 1, 1, 1],
            [0, 0, 0, 0, 0, 0]])
     """
-    w, h = seg.shape[:2]
-    # logger.debug('testing label {}'.format(label))
-    res = np.zeros((w, h), dtype=np.int)
-    for i in range(1, w - 1):
-        for j in range(1, h - 1):
-            # just for 4-connected
-            if seg[i, j] == label and neighbour_connect4(seg, label, (i, j)):
-                res[i, j] = 1
-    if include_boundary:
-        for i in range(0, w):
-            if seg[i, 0] == label:
-                res[i, 0] = 1
-            if seg[i, -1] == label:
-                res[i, -1] = 1
-        for j in range(0, h):
-            if seg[0, j] == label:
-                res[0, j] = 1
-            if seg[-1, j] == label:
-                res[-1, j] = 1
-    # logger.debug('matrix seg_pipe \total{}'.format(repr(res)))
+    seg = np.asarray(seg)
+    # just for 4-connected
+    mask = contour_boundary_mask(seg, include_boundary=include_boundary)
+    res = np.logical_and(mask, seg == label).astype(np.int)
     return res
 
 
@@ -95,25 +192,24 @@ def contour_coords(seg, label=1, include_boundary=False):
     [[1, 2], [1, 3], [1, 4], [2, 2], [3, 2], [4, 2], [4, 3], [4, 4],
      [1, 5], [2, 5], [3, 5], [4, 5]]
     """
+    seg = np.asarray(seg)
     w, h = seg.shape[:2]
-    # logger.debug('testing label {}'.format(label))
-    res = []
-    for i in range(1, w - 1):
-        for j in range(1, h - 1):
-            # just for 4-connected
-            if seg[i, j] == label and neighbour_connect4(seg, label, (i, j)):
-                res.append([i, j])
+    # just for 4-connected, inner part of the image
+    mask = contour_boundary_mask(seg)
+    res = np.argwhere(np.logical_and(mask, seg == label)).tolist()
     if include_boundary:
-        for i in range(0, w):
-            if seg[i, 0] == label:
-                res.append([i, 0])
-            if seg[i, -1] == label:
-                res.append([i, h - 1])
-        for j in range(0, h):
-            if seg[0, j] == label:
-                res.append([0, j])
-            if seg[-1, j] == label:
-                res.append([w - 1, j])
+        # the same order as walking along the image border
+        rows, cols = np.arange(w), np.arange(h)
+        coords = [np.c_[rows, np.zeros(w, dtype=int)],
+                  np.c_[rows, np.full(w, h - 1, dtype=int)],
+                  np.c_[np.zeros(h, dtype=int), cols],
+                  np.c_[np.full(h, w - 1, dtype=int), cols]]
+        valid = [seg[:, 0] == label, seg[:, -1] == label,
+                 seg[0, :] == label, seg[-1, :] == label]
+        for i in range(0, 4, 2):
+            pairs = np.stack(coords[i:i + 2], axis=1).reshape(-1, 2)
+            pairs_valid = np.stack(valid[i:i + 2], axis=1).ravel()
+            res += pairs[pairs_valid].tolist()
     return res
 
 
@@ -136,18 +232,18 @@ def binary_image_from_coords(coords, size):
            [0, 0, 0, 0, 0, 0]])
     """
     contour_map = np.zeros(size, dtype=np.int)
-    w, h = size
-    for cd in coords:
-        if 0 <= cd[0] < w and 0 <= cd[1] < h:
-            contour_map[cd[0], cd[1]] = 1
+    coords = np.asarray(coords, dtype=int).reshape(-1, len(size))
+    valid = np.all((coords >= 0) & (coords < np.asarray(size)), axis=1)
+    contour_map[tuple(coords[valid].T)] = 1
     return contour_map
 
 
-def compute_distance_map(seg, label=1):
+def compute_distance_map(seg, label=1, connectivity=1):
     """ compute distance from label boundaries
 
     :param ndarray seg: integer images, typically a segmentation
     :param int label: selected singe label in segmentation
+    :param int connectivity: neighbourhood, see :func:`contour_boundary_mask`
     :return ndarray:
 
     >>> img = np.zeros((6, 6), dtype=int)
@@ -161,11 +257,10 @@ def compute_distance_map(seg, label=1):
            [ 2.  ,  1.  ,  0.  ,  0.  ,  0.  ,  1.  ],
            [ 2.24,  1.41,  1.  ,  1.  ,  1.  ,  1.41]])
     """
-    contour_coord = contour_coords(seg, label)
-    # logger.debug('contour coordinates {}'.format(repr(contourCoord)))
-    contour_map = 1 - binary_image_from_coords(contour_coord, seg.shape)
-    dist = ndimage.distance_transform_edt(contour_map)
-    # logger.debug('distance map \total{}'.format(repr(dist)))
+    seg = np.asarray(seg)
+    contour = np.logical_and(contour_boundary_mask(seg, connectivity),
+                             seg == label)
+    dist = ndimage.distance_transform_edt(~contour)
     return dist
 
 
@@ -391,7 +486,23 @@ def mask_segm_labels(img_labeling, labels, mask_init=None):
     return mask
 
 
-def sequence_labels_merge(labels_stack, dict_colors, labels_free, change_label=-1):
+def _iterate_chunks(length, chunk_size=None):
+    """ iterate slices over an axis of given length by chunks
+
+    :param int length: length of the axis
+    :param int chunk_size: number of elements in a chunk, None for single chunk
+    :return: iterator over slices
+
+    >>> [(s.start, s.stop) for s in _iterate_chunks(7, 3)]
+    [(0, 3), (3, 6), (6, 7)]
+    """
+    chunk_size = length if not chunk_size else int(chunk_size)
+    for begin in range(0, max(length, 1), max(chunk_size, 1)):
+        yield slice(begin, min(begin + chunk_size, length))
+
+
+def sequence_labels_merge(labels_stack, dict_colors, labels_free, change_label=-1,
+                          chunk_size=None):
     """ the input is time series of labeled images and output idx labeled image
     with labels that was constant for all the time
     the special case is using free labels which can be assumed as any labeled
@@ -402,10 +513,15 @@ def sequence_labels_merge(labels_stack, dict_colors, labels_free, change_label=-
     - 10111100 -> 1
     - 00000000 -> CHANGE_LABEL
 
+    The label occurrences are counted for each pixel along the time axis
+    in a single pass; the stack may be a memory mapped array and it is
+    processed by chunks along the first spatial axis.
+
     :param ndarray labels_stack: np.array<date, height, width> input stack of labeled images
     :param {int: (int, int, int)} dict_colors: dictionary of labels-colors
     :param [int] labels_free: list of free labels
     :param int change_label: label that is set for non constant time series
+    :param int chunk_size: number of rows (first spatial axis) processed at once
     :return ndarray: np.array<height, width>
 
     >>> dict_colors = {0: [], 1: [], 2: []}
@@ -417,46 +533,120 @@ def sequence_labels_merge(labels_stack, dict_colors, labels_free, change_label=-
     array([-1])
     >>> sequence_labels_merge(np.array([[1], [0], [1], [1], [1], [1], [0], [0]]), dict_colors, [0])
     array([1])
+    >>> stack = np.array([[[1, 2, 0, 1]], [[0, 2, 0, 2]], [[1, 0, 0, 1]]])
+    >>> sequence_labels_merge(stack, dict_colors, [0], chunk_size=1)
+    array([[ 1,  2, -1, -1]])
     """
-    labels_stack = np.array(labels_stack)
+    if not isinstance(labels_stack, np.ndarray):
+        labels_stack = np.array(labels_stack)
     im_labels = np.full(labels_stack.shape[1:], change_label, dtype=np.int)
     labels_used = [lb for lb in dict_colors if lb not in labels_free]
-    lb_all = labels_used + labels_free + [change_label]
-    assert all(l in lb_all for l in np.unique(labels_stack)), 'some extra labels in image stack'
-    # generate mask of free labels
-    mask_free = mask_segm_labels(labels_stack, labels_free)
-    for lb in labels_used:
-        mask1 = mask_segm_labels(labels_stack, [lb], mask_free)
-        mask2 = mask_segm_labels(labels_stack, [lb])
-        mask = np.logical_and(np.all(mask1, axis=0), np.any(mask2, axis=0))
-        im_labels[mask] = lb
+    lb_all = np.array(sorted(set(labels_used + labels_free + [change_label])))
+    idx_used = np.searchsorted(lb_all, labels_used)
+    mask_lb_free = np.in1d(lb_all, labels_free)
+    nb_times = len(labels_stack)
+
+    for sl in _iterate_chunks(im_labels.shape[0] if im_labels.ndim else 1,
+                              chunk_size):
+        chunk = np.asarray(labels_stack[:, sl] if im_labels.ndim else labels_stack)
+        idx = np.clip(np.searchsorted(lb_all, chunk), 0, len(lb_all) - 1)
+        assert np.all(lb_all[idx] == chunk), 'some extra labels in image stack'
+        # count occurrence of each label for each pixel along time
+        nb_px = int(np.prod(chunk.shape[1:]))
+        idx_flat = idx.reshape(nb_times, nb_px) * nb_px + np.arange(nb_px)
+        counts = np.bincount(idx_flat.ravel(), minlength=len(lb_all) * nb_px)
+        counts = counts.reshape(len(lb_all), nb_px)
+        count_free = counts[mask_lb_free].sum(axis=0)
+        chunk_labels = np.full(nb_px, change_label, dtype=im_labels.dtype)
+        for lb, i in zip(labels_used, idx_used):
+            # all the time either the label or free and at least once the label
+            mask = np.logical_and(counts[i] + count_free == nb_times, counts[i] > 0)
+            chunk_labels[mask] = lb
+        if im_labels.ndim:
+            im_labels[sl] = chunk_labels.reshape(chunk.shape[1:])
+        else:
+            im_labels[...] = chunk_labels.reshape(())
     return im_labels
 
 
-def relabel_by_dict(labels, dict_labels):
+def relabel_by_lut(labels, lut, lb_min=0, chunk_size=None, out=None):
+    """ relabel an (integer) labeling with a lookup table, a single gather
+    per pixel; large arrays (e.g. memory mapped) may be processed by chunks
+    along the first axis and written to a given output array
+
+    :param ndarray labels: integer labeling
+    :param ndarray lut: lookup table, new label for each old label
+    :param int lb_min: old label corresponding to the first LUT entry
+    :param int chunk_size: number of elements along first axis processed at once
+    :param ndarray out: output array, if None a new one is created
+    :return ndarray:
+
+    >>> labels = np.array([[2, 1, 0], [3, 3, -1]])
+    >>> relabel_by_lut(labels, np.array([5, 0, 1, 0, 1]), lb_min=-1, chunk_size=1)
+    array([[0, 1, 0],
+           [1, 1, 5]])
+    """
+    lut = np.asarray(lut)
+    if out is None:
+        out = np.empty(labels.shape, dtype=lut.dtype)
+    if labels.ndim == 0:
+        out[...] = lut[int(labels) - lb_min]
+        return out
+    for sl in _iterate_chunks(labels.shape[0], chunk_size):
+        chunk = np.asarray(labels[sl])
+        out[sl] = lut[chunk - lb_min] if lb_min else lut[chunk]
+    return out
+
+
+def relabel_by_dict(labels, dict_labels, chunk_size=None, out=None):
     """ relabel according given dictionary of new - old labels
 
     :param ndarray labels:
     :param {int: [int]} dict_labels:
+    :param int chunk_size: number of elements along first axis processed at once
+    :param ndarray out: output array, if None a new one is created
     :return ndarray:
 
     >>> labels = np.array([2, 1, 0, 3, 3, 0, 2, 3, 0, 0])
     >>> relabel_by_dict(labels, {0: [1, 2], 1: [0, 3]}).tolist()
     [0, 0, 1, 1, 1, 1, 0, 1, 1, 1]
+    >>> relabel_by_dict(labels.astype(float), {0: [1, 2], 1: [0, 3]}).tolist()
+    [0.0, 0.0, 1.0, 1.0, 1.0, 1.0, 0.0, 1.0, 1.0, 1.0]
     """
     assert dict_labels is not None, '"dict_labels" is required'
-    labels_new = np.zeros_like(labels)
-    for lb_new in dict_labels:
-        for lb_old in dict_labels[lb_new]:
-            labels_new[labels == lb_old] = lb_new
-    return labels_new
-
-
-def merge_probab_labeling_2d(proba, dict_labels):
+    labels = labels if isinstance(labels, np.ndarray) else np.array(labels)
+    pairs = [(lb_new, lb_old) for lb_new in dict_labels
+             for lb_old in dict_labels[lb_new]]
+    if not np.issubdtype(labels.dtype, np.integer):
+        # general values, relabel the unique values
+        uq_labels, labels_inv = np.unique(labels, return_inverse=True)
+        lut = np.zeros(len(uq_labels), dtype=labels.dtype)
+        for lb_new, lb_old in pairs:
+            lut[uq_labels == lb_old] = lb_new
+        labels_new = lut[labels_inv].reshape(labels.shape)
+        if out is not None:
+            out[...] = labels_new
+            return out
+        return labels_new
+
+    lbs_old = [lb for _, lb in pairs]
+    lb_min = min([0] + lbs_old) if labels.size == 0 \
+        else min([labels.min()] + lbs_old)
+    lb_max = max([0] + lbs_old) if labels.size == 0 \
+        else max([labels.max()] + lbs_old)
+    lut = np.zeros(lb_max - lb_min + 1, dtype=labels.dtype)
+    # keep the order, later assignments overwrite the previous
+    for lb_new, lb_old in pairs:
+        lut[lb_old - lb_min] = lb_new
+    return relabel_by_lut(labels, lut, lb_min, chunk_size, out)
+
+
+def merge_probab_labeling_2d(proba, dict_labels, chunk_size=None):
     """ merging probability labeling
 
     :param ndarray proba: probabilities
     :param {int: [int]} dict_labels:
+    :param int chunk_size: number of rows processed at once
     :return ndarray:
 
     >>> p = np.ones((5, 5))
@@ -473,11 +663,14 @@ def merge_probab_labeling_2d(proba, dict_labels):
     assert proba.ndim == 3
     assert dict_labels is not None, '"dict_labels" is required'
     max_label = max(dict_labels.keys()) + 1
+    # merging matrix, for each old label and new label the contribution
+    merge = np.zeros((proba.shape[-1], max_label))
+    for lb_new in dict_labels:
+        np.add.at(merge[:, lb_new], np.asarray(dict_labels[lb_new], dtype=int), 1)
     size = proba.shape[:-1] + (max_label,)
     proba_new = np.zeros(size)
-    for lb_new in dict_labels:
-        lbs_old = dict_labels[lb_new]
-        proba_new[:, :, lb_new] = np.sum(proba[:, :, lbs_old], axis=-1)
+    for sl in _iterate_chunks(proba.shape[0], chunk_size):
+        proba_new[sl] = np.dot(np.asarray(proba[sl]), merge)
     return proba_new
 
 
@@ -696,11 +889,8 @@ def compute_boundary_distances(segm_ref, segm):
     """
     assert segm_ref.shape == segm.shape, 'Ref. segm %r and segm %r should match' \
                                          % (segm_ref.shape, segm.shape)
-    grid_y, grid_x = np.meshgrid(range(segm_ref.shape[1]),
-                                 range(segm_ref.shape[0]))
     segr_boundary = sk_segm.find_boundaries(segm_ref, mode='thick')
-    points = np.array([grid_x[segr_boundary].ravel(),
-                       grid_y[segr_boundary].ravel()]).T
+    points = np.argwhere(segr_boundary)
     segm_boundary = sk_segm.find_boundaries(segm, mode='thick')
     segm_distance = ndimage.distance_transform_edt(~segm_boundary)
     dist = segm_distance[segr_boundary].ravel()
@@ -710,6 +900,128 @@ def compute_boundary_distances(segm_ref, segm):
     return points, dist
 
 
+def _grouped_percentiles(values, groups, nb_groups, percentiles):
+    """ linearly interpolated percentiles of values for each group
+
+    :param ndarray values: values
+    :param ndarray groups: group index for each value in range(nb_groups)
+    :param int nb_groups: number of groups
+    :param [float] percentiles: percentiles in range (0, 100)
+    :return ndarray: np.array<nb_groups, nb_percentiles>, NaN for empty groups
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=nb_groups)
+    begins = np.r_[0, np.cumsum(counts)[:-1]]
+    res = np.full((nb_groups, len(percentiles)), np.nan)
+    valid = counts > 0
+    for i, perc in enumerate(percentiles):
+        pos = (counts[valid] - 1) * perc / 100.
+        low = np.floor(pos).astype(int)
+        high = np.ceil(pos).astype(int)
+        val_low = values[begins[valid] + low]
+        val_high = values[begins[valid] + high]
+        res[valid, i] = val_low + (val_high - val_low) * (pos - low)
+    return res
+
+
+def compute_boundary_distance_stats(segm_ref, segm,
+                                    percentiles=BOUNDARY_DIST_PERCENTILES):
+    """ compute symmetric distances between boundaries of two segmentation
+    for all labels of the reference segmentation at once, using a single
+    distance transform per segmentation
+
+    The boundary points are assigned to the reference label at their position.
+    All the segmentation boundary points count in the symmetric statistics,
+    so they are sensitive to the oversegmentation (e.g. superpixels) and
+    to spurious segmented objects. The `*_matched` statistics use only
+    the segmentation boundary points which are the nearest one for some
+    reference boundary point, so the internal edges are ignored.
+
+    :param ndarray segm_ref: reference segmentation
+    :param ndarray segm: input segmentation
+    :param [float] percentiles: percentiles of the symmetric distances
+    :return {str: ndarray}: statistic for each label of the reference,
+        `nb_ref2segm` is the number of reference boundary points
+
+    >>> segm_ref = np.zeros((6, 10), dtype=int)
+    >>> segm_ref[3:4, 4:5] = 1
+    >>> segm = np.zeros((6, 10), dtype=int)
+    >>> segm[:, 2:9] = 1
+    >>> stat = compute_boundary_distance_stats(segm_ref, segm)
+    >>> sorted(stat.keys())  # doctest: +NORMALIZE_WHITESPACE
+    ['hausdorff', 'hausdorff_matched', 'label', 'mean', 'mean_ref2segm',
+     'mean_segm2ref', 'mean_segm2ref_matched', 'nb_ref2segm',
+     'percentile_50', 'percentile_95']
+    >>> stat['label'].tolist()
+    [0, 1]
+    >>> stat['mean_ref2segm'].tolist()
+    [2.0, 2.0]
+    >>> stat['hausdorff'].tolist(), stat['hausdorff_matched'].tolist()
+    ([5.0, 2.0], [3.0, 2.0])
+    >>> segm_ref = np.zeros((10, 20), dtype=int)
+    >>> segm_ref[2:8, 2:8] = 1
+    >>> segm = segm_ref.copy()
+    >>> segm[:, 15:] = 2  # internal edge of oversegmentation
+    >>> stat = compute_boundary_distance_stats(segm_ref, segm)
+    >>> np.round(stat['hausdorff'], 2).tolist()
+    [7.28, 0.0]
+    >>> stat['mean_segm2ref_matched'].tolist(), stat['hausdorff_matched'].tolist()
+    ([0.0, 0.0], [0.0, 0.0])
+    """
+    assert segm_ref.shape == segm.shape, 'Ref. segm %r and segm %r should match' \
+                                         % (segm_ref.shape, segm.shape)
+    labels, segm_ref_idx = np.unique(segm_ref, return_inverse=True)
+    segm_ref_idx = segm_ref_idx.reshape(segm_ref.shape)
+    nb_labels = len(labels)
+
+    segr_boundary = sk_segm.find_boundaries(segm_ref, mode='thick')
+    segm_boundary = sk_segm.find_boundaries(segm, mode='thick')
+    # one distance transform per segmentation
+    dist_segm, idx_nearest = ndimage.distance_transform_edt(
+        ~segm_boundary, return_indices=True)
+    dist_ref = ndimage.distance_transform_edt(~segr_boundary)
+    dist_ref2segm = dist_segm[segr_boundary]
+    dist_segm2ref = dist_ref[segm_boundary]
+    lbs_ref2segm = segm_ref_idx[segr_boundary]
+    lbs_segm2ref = segm_ref_idx[segm_boundary]
+    # the segmentation boundary points nearest to the reference ones
+    segm_matched = np.zeros_like(segm_boundary)
+    segm_matched[tuple(idx[segr_boundary] for idx in idx_nearest)] = True
+    dist_matched = dist_ref[segm_matched]
+    lbs_matched = segm_ref_idx[segm_matched]
+
+    def _mean(dist, lbs):
+        counts = np.bincount(lbs, minlength=nb_labels).astype(float)
+        sums = np.bincount(lbs, weights=dist, minlength=nb_labels)
+        counts[counts == 0] = np.nan
+        return sums / counts
+
+    def _max(dist, lbs):
+        res = np.full(nb_labels, -np.inf)
+        np.maximum.at(res, lbs, dist)
+        res[np.isinf(res)] = np.nan
+        return res
+
+    dists = np.concatenate([dist_ref2segm, dist_segm2ref])
+    lbs = np.concatenate([lbs_ref2segm, lbs_segm2ref])
+    stat = {
+        'label': labels,
+        'nb_ref2segm': np.bincount(lbs_ref2segm, minlength=nb_labels),
+        'mean_ref2segm': _mean(dist_ref2segm, lbs_ref2segm),
+        'mean_segm2ref': _mean(dist_segm2ref, lbs_segm2ref),
+        'mean_segm2ref_matched': _mean(dist_matched, lbs_matched),
+        'mean': _mean(dists, lbs),
+        'hausdorff': _max(dists, lbs),
+        'hausdorff_matched': _max(np.concatenate([dist_ref2segm, dist_matched]),
+                                  np.concatenate([lbs_ref2segm, lbs_matched])),
+    }
+    percs = _grouped_percentiles(dists, lbs, nb_labels, percentiles)
+    for i, perc in enumerate(percentiles):
+        stat['percentile_%g' % perc] = percs[:, i]
+    return stat
+
+
 def assume_bg_on_boundary(segm, bg_label=0, boundary_size=1):
     """ swap labels such that the background label will be mostly on image boundary
 
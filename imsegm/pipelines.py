@@ -13,7 +13,10 @@ import skimage.color as sk_color
 # from sklearn import mixture
 
 from imsegm.utilities.experiments import WrapExecuteSequence
-from imsegm.graph_cuts import segment_graph_cut_general, estim_class_model
+from imsegm.utilities.drawing import set_debug_image
+from imsegm.graph_cuts import (
+    segment_graph_cut_general, estim_class_model, estim_class_model_online,
+    reservoir_subsample)
 from imsegm.superpixels import segment_slic_img2d, segment_slic_img3d_gray
 from imsegm.descriptors import (
     FEATURES_SET_COLOR, norm_features, compute_selected_features_img2d,
@@ -29,6 +32,10 @@ CLASSIF_NAME = DEFAULT_CLASSIF_NAME
 CLUSTER_METHOD = DEFAULT_CLUSTERING
 CROSS_VAL_LEAVE_OUT = 2
 NB_THREADS = max(1, int(mproc.cpu_count() * 0.6))
+#: default size of a feature reservoir for streaming model estimation
+STREAM_NB_SAMPLES = int(1e5)
+#: memory budget (in MB) of images and features collected for one prediction
+BATCH_PREDICT_MEMORY_MB = 512
 
 
 def pipe_color2d_slic_features_model_graphcut(image, nb_classes, dict_features,
@@ -74,7 +81,8 @@ def pipe_color2d_slic_features_model_graphcut(image, nb_classes, dict_features,
             image = np.rollaxis(np.tile(image, (3, 1, 1)), 0, 3)
         debug_visual['image'] = image
         debug_visual['slic'] = slic
-        debug_visual['slic_mean'] = sk_color.label2rgb(slic, image, kind='avg')
+        set_debug_image(debug_visual, 'slic_mean', sk_color.label2rgb,
+                        slic, image, kind='avg')
 
     model = estim_class_model(features, nb_classes, estim_model,
                               pca_coef, use_scaler)
@@ -98,10 +106,17 @@ def pipe_color2d_slic_features_model_graphcut(image, nb_classes, dict_features,
 def estim_model_classes_group(list_images, nb_classes, dict_features,
                               sp_size=30, sp_regul=0.2,
                               use_scaler=True, pca_coef=None, model_type='GMM',
+                              stream=None, nb_samples=STREAM_NB_SAMPLES,
                               nb_workers=NB_THREADS):
     """ estimate a model from sequence of input images and return it as result
 
-    :param [ndarray] list_images:
+    For large groups of images the features does not have to be concatenated,
+    the `stream` mode consumes them per image: 'online' fits GMM (or k-means)
+    incrementally, see :func:`estim_class_model_online`, and 'reservoir'
+    fits the standard model on a uniform subsample of `nb_samples` features.
+
+    :param [ndarray] list_images: images, also a sized lazy iterable
+        (e.g. `ImagePrefetchLoader`) which is consumed while computing
     :param int nb_classes: number of classes
     :param int sp_size: initial size of a superpixel(meaning edge lenght)
     :param float sp_regul: regularisation in range(0;1) where "0" gives elastic
@@ -110,16 +125,45 @@ def estim_model_classes_group(list_images, nb_classes, dict_features,
     :param float pca_coef: range (0, 1) or None
     :param bool use_scaler: whether use a scaler
     :param str model_type: model type
+    :param str stream: streaming mode - None, 'online' or 'reservoir'
+    :param int nb_samples: reservoir size or number of warm-up samples
     :param int nb_workers: number of jobs running in parallel
-    :return:
+    :return: model and list of features per image (None in streaming mode)
+
+    >>> np.random.seed(0)
+    >>> images = [np.random.random((50, 50, 3)) for _ in range(3)]
+    >>> for img in images:
+    ...     img[:, 25:] += 1
+    >>> model, fts = estim_model_classes_group(images, 2, {'color': ['mean']},
+    ...     sp_size=10, stream='online', nb_samples=30, nb_workers=1)
+    >>> model.predict_proba(np.ones((1, 3))).shape, fts
+    ((1, 2), None)
+    >>> model, _ = estim_model_classes_group(images, 2, {'color': ['mean']},
+    ...     sp_size=10, stream='reservoir', nb_samples=30, nb_workers=1)
+    >>> model.predict_proba(np.ones((1, 3))).shape
+    (1, 2)
     """
-    list_slic, list_features = list(), list()
+    assert stream in (None, 'online', 'reservoir'), \
+        'not supported streaming mode: %s' % stream
     _wrapper_compute = partial(compute_color2d_superpixels_features,
                                sp_size=sp_size, sp_regul=sp_regul,
                                dict_features=dict_features)
     iterate = WrapExecuteSequence(_wrapper_compute, list_images,
                                   desc='compute SLIC & features',
                                   nb_workers=nb_workers)
+    if stream is not None:
+        iter_features = (np.nan_to_num(fts) for _, fts in iterate)
+        if stream == 'online':
+            model = estim_class_model_online(iter_features, nb_classes,
+                                             model_type, pca_coef, use_scaler,
+                                             nb_warmup=nb_samples)
+        else:
+            features = reservoir_subsample(iter_features, nb_samples)
+            model = estim_class_model(features, nb_classes, model_type,
+                                      pca_coef, use_scaler)
+        return model, None
+
+    list_slic, list_features = list(), list()
     for slic, features in iterate:
         list_slic.append(slic)
         list_features.append(features)
@@ -187,14 +231,6 @@ def segment_color2d_slic_features_model_graphcut(image, model_pipeline,
     slic, features = compute_color2d_superpixels_features(image, dict_features,
                                                           sp_size=sp_size,
                                                           sp_regul=sp_regul)
-
-    if debug_visual is not None:
-        if image.ndim == 2:  # duplicate channels to be like RGB
-            image = np.rollaxis(np.tile(image, (3, 1, 1)), 0, 3)
-        debug_visual['image'] = image
-        debug_visual['slic'] = slic
-        debug_visual['slic_mean'] = sk_color.label2rgb(slic, image, kind='avg')
-
     proba = model_pipeline.predict_proba(features)
     logging.debug('list of probabilities: %r', proba.shape)
 
@@ -203,18 +239,118 @@ def segment_color2d_slic_features_model_graphcut(image, model_pipeline,
     # gmm.fit(features, np.argmax(proba, axis=1))
     # proba = gmm.predict_proba(features)
 
+    classes = getattr(model_pipeline, 'classes_', None)
+    return segment_color2d_slic_proba_graphcut(image, slic, features, proba,
+                                               gc_regul, gc_edge_type,
+                                               classes=classes,
+                                               debug_visual=debug_visual)
+
+
+def segment_color2d_slic_proba_graphcut(image, slic, features, proba,
+                                        gc_regul=1., gc_edge_type='model',
+                                        classes=None, debug_visual=None):
+    """ the graphCut stage of the pipeline for already predicted probabilities
+    of superpixels, so the prediction can be done for many images at once
+
+    :param ndarray image: input RGB image
+    :param ndarray slic: superpixels
+    :param ndarray features: features per superpixel
+    :param ndarray proba: probabilities of classes per superpixel
+    :param float gc_regul: GC regularisation
+    :param str gc_edge_type: select the GC edge type
+    :param ndarray classes: mapping from GC labels to classes of a classifier
+    :param debug_visual: {str: ...}
+    :return [[int]]: segmentation matrix mapping each pixel into a class
+
+    >>> np.random.seed(0)
+    >>> image = np.random.random((20, 30, 3))
+    >>> slic = np.repeat(np.repeat(np.arange(6).reshape(2, 3), 10, 0), 10, 1)
+    >>> proba = np.array([[0.9, 0.1], [0.8, 0.2], [0.3, 0.7]] * 2)
+    >>> segm, seg_soft = segment_color2d_slic_proba_graphcut(
+    ...     image, slic, np.zeros((6, 1)), proba, gc_regul=0., classes=[1, 2])
+    >>> segm[::10, ::10]
+    array([[1, 1, 2],
+           [1, 1, 2]])
+    >>> seg_soft.shape
+    (20, 30, 2)
+    """
+    if debug_visual is not None:
+        if image.ndim == 2:  # duplicate channels to be like RGB
+            image = np.rollaxis(np.tile(image, (3, 1, 1)), 0, 3)
+        debug_visual['image'] = image
+        debug_visual['slic'] = slic
+        set_debug_image(debug_visual, 'slic_mean', sk_color.label2rgb,
+                        slic, image, kind='avg')
+
     segm_soft = proba[slic]
 
     graph_labels = segment_graph_cut_general(slic, proba, image, features,
                                              gc_regul, gc_edge_type,
                                              debug_visual=debug_visual)
     # relabel according classif classes
-    if hasattr(model_pipeline, 'classes_'):
-        graph_labels = model_pipeline.classes_[graph_labels]
+    if classes is not None:
+        graph_labels = np.asarray(classes)[graph_labels]
     segm = graph_labels[slic]
     return segm, segm_soft
 
 
+def iterate_batches_memory(iterable, memory_mb=BATCH_PREDICT_MEMORY_MB):
+    """ group items of a sequence into batches so that the total size of arrays
+    in a batch fits the memory budget, each batch has at least one item
+
+    :param iterable: sequence of arrays or tuples of arrays (other are ignored)
+    :param float memory_mb: memory budget of a single batch in MB
+    :return: generator of lists of items
+
+    >>> items = [np.zeros(n, dtype=np.uint8) for n in [300, 500, 400, 900]]
+    >>> [[len(a) for a in b] for b in iterate_batches_memory(items, 1e-3)]
+    [[300, 500], [400], [900]]
+    """
+    def _nbytes(item):
+        items = item if isinstance(item, (tuple, list)) else [item]
+        return sum(getattr(it, 'nbytes', 0) for it in items)
+
+    limit = memory_mb * 1024 ** 2
+    batch, size = [], 0
+    for item in iterable:
+        item_size = _nbytes(item)
+        if batch and size + item_size > limit:
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield batch
+
+
+def predict_proba_batch(model, list_features):
+    """ predict probabilities for features of many images by a single call
+    of the model and split them back per image
+
+    :param obj model: trained model with `predict_proba`
+    :param [ndarray] list_features: list of features per image
+    :return [ndarray]: list of probabilities per image
+
+    >>> from sklearn.neighbors import KNeighborsClassifier
+    >>> clf = KNeighborsClassifier(n_neighbors=1)
+    >>> _ = clf.fit([[0], [1]], [0, 1])
+    >>> [p.shape for p in predict_proba_batch(clf, [[[0], [1]], [[1]], []])]
+    [(2, 2), (1, 2), (0, 2)]
+    >>> [p.shape for p in predict_proba_batch(clf, [[], []])]
+    [(0, 2), (0, 2)]
+    """
+    list_features = [np.asarray(fts) for fts in list_features]
+    sizes = [len(fts) for fts in list_features]
+    if sum(sizes) == 0:
+        # no features at all, the model would fail on empty input
+        return [np.empty((0, len(model.classes_)))] * len(sizes)
+    features = np.vstack([fts for fts in list_features if len(fts) > 0])
+    proba = model.predict_proba(features)
+    logging.debug('batch of probabilities: %r for %i images',
+                  proba.shape, len(sizes))
+    return np.split(proba, np.cumsum(sizes)[:-1])
+
+
 def compute_color2d_superpixels_features(image, dict_features,
                                          sp_size=30, sp_regul=0.2):
     """ segment image into superpixels and estimate features per superpixel
@@ -32,13 +32,49 @@ RG2SP_THRESHOLDS = {
 }
 
 
+def compute_graphcut_slic_context(slic, segm):
+    """ precompute all what depends only on superpixels and the segmentation
+    for object segmentation on superpixels, so it can be reused among
+    several runs with different parameters on the same image
+
+    :param ndarray slic: superpixel pre-segmentation
+    :param ndarray segm: input structure segmentation
+    :return {str: ...}: superpixel centres, labels, graph edges and their lengths
+
+    >>> slic = np.array([[0] * 3 + [1] * 3 + [2] * 3 + [3] * 3 + [4] * 3,
+    ...                  [5] * 3 + [6] * 3 + [7] * 3 + [8] * 3 + [9] * 3])
+    >>> segm = np.array([[0] * 15, [1] * 12 + [0] * 3])
+    >>> gc_context = compute_graphcut_slic_context(slic, segm)
+    >>> sorted(gc_context.keys())  # doctest: +NORMALIZE_WHITESPACE
+    ['edges', 'labels', 'nb_segments', 'slic_points', 'spatial_dist']
+    >>> gc_context['labels']
+    array([0, 0, 0, 0, 0, 1, 1, 1, 1, 0])
+    >>> gc_context['edges'].shape
+    (13, 2)
+    """
+    label_hist = histogram_regions_labels_norm(slic, segm)
+    slic_points = superpixel_centers(slic)
+    _, edges = get_vertexes_edges(slic)
+    edges = np.array(edges)
+    # NOTE, it also replaces missing centres in the list
+    spatial_dist = compute_spatial_dist(slic_points, edges)
+    gc_context = {
+        'nb_segments': len(label_hist),
+        'labels': np.argmax(label_hist, axis=1),
+        'slic_points': np.array(slic_points, dtype=float),
+        'edges': edges,
+        'spatial_dist': spatial_dist,
+    }
+    return gc_context
+
+
 def object_segmentation_graphcut_slic(slic, segm, centres,
                                       labels_fg_prob=(0.1, 0.9),
                                       gc_regul=1, edge_coef=0.5,
                                       edge_type='model',
                                       coef_shape=0., shape_mean_std=(50., 10.),
                                       add_neighbours=False,
-                                      debug_visual=None):
+                                      debug_visual=None, gc_context=None):
     """ object segmentation using Graph Cut directly on super-pixel level
 
     :param ndarray slic: superpixel pre-segmentation
@@ -52,6 +88,10 @@ def object_segmentation_graphcut_slic(slic, segm, centres,
     :param shape_mean_std: mean and STD for shape prior
     :param bool add_neighbours: add also neighboring supepixels to the center
     :param {} debug_visual: dictionary with some intermediate results
+    :param {} gc_context: precomputed superpixel graph and labels,
+        see :func:`compute_graphcut_slic_context`; if an empty dictionary
+        is given, it is filled so it can be passed to following calls
+        with the same superpixels and segmentation
     :return [[int]]:
 
     >>> slic = np.array([[0] * 3 + [1] * 3 + [2] * 3 + [3] * 3 + [4] * 3,
@@ -63,10 +103,23 @@ def object_segmentation_graphcut_slic(slic, segm, centres,
     >>> object_segmentation_graphcut_slic(slic, segm, [(1, 7)],
     ...                              gc_regul=1., edge_coef=1., debug_visual={})
     array([0, 0, 0, 0, 0, 1, 1, 1, 1, 0], dtype=int32)
+    >>> gc_context = {}
+    >>> object_segmentation_graphcut_slic(slic, segm, [(1, 7)], gc_regul=1.,
+    ...                              edge_coef=1., gc_context=gc_context)
+    array([0, 0, 0, 0, 0, 1, 1, 1, 1, 0], dtype=int32)
+    >>> object_segmentation_graphcut_slic(slic, segm, [(1, 7)], gc_regul=0.,
+    ...                              coef_shape=1., gc_context=gc_context)
+    array([0, 0, 0, 0, 0, 1, 1, 1, 1, 0], dtype=int32)
     """
     assert np.min(labels_fg_prob) < 1, 'non label can ce strictly 1'
-    label_hist = histogram_regions_labels_norm(slic, segm)
-    labels = np.argmax(label_hist, axis=1)
+    if gc_context is None:
+        gc_context = {}
+    if not gc_context:
+        gc_context.update(compute_graphcut_slic_context(slic, segm))
+    assert gc_context['nb_segments'] == np.max(slic) + 1, \
+        'the context (%i) does not match the superpixels (%i)' \
+        % (gc_context['nb_segments'], np.max(slic) + 1)
+    labels = gc_context['labels']
 
     assert segm.max() <= len(labels_fg_prob), \
         'table of label proba is shorter then the nb of labels in segmentation'
@@ -75,27 +128,25 @@ def object_segmentation_graphcut_slic(slic, segm, centres,
 
     assert list(centres), 'at least one center has to be given'
     centres = [np.round(c).astype(int) for c in centres]
-    slic_points = superpixel_centers(slic)
+    slic_points = gc_context['slic_points']
 
     proba = np.ones((len(labels), len(centres) + 1))
     proba[:, 0] = labels_bg_prob[labels]
-    for i, centre in enumerate(centres):
-        proba[:, i + 1] = labels_fg_prob[labels]
+    proba[:, 1:] = labels_fg_prob[labels][:, np.newaxis]
 
     shape = np.ones((len(labels), len(centres) + 1))
     if coef_shape > 0:
         shape_mean, shape_std = shape_mean_std
         shape[:, 0] = labels_bg_prob[labels]
         for i, centre in enumerate(centres):
-            diff = slic_points - np.tile(centre, (len(slic_points), 1))
-            dist = np.sqrt(np.sum(diff ** 2, axis=1))
+            dist = np.sqrt(np.sum((slic_points - centre) ** 2, axis=1))
             cdf = stats.norm.cdf(range(int(np.max(dist) + 1)),
                                  shape_mean, shape_std)
             cum = 1. - cdf + 1e-9
             shape[:, i + 1] = cum[dist.astype(int)]
 
-    _, edges = get_vertexes_edges(slic)
-    edges = np.array(edges)
+    edges = gc_context['edges'].copy()
+    edges_changed = np.zeros(len(edges), dtype=bool)
 
     unary_cost = - np.log(proba) - coef_shape * np.log(shape)
     for i, pos in enumerate(centres):
@@ -108,6 +159,7 @@ def object_segmentation_graphcut_slic(slic, segm, centres,
             for v in near.ravel():
                 unary_cost[v, i + 1] = 0
             edges[mask] = 0
+            edges_changed[mask] = True
 
     # remove too small unary terms
     min_unary = -np.log(MAX_UNARY_PROB)
@@ -120,9 +172,10 @@ def object_segmentation_graphcut_slic(slic, segm, centres,
         vertex_2 = proba_fg[edges[:, 1]]
         dist = np.abs(vertex_1 - vertex_2)
         edge_weights = np.exp(- dist / (2 * np.std(dist) ** 2))
-        slic_centres = superpixel_centers(slic)
-        spatial_dist = compute_spatial_dist(slic_centres, edges, relative=True)
-        edge_weights /= spatial_dist
+        # the changed edges are loops with zero length
+        spatial_dist = gc_context['spatial_dist'].copy()
+        spatial_dist[edges_changed] = 0
+        edge_weights /= spatial_dist / np.mean(spatial_dist)
     else:
         edge_weights = np.ones(len(edges))
 
@@ -149,7 +202,7 @@ def object_segmentation_graphcut_pixels(segm, centres,
                                         labels_fg_prob=(0.1, 0.9),
                                         gc_regul=1, seed_size=0, coef_shape=0.,
                                         shape_mean_std=(50., 10.),
-                                        debug_visual=None):
+                                        debug_visual=None, roi_size=None):
     """ object segmentation using Graph Cut directly on pixel level
 
     :param ndarray centres:
@@ -161,6 +214,9 @@ def object_segmentation_graphcut_pixels(segm, centres,
     :param float coef_shape: set the weight of shape prior
     :param shape_mean_std: mean and STD for shape prior
     :param {} debug_visual: dictionary with some intermediate results
+    :param int roi_size: if it is set, each object label is allowed only
+        in a window of given half size around its centre and the optimisation
+        runs only on the union of these windows, the rest is background
     :return [[int]]:
 
     >>> segm = np.array([[0] * 10,
@@ -184,6 +240,22 @@ def object_segmentation_graphcut_pixels(segm, centres,
            [0, 0, 0, 0, 0, 0, 2, 2, 2, 2],
            [0, 0, 0, 0, 0, 2, 2, 2, 2, 2],
            [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=int32)
+    >>> object_segmentation_graphcut_pixels(segm, centres, gc_regul=.5,
+    ...                                     seed_size=1, roi_size=3)
+    array([[0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+           [1, 1, 1, 1, 1, 0, 0, 0, 0, 0],
+           [1, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0, 2, 2, 2, 2],
+           [0, 0, 0, 0, 0, 2, 2, 2, 2, 2],
+           [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=int32)
+    >>> object_segmentation_graphcut_pixels(segm, centres, gc_regul=.5,
+    ...                                     seed_size=1, roi_size=1)
+    array([[0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+           [0, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+           [0, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0, 0, 2, 2, 2],
+           [0, 0, 0, 0, 0, 0, 0, 2, 2, 2],
+           [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=int32)
     """
     assert np.min(labels_fg_prob) < 1, 'non label can ce strictly 1'
     assert segm.max() <= len(labels_fg_prob), \
@@ -195,49 +267,87 @@ def object_segmentation_graphcut_pixels(segm, centres,
     assert list(centres), 'at least one center has to be given'
     centres = [np.round(c).astype(int) for c in centres]
 
-    proba = np.ones((height, width, len(centres) + 1))
-    proba[:, :, 0] = labels_bg_prob[segm]
-    for i in range(len(centres)):
-        proba[:, :, i + 1] = labels_fg_prob[segm]
-
-    shape = np.ones((height, width, len(centres) + 1))
+    # unary costs for each structure label, indexed by the segmentation later
+    lut_cost_bg = - np.log(labels_bg_prob)
+    lut_cost_fg = - np.log(labels_fg_prob)
+    lut_cost_shape = None
     if coef_shape > 0:
+        lut_cost_bg -= coef_shape * np.log(labels_bg_prob)
         shape_mean, shape_std = shape_mean_std
-        shape[:, :, 0] = labels_bg_prob[segm]
-        grid_y, grid_x = np.meshgrid(range(width), range(height))
-        for i, centre in enumerate(centres):
-            diff_x2 = (grid_x - centre[0]) ** 2
-            diff_y2 = (grid_y - centre[1]) ** 2
-            dist = np.sqrt(diff_x2 + diff_y2)
-            cdf = stats.norm.cdf(range(int(np.max(dist) + 1)),
-                                 shape_mean, shape_std)
-            cum = 1. - cdf + 1e-9
-            shape[:, :, i + 1] = cum[dist.astype(int)]
+        max_dist = int(np.sqrt(height ** 2 + width ** 2)) + 1
+        cdf = stats.norm.cdf(range(max_dist + 1), shape_mean, shape_std)
+        lut_cost_shape = - coef_shape * np.log(1. - cdf + 1e-9)
+
+    if roi_size is None:
+        windows = [(slice(0, height), slice(0, width))] * len(centres)
+    else:
+        windows = [(slice(max(0, r - roi_size), min(height, r + roi_size + 1)),
+                    slice(max(0, c - roi_size), min(width, c + roi_size + 1)))
+                   for r, c in centres]
+    # nodes of the optimised graph, the union of all object windows
+    mask_nodes = np.zeros(segm.shape, dtype=bool)
+    for window in windows:
+        mask_nodes[window] = True
+    idx_nodes = np.full(segm.shape, -1, dtype=int)
+    idx_nodes[mask_nodes] = np.arange(np.sum(mask_nodes))
+
+    unary = np.empty((np.sum(mask_nodes), len(centres) + 1), dtype=np.float32)
+    unary[:, 0] = lut_cost_bg[segm[mask_nodes]]
+    unary[:, 1:] = GC_REPLACE_INF
+    for i, (window, pos) in enumerate(zip(windows, centres)):
+        cost = lut_cost_fg[segm[window]]
+        if lut_cost_shape is not None:
+            rows = np.arange(window[0].start, window[0].stop)[:, np.newaxis]
+            cols = np.arange(window[1].start, window[1].stop)[np.newaxis, :]
+            dist = np.sqrt((rows - pos[0]) ** 2 + (cols - pos[1]) ** 2)
+            cost = cost + lut_cost_shape[dist.astype(int)]
+        unary[idx_nodes[window].ravel(), i + 1] = cost.ravel()
 
-    unary = - np.log(proba) - coef_shape * np.log(shape)
-    for i, pos in enumerate(centres):
         if seed_size > 0:
             mask = np.zeros(segm.shape, dtype=bool)
             selem = morphology.disk(seed_size)
             mask[pos[0] - seed_size:pos[0] + seed_size + 1,
                  pos[1] - seed_size:pos[1] + seed_size + 1] = selem
             mask = np.logical_and(mask, segm > 0)
-            unary[mask.astype(bool), i + 1] = 0
         else:
-            unary[pos[0], pos[1], i + 1] = 0
-        # unary[pos[0], pos[1], 0] = np.Inf
+            mask = np.zeros(segm.shape, dtype=bool)
+            mask[pos[0], pos[1]] = True
+        mask = np.logical_and(mask, mask_nodes)
+        unary[idx_nodes[mask], i + 1] = 0
 
-    pairwise = (1 - np.eye(proba.shape[-1])) * gc_regul
+    pairwise = (1 - np.eye(unary.shape[-1])) * gc_regul
 
-    cost_v = np.ones((height - 1, width)) * 1.
-    cost_h = np.ones((height, width - 1)) * 1.
-    labels = cut_grid_graph(unary, pairwise, cost_v, cost_h, n_iter=999)
-    segm_obj = labels.reshape(*segm.shape)
+    if roi_size is None:
+        cost_v = np.ones((height - 1, width))
+        cost_h = np.ones((height, width - 1))
+        labels = cut_grid_graph(unary.reshape(height, width, -1), pairwise,
+                                cost_v, cost_h, n_iter=999)
+    else:
+        # neighbours out of the windows are fixed to be background
+        nb_bg_neighbours = np.zeros(segm.shape)
+        nb_bg_neighbours[1:, :] += ~mask_nodes[:-1, :]
+        nb_bg_neighbours[:-1, :] += ~mask_nodes[1:, :]
+        nb_bg_neighbours[:, 1:] += ~mask_nodes[:, :-1]
+        nb_bg_neighbours[:, :-1] += ~mask_nodes[:, 1:]
+        unary[:, 1:] += gc_regul * nb_bg_neighbours[mask_nodes][:, np.newaxis]
+        # vertical and horizontal edges inside the windows
+        edges_v = np.logical_and(mask_nodes[:-1, :], mask_nodes[1:, :])
+        edges_h = np.logical_and(mask_nodes[:, :-1], mask_nodes[:, 1:])
+        edges = np.array([
+            np.hstack([idx_nodes[:-1, :][edges_v], idx_nodes[:, :-1][edges_h]]),
+            np.hstack([idx_nodes[1:, :][edges_v], idx_nodes[:, 1:][edges_h]]),
+        ], dtype=np.int32).T
+        labels = cut_general_graph(edges, np.ones(len(edges)), unary,
+                                   pairwise, n_iter=999)
+    segm_obj = np.zeros(segm.shape, dtype=np.int32)
+    segm_obj[mask_nodes] = labels
 
     if debug_visual is not None:
         list_unary_imgs = []
         for i in range(unary.shape[-1]):
-            list_unary_imgs.append(unary[:, :, i])
+            img_unary = np.full(segm.shape, GC_REPLACE_INF, dtype=unary.dtype)
+            img_unary[mask_nodes] = unary[:, i]
+            list_unary_imgs.append(img_unary)
         debug_visual['unary_imgs'] = list_unary_imgs
     return segm_obj
 
@@ -13,13 +13,247 @@ Copyright (C) 2014-2018 Jiri Borovec <jiri.borovec@fel.cvut.cz>
 import logging
 
 import numpy as np
+import skimage
 import skimage.segmentation as ski_segm
-from skimage import measure
+from scipy import ndimage
+from skimage import measure, color as sk_color
+
+try:  # optional multi-threaded SLIC implementation
+    import fast_slic
+except ImportError:
+    fast_slic = None
 
 IMAGE_SPACING = (1, 1, 1)
+#: Gaussian pre-smoothing of the image before SLIC clustering
+SLIC_SIGMA = 1.
+#: float type of the pre-processed image passed to SLIC backends
+SLIC_FLOAT_DTYPE = np.float32
+#: scikit-image before 0.17 smooths the image in SLIC before the CIE-Lab conversion
+SLIC_SMOOTH_BEFORE_LAB = [int(i) for i in skimage.__version__.split('.')[:2]] < [0, 17]
+
+
+def slic_backend_skimage(img, nb_segments, compactness, spacing=None,
+                         slico=False):
+    """ SLIC clustering by the scikit-image implementation,
+    the image is already pre-processed so no smoothing and colour conversion
+
+    :param ndarray img: pre-processed image np.array<(d,) h, w, c>
+    :param int nb_segments: approximate number of superpixels
+    :param float compactness: SLIC compactness
+    :param (int, int, int) spacing: spacing in 3d image may not be equal
+    :param bool slico: whether use parameter free version ASLIC/SLICO
+    :return ndarray: segmentation np.array<(d,) h, w>
+
+    >>> img = np.zeros((20, 30, 1), dtype=np.float32)
+    >>> img[:, 15:] = 1
+    >>> slic = slic_backend_skimage(img, 6, 10.)
+    >>> len(np.unique(slic))
+    6
+    """
+    # keep the explicit channel axis so both 2D and 3D images are understood
+    # as multi-channel by any scikit-image version
+    return ski_segm.slic(img, n_segments=nb_segments, compactness=compactness,
+                         spacing=spacing, sigma=0, convert2lab=False,
+                         enforce_connectivity=True, slic_zero=slico)
+
+
+def slic_backend_fast_slic(img, nb_segments, compactness, spacing=None,
+                           slico=False):
+    """ SLIC clustering by the `fast-slic` package (Cython with multi-threaded
+    assignment step), only 2D images are supported and the colours are
+    quantized to 8 bits so the superpixels are close but not identical
+    to the scikit-image ones
+
+    SEE: https://github.com/Algy/fast-slic
+
+    :param ndarray img: pre-processed image np.array<h, w, c>
+    :param int nb_segments: approximate number of superpixels
+    :param float compactness: SLIC compactness
+    :param spacing: not supported, has to be None or unit
+    :param bool slico: not supported
+    :return ndarray: segmentation np.array<h, w>
+    """
+    assert fast_slic is not None, 'missing package "fast-slic"'
+    assert img.ndim == 3, 'only 2D images are supported, got %r' % (img.shape, )
+    assert spacing is None or np.all(np.asarray(spacing) == 1), \
+        'spacing is not supported'
+    if slico:
+        logging.warning('fast-slic does not support SLICO, using plain SLIC')
+    img8 = np.clip(img * 255, 0, 255).astype(np.uint8)
+    if img8.shape[-1] != 3:  # the implementation expects three channels
+        img8 = img8[..., [0] * 3]
+    slic = fast_slic.Slic(num_components=nb_segments,
+                          compactness=compactness * 255)
+    return slic.iterate(np.ascontiguousarray(img8))
+
+
+#: available SLIC implementations, name -> function(img, nb_segments,
+#: compactness, spacing, slico) with pre-processed image np.array<(d,) h, w, c>
+SLIC_BACKENDS = {
+    'skimage': slic_backend_skimage,
+    'fast_slic': slic_backend_fast_slic,
+}
+#: default SLIC implementation
+SLIC_BACKEND_DEFAULT = 'skimage'
+
+
+def _gray2lab_lightness(img):
+    """ lightness L of CIE-Lab of a grayscale image, the same as the first
+    channel of `rgb2lab` for the image duplicated into RGB
+
+    :param ndarray img: image with values in range (0, 1)
+    :return ndarray:
 
+    >>> img = np.linspace(0, 1, 5)
+    >>> lab = sk_color.rgb2lab(np.tile(img[:, np.newaxis], (1, 3))[np.newaxis])
+    >>> np.allclose(_gray2lab_lightness(img), lab[0, :, 0], atol=1e-3)
+    True
+    """
+    mask = img > 0.04045
+    img_lin = np.where(mask, ((img + 0.055) / 1.055) ** 2.4, img / 12.92)
+    mask = img_lin > 0.008856
+    lightness = np.where(mask, np.cbrt(img_lin) * 116 - 16, img_lin * 903.3)
+    return lightness.astype(img.dtype)
+
+
+def prepare_slic_image(img, multichannel=True, spacing=None, sigma=SLIC_SIGMA):
+    """ normalise image intensities into range (0, 1), convert colour images
+    to CIE-Lab (grayscale images to lightness only) and apply the Gaussian
+    pre-smoothing, in the same order as the installed scikit-image SLIC does
+    internally (see `SLIC_SMOOTH_BEFORE_LAB`)
 
-def segment_slic_img2d(img, sp_size=50, relative_compact=0.1, slico=False):
+    :param ndarray img: input image np.array<h, w(, c)> or np.array<d, h, w>
+    :param bool multichannel: whether the last dimension are colour channels
+    :param (int, int, int) spacing: spacing in 3d image may not be equal
+    :param float sigma: Gaussian smoothing
+    :return ndarray: image np.array<(d,) h, w, c>
+
+    >>> np.random.seed(0)
+    >>> img = prepare_slic_image(np.random.random((10, 15, 3)))
+    >>> img.shape, img.dtype
+    ((10, 15, 3), dtype('float32'))
+    >>> prepare_slic_image(np.random.random((10, 15))).shape
+    (10, 15, 1)
+    >>> prepare_slic_image(np.random.random((5, 10, 15)), False, (1, 1, 2)).shape
+    (5, 10, 15, 1)
+    """
+    img = np.array(img, dtype=SLIC_FLOAT_DTYPE)
+    img_min, img_max = img.min(), img.max()
+    if img_min != 0. or img_max != 1.:
+        img -= img_min
+        img /= float(img_max - img_min) if img_max != img_min else 1.
+
+    is_rgb = multichannel and img.ndim == 3 and img.shape[-1] == 3
+    is_gray = multichannel and img.ndim == 2
+    if not multichannel or img.ndim == 2:
+        img = img[..., np.newaxis]
+
+    def _convert_lab(img):
+        if is_rgb:
+            return sk_color.rgb2lab(img).astype(SLIC_FLOAT_DTYPE)
+        if is_gray:
+            return _gray2lab_lightness(img)
+        return img
+
+    def _smooth(img):
+        if sigma <= 0:
+            return img
+        dims = img.ndim - 1
+        spacing_ = np.ones(dims) if spacing is None else np.asarray(spacing)
+        sigmas = sigma / spacing_.astype(float)[-dims:]
+        return ndimage.gaussian_filter(img, sigma=tuple(sigmas) + (0, ),
+                                       mode='reflect')
+
+    if SLIC_SMOOTH_BEFORE_LAB:
+        return _convert_lab(_smooth(img))
+    return _smooth(_convert_lab(img))
+
+
+class SlicSuperpixels(object):
+    """ SLIC superpixels engine, the image pre-processing (normalisation,
+    colour conversion and smoothing) is computed only once, so estimating
+    superpixels for several sizes and regularisations is cheaper
+
+    >>> np.random.seed(0)
+    >>> img = np.random.random((100, 150, 3))
+    >>> engine = SlicSuperpixels(img)
+    >>> slics = [engine.segment(sp, 0.2) for sp in (10, 20)]
+    >>> [s.shape for s in slics]
+    [(100, 150), (100, 150)]
+    >>> np.array_equal(slics[-1], segment_slic_img2d(img, 20, 0.2))
+    True
+    >>> engine = SlicSuperpixels(np.random.random((10, 50, 50)),
+    ...                          multichannel=False, spacing=(5, 1, 1))
+    >>> engine.segment(10, 0.2).shape
+    (10, 50, 50)
+    """
+
+    def __init__(self, img, multichannel=True, spacing=None, sigma=SLIC_SIGMA,
+                 backend=SLIC_BACKEND_DEFAULT):
+        """ initialise the engine
+
+        :param ndarray img: input image np.array<h, w(, c)> or np.array<d, h, w>
+        :param bool multichannel: whether the last dimension are colour channels
+        :param (int, int, int) spacing: spacing in 3d image may not be equal
+        :param float sigma: Gaussian pre-smoothing
+        :param str backend: name of SLIC implementation, see `SLIC_BACKENDS`
+        """
+        assert backend in SLIC_BACKENDS, 'unknown backend "%s" not in %r' \
+                                         % (backend, list(SLIC_BACKENDS))
+        self.backend = backend
+        self.spacing = spacing
+        img = prepare_slic_image(img, multichannel, spacing, sigma)
+        self.is_3d = img.ndim == 4
+        # scale into range (0, 1), the compactness is scaled accordingly,
+        # so any SLIC normalising the image internally gives the same result
+        self.offset = float(img.min())
+        self.scale = max(float(img.max()) - self.offset, 1e-9)
+        img -= self.offset
+        img /= self.scale
+        self.image = img
+
+    def get_slic_params(self, sp_size=50, relative_compact=0.1):
+        """ convert the superpixel size and relative regularisation
+        to the SLIC number of segments and compactness
+
+        :param int sp_size: superpixel initial size
+        :param float relative_compact: relative regularisation in range (0, 1)
+        :return (int, float): number of segments and compactness
+        """
+        nb_pixels = np.prod(self.image.shape[:-1])
+        if self.is_3d:
+            space = IMAGE_SPACING if self.spacing is None else self.spacing
+            space = np.asarray(space, dtype=np.float32)
+            sp_size = np.prod(sp_size / space * min(space))
+            nb_segments = int(nb_pixels / sp_size)
+            compact = int((sp_size * relative_compact) ** 1.5)
+        else:
+            nb_segments = int(nb_pixels / (sp_size ** 2))
+            compact = (sp_size * relative_compact) ** 1.5
+        return max(nb_segments, 1), compact
+
+    def segment(self, sp_size=50, relative_compact=0.1, slico=False):
+        """ estimate SLIC superpixels
+
+        :param int sp_size: superpixel initial size
+        :param float relative_compact: relative regularisation in range (0, 1)
+            where 0 is for free form and 1 for nearly rectangular superpixels
+        :param bool slico: whether use parameter free version ASLIC/SLICO
+        :return ndarray: segmentation np.array<(d,) h, w>
+        """
+        nb_segments, compact = self.get_slic_params(sp_size, relative_compact)
+        logging.debug('Starting SLIC (%s) with params NB=%i & compat=%f for '
+                      'image %r', self.backend, nb_segments, compact,
+                      self.image.shape)
+        slic_segments = SLIC_BACKENDS[self.backend](
+            self.image, nb_segments, compact / self.scale,
+            spacing=self.spacing, slico=slico)
+        logging.debug('SLIC finished')
+        return np.asarray(slic_segments)
+
+
+def segment_slic_img2d(img, sp_size=50, relative_compact=0.1, slico=False,
+                       backend=SLIC_BACKEND_DEFAULT):
     """ segmentation by SLIC superpixels using original SLIC implementation
 
     :param ndarray img: input color image
@@ -27,6 +261,7 @@ def segment_slic_img2d(img, sp_size=50, relative_compact=0.1, slico=False):
     :param float relative_compact: relative regularisation in range (0, 1)
         where 0 is for free form and 1 for nearly rectangular superpixels
     :param bool slico: whether use parameter free version ASLIC/SLICO
+    :param str backend: name of SLIC implementation, see `SLIC_BACKENDS`
     :return ndarray: segmentation
 
     >>> np.random.seed(0)
@@ -40,37 +275,14 @@ def segment_slic_img2d(img, sp_size=50, relative_compact=0.1, slico=False):
     (150, 100)
     """
     logging.debug('Init SLIC superpixels 2d RGB clustering with params size=%i and'
-                  ' regul=%f for image dims %r', sp_size, relative_compact, img.shape)
-    nb_pixels = np.prod(img.shape[:2])
-
-    if not isinstance(img, np.ndarray):
-        img = np.array(img)
-    if img.ndim == 2:  # duplicate channels to be like RGB
-        img = np.rollaxis(np.tile(img, (3, 1, 1)), 0, 3)
-    # scale image values
-    if img.min() != 0. or img.max() != 1.:
-        img = (img - img.min()) / float(img.max() - img.min())
-
-    # set native SLIC parameters
-    slic_nb_spx = int(nb_pixels / (sp_size ** 2))
-    slic_compact = (sp_size * relative_compact) ** 1.5
-    logging.debug('Starting SLIC with params NB=%i & compat=%f for image %r',
-                  slic_nb_spx, slic_compact, img.shape)
-    # run SLIC segmentation
-    slic_segments = ski_segm.slic(img, n_segments=slic_nb_spx,
-                                  compactness=slic_compact,
-                                  sigma=1, enforce_connectivity=True,
-                                  slic_zero=slico)
-    logging.debug('SLIC finished')
-    # slic_segments, _, _ = ski_segm.relabel_sequential(slic_segments)
-    # fix: unconnected segments - [ndimage.label(slic==i)[1]
-    #                              for i in range(slic.max() + 1)]
-    # slic_segments = measure.label(slic_segments, neighbors=4)
-    return np.array(slic_segments)
+                  ' regul=%f for image dims %r', sp_size, relative_compact,
+                  np.shape(img))
+    engine = SlicSuperpixels(img, backend=backend)
+    return engine.segment(sp_size, relative_compact, slico)
 
 
 def segment_slic_img3d_gray(im, sp_size=50, relative_compact=0.1,
-                            space=IMAGE_SPACING):
+                            space=IMAGE_SPACING, backend=SLIC_BACKEND_DEFAULT):
     """ segmentation by SLIC superpixels using originla SLIC implementation
 
     :param ndarray im: input 3D grascale image
@@ -78,6 +290,7 @@ def segment_slic_img3d_gray(im, sp_size=50, relative_compact=0.1,
     :param float relative_compact: relative regularisation in range (0, 1)
         where 0 is for free form and 1 for nearly rectangular superpixels
     :param (int, int, int) space: spacing in 3d image may not be equal
+    :param str backend: name of SLIC implementation, see `SLIC_BACKENDS`
     :return ndarray:
 
     >>> np.random.seed(0)
@@ -89,25 +302,12 @@ def segment_slic_img3d_gray(im, sp_size=50, relative_compact=0.1,
     logging.debug('Init SLIC superpixels 3d Gray clustering with params'
                   ' size=%i and regul=%f for image dims %r',
                   sp_size, relative_compact, im.shape)
-    nb_pixels = np.prod(im.shape)
-    sp_size = np.prod(sp_size / np.asarray(space, dtype=np.float32) * min(space))
-    # set native SLIC parameters
-    slic_nb_sp = int(nb_pixels / sp_size)
-    # slic_compact = int((sp_size * relative_compact) ** 1.5)
-    slic_compact = int((sp_size * relative_compact) ** 1.5)
-    logging.debug('Starting SLIC superpixels clustering with params NB=%i and '
-                  'compat=%f and spacing=%r', slic_nb_sp, slic_compact, space)
-    # run SLIC segmentation
-    # slic_segments = SLIC.slic_n(np.array(im), slic_nb_sp, slic_compact)
-    slic_segments = ski_segm.slic(np.array(im), n_segments=slic_nb_sp,
-                                  compactness=slic_compact, multichannel=False,
-                                  spacing=space, sigma=1)
+    engine = SlicSuperpixels(im, multichannel=False, spacing=space,
+                             backend=backend)
+    # the connectivity is enforced inside SLIC, so no extra labeling needed
+    slic_segments = engine.segment(sp_size, relative_compact)
     logging.debug('SLIC superpixels estimated.')
-    # slic_segments, _, _ = ski_segm.relabel_sequential(slic_segments)
-    # fix: unconnected segments - [ndimage.label(slic==i)[1]
-    #                              for i in range(slic.max() + 1)]
-    slic_segments = measure.label(slic_segments)
-    return np.array(slic_segments)
+    return slic_segments
 
 
 def make_graph_segment_connect_edges(vertices, all_edges):
@@ -125,8 +325,8 @@ def make_graph_segment_connect_edges(vertices, all_edges):
     # find unique connections
     edges = np.unique(edge_hash)
     # undo hashing
-    edges = [[vertices[int(edge % nb_vertices)],
-              vertices[int(edge / nb_vertices)]] for edge in edges]
+    edges = np.array([vertices[edges % nb_vertices],
+                      vertices[edges // nb_vertices]]).T.tolist()
     return vertices, edges
 
 
@@ -170,8 +370,7 @@ def make_graph_segm_connect_grid2d_conn4(grid):
     logging.debug('make graph segment connect edges - 2d conn4')
     vertices = np.unique(grid)
     # map unique labels to [1,...,num_labels]
-    reverse_dict = dict(zip(vertices, np.arange(len(vertices))))
-    grid = np.array([reverse_dict[x] for x in grid.flat]).reshape(grid.shape)
+    grid = np.searchsorted(vertices, grid)
     all_edges = get_segment_diffs_2d_conn4(grid)
     return make_graph_segment_connect_edges(vertices, all_edges)
 
@@ -195,8 +394,7 @@ def make_graph_segm_connect_grid3d_conn6(grid):
     logging.debug('make graph segment connect edges - 3d conn6')
     vertices = np.unique(grid)
     # map unique labels to [1,...,num_labels]
-    reverse_dict = dict(zip(vertices, np.arange(len(vertices))))
-    grid = np.array([reverse_dict[x] for x in grid.flat]).reshape(grid.shape)
+    grid = np.searchsorted(vertices, grid)
     all_edges = get_segment_diffs_3d_conn6(grid)
     return make_graph_segment_connect_edges(vertices, all_edges)
 
@@ -238,6 +436,34 @@ def superpixel_centers(segments):
     return centers
 
 
+def superpixel_centers_array(segments):
+    """ estimate centers of each superpixel as a single array,
+    the missing superpixels (labels) have zero centre
+
+    :param ndarray segments: segmentation np.array<h, w> or np.array<d, h, w>
+    :return ndarray: np.array<nb_segments, ndim>
+
+    >>> segm = np.array([[0] * 6 + [1] * 5, [0] * 6 + [3] * 5])
+    >>> superpixel_centers_array(segm)
+    array([[ 0.5,  2.5],
+           [ 0. ,  8. ],
+           [ 0. ,  0. ],
+           [ 1. ,  8. ]])
+    >>> superpixel_centers_array(np.array([segm, segm, segm]))[:2]
+    array([[ 1. ,  0.5,  2.5],
+           [ 1. ,  0. ,  8. ]])
+    """
+    segm_flat = np.asarray(segments).ravel()
+    nb_segments = np.max(segm_flat) + 1
+    counts = np.bincount(segm_flat, minlength=nb_segments).astype(float)
+    counts[counts == 0] = 1
+    centers = np.empty((nb_segments, segments.ndim))
+    for i, grid in enumerate(np.indices(segments.shape)):
+        centers[:, i] = np.bincount(segm_flat, weights=grid.ravel(),
+                                    minlength=nb_segments) / counts
+    return centers
+
+
 def get_neighboring_segments(edges):
     """ get the indexes of neighboring superpixels for each superpixel
     the input is list edges of all neighboring segments
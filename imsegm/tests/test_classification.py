@@ -13,9 +13,15 @@ import numpy as np
 from sklearn import metrics
 
 sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
-from imsegm.classification import create_classifiers, create_classif_search_train_export
+from imsegm.classification import (create_classifiers, create_classif_search_train_export,
+                                   save_classifier, load_classifier, create_clf_pipeline,
+                                   eval_classif_cross_val_scores, CrossValidateGroups,
+                                   eval_classif_cross_val_roc)
+from imsegm.utilities.data_io import update_path
 
 CLASSIFIER_NAMES = create_classifiers().keys()
+# set default output path
+PATH_OUTPUT = update_path('output', absolute=True)
 
 
 def generate_data(nb_samples=100, nb_classes=3, dim_features=4):
@@ -83,6 +89,64 @@ class TestClassification(unittest.TestCase):
             self.classif_eval(clf, data_train, labels_train,
                               data_test, labels_test)
 
+    def test_classif_export_mmap(self):
+        np.random.seed(0)
+        data_train, labels_train = generate_data()
+        clf = create_classifiers()['RandForest']
+        clf.fit(data_train, labels_train)
+
+        path_clf = save_classifier(PATH_OUTPUT, clf, 'TEST-MMAP', {})
+        dict_clf = load_classifier(path_clf)
+        clf_flat = dict_clf['clf_pipeline']
+        # the tree nodes stay shared in memory, not copied into the process
+        for name in ('children_left_', 'children_right_', 'feature_',
+                     'threshold_', 'value_'):
+            self.assertIsInstance(getattr(clf_flat, name), np.memmap)
+        data_test, _ = generate_data()
+        np.testing.assert_array_equal(clf_flat.predict_proba(data_test),
+                                      clf.predict_proba(data_test))
+        np.testing.assert_array_equal(clf_flat.predict(data_test),
+                                      clf.predict(data_test))
+        os.remove(path_clf)
+        os.remove(os.path.join(PATH_OUTPUT, dict_clf['clf_model']))
+
+    def test_classif_export_cross_val(self):
+        np.random.seed(0)
+        data_train, labels_train = generate_data()
+        clf = create_clf_pipeline('RandForest', pca_coef=None)
+        clf.fit(data_train, labels_train)
+
+        path_clf = save_classifier(PATH_OUTPUT, clf, 'TEST-CV', {})
+        dict_clf = load_classifier(path_clf)
+        clf_flat = dict_clf['clf_pipeline']
+        self.assertEqual(type(clf_flat.steps[-1][1]).__name__,
+                         'FlatTreeEnsembleClassifier')
+        # the reloaded pipeline can be cloned and refitted
+        cv = CrossValidateGroups([len(labels_train) // 3] * 3, nb_hold_out=1)
+        df_scores = eval_classif_cross_val_scores('TEST-CV', clf_flat,
+                                                  data_train, labels_train, cv)
+        self.assertEqual(len(df_scores), 3)
+        self.assertGreater(df_scores['f1_macro'].min(), 0.9)
+        os.remove(path_clf)
+        os.remove(os.path.join(PATH_OUTPUT, dict_clf['clf_model']))
+
+    def test_classif_cross_val_lists(self):
+        np.random.seed(0)
+        data, labels = generate_data(nb_samples=20, nb_classes=2)
+        classif = create_classifiers()['RandForest']
+        cv = CrossValidateGroups([len(labels) // 4] * 4, nb_hold_out=1)
+        df_scores = eval_classif_cross_val_scores('TEST', classif, data,
+                                                  np.asarray(labels), cv)
+        # plain lists as the features and labels give the same scores
+        df_scores_list = eval_classif_cross_val_scores('TEST', classif,
+                                                       data.tolist(), labels, cv)
+        self.assertEqual(df_scores.shape, (4, 4))
+        self.assertTrue(df_scores.equals(df_scores_list))
+        _, auc = eval_classif_cross_val_roc('TEST', classif, data, np.asarray(labels), cv)
+        _, auc_list = eval_classif_cross_val_roc('TEST', classif, data.tolist(),
+                                                 labels, cv)
+        self.assertEqual(auc, auc_list)
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,286 @@
+"""
+Unit testing for particular data IO module
+
+Copyright (C) 2014-2018 Jiri Borovec <jiri.borovec@fel.cvut.cz>
+"""
+
+import os
+import sys
+import unittest
+import json
+import shutil
+import logging
+import warnings
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
+from imsegm.utilities.data_io import (QuantileSketch, compute_image_quantiles,
+                                      QUANTILE_HIST_MAX_BINS, TiffVolume,
+                                      load_image_tiff_volume, update_path, tifffile,
+                                      find_files_match_names_across_dirs,
+                                      ImageExportService, io_imread, load_segm_soft,
+                                      io_imsave, io_image_decorate)
+from imsegm.utilities import read_zvi
+
+# set default output path
+PATH_OUTPUT = update_path('output', absolute=True)
+PATH_IMAGE_ZVI = os.path.join(update_path('data_images'), 'others', 'sample.zvi')
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_integer_large_range(self):
+        img = np.array([[0, 2 ** 21]], dtype=np.int32)
+        np.testing.assert_array_almost_equal(compute_image_quantiles(img),
+                                             np.percentile(img, (2, 98)))
+
+        np.random.seed(0)
+        img = np.random.randint(0, 4 * QUANTILE_HIST_MAX_BINS, (50, 40))
+        sketch = QuantileSketch()
+        for tile in np.array_split(img, 5):
+            sketch.update(tile)
+        self.assertFalse(sketch.exact)
+        diffs = sketch.quantiles((0, 2, 50, 98, 100)) \
+            - np.percentile(img, (0, 2, 50, 98, 100))
+        self.assertLess(np.max(np.abs(diffs)), sketch.bin_width)
+
+    def test_integer_range_grows(self):
+        sketch = QuantileSketch()
+        sketch.update(np.array([5, 7]))
+        self.assertTrue(sketch.exact)
+        sketch.update(np.array([2 * QUANTILE_HIST_MAX_BINS]))
+        self.assertFalse(sketch.exact)
+        vals = np.array([5, 7, 2 * QUANTILE_HIST_MAX_BINS])
+        diffs = sketch.quantiles((0, 50, 100)) - np.percentile(vals, (0, 50, 100))
+        self.assertLess(np.max(np.abs(diffs)), sketch.bin_width)
+
+    def test_empty_updates(self):
+        sketch = QuantileSketch()
+        sketch.update(np.array([], dtype=float))
+        sketch.update(np.array([np.nan, np.inf]))
+        self.assertRaises(AssertionError, sketch.quantiles)
+        sketch.update(np.array([], dtype=np.uint8))
+        sketch.update(np.array([3, 1, 2], dtype=np.uint8))
+        sketch.update(np.zeros((0, 5), dtype=np.uint8))
+        np.testing.assert_array_almost_equal(sketch.quantiles((0, 50, 100)),
+                                             [1, 2, 3])
+        sketch = QuantileSketch()
+        sketch.update(np.array([7]))
+        self.assertTrue(sketch.exact)
+        sketch.update(np.array([np.nan]))
+        np.testing.assert_array_almost_equal(sketch.quantiles((0, 100)), [7, 7])
+
+    def test_float_error_bound(self):
+        for seed in range(20):
+            np.random.seed(seed)
+            vals = np.random.exponential(size=np.random.randint(10, 5000)) ** 3
+            sketch = QuantileSketch(nb_bins=256)
+            for tile in np.array_split(vals, 4):
+                sketch.update(tile)
+            quantiles = (0, 1, 2, 50, 98, 99, 100)
+            diffs = sketch.quantiles(quantiles) - np.percentile(vals, quantiles)
+            self.assertLess(np.max(np.abs(diffs)), sketch.bin_width)
+
+
+class TestTiffVolume(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.img = np.random.randint(0, 255, (6, 20, 25)).astype(np.uint16)
+        self.path_img = os.path.join(PATH_OUTPUT, 'temp_volume.tif')
+
+    def tearDown(self):
+        if os.path.isfile(self.path_img):
+            os.remove(self.path_img)
+
+    def _check_volume(self, vol):
+        self.assertEqual(vol.shape, self.img.shape)
+        np.testing.assert_array_equal(np.asarray(vol), self.img)
+        band = vol.view(slice(1, None, 2))
+        self.assertEqual(band.shape, (3, 20, 25))
+        np.testing.assert_array_equal(band[-1], self.img[5])
+        np.testing.assert_array_equal(band[:, 3, 2:5], self.img[1::2, 3, 2:5])
+        for sl, sl_ref in zip(band, self.img[1::2]):
+            np.testing.assert_array_equal(sl, sl_ref)
+
+    def test_memmap(self):
+        tifffile.imwrite(self.path_img, self.img)
+        with TiffVolume(self.path_img) as vol:
+            self.assertTrue(vol.is_memmap)
+            self._check_volume(vol)
+
+    def test_compressed_pages(self):
+        # compressed pages can not be memory-mapped, decoded per slice
+        tifffile.imwrite(self.path_img, self.img, compression='zlib')
+        with TiffVolume(self.path_img) as vol:
+            self.assertFalse(vol.is_memmap)
+            self._check_volume(vol)
+
+    def test_quantiles_large_range(self):
+        self.img = self.img.astype(np.uint32) * (4 * QUANTILE_HIST_MAX_BINS // 255)
+        tifffile.imwrite(self.path_img, self.img)
+        with TiffVolume(self.path_img) as vol:
+            quantiles = vol.quantiles((2, 50, 98))
+        diffs = quantiles - np.percentile(self.img, (2, 50, 98))
+        self.assertLess(np.max(np.abs(diffs)), self.img.max() / 2 ** 13)
+
+    def test_load_lazy(self):
+        tifffile.imwrite(self.path_img, self.img)
+        img = load_image_tiff_volume(self.path_img, lazy=False)
+        vol = load_image_tiff_volume(self.path_img, lazy=True)
+        np.testing.assert_array_almost_equal(np.asarray(vol), img)
+
+
+class TestFilesManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.path_dir = os.path.join(PATH_OUTPUT, 'temp_manifest')
+        self.path_manifest = os.path.join(PATH_OUTPUT, 'temp_manifest.json')
+        for d in ('image', 'segm'):
+            os.makedirs(os.path.join(self.path_dir, d))
+            for n in ('a', 'b'):
+                open(os.path.join(self.path_dir, d, n + '.png'), 'w').close()
+        self.patterns = [os.path.join(self.path_dir, d, '*.png')
+                         for d in ('image', 'segm')]
+
+    def tearDown(self):
+        shutil.rmtree(self.path_dir)
+        if os.path.isfile(self.path_manifest):
+            os.remove(self.path_manifest)
+
+    def _find_names(self):
+        df = find_files_match_names_across_dirs(self.patterns,
+                                                path_manifest=self.path_manifest)
+        return sorted(os.path.basename(p) for p in df['path_1'])
+
+    def _touch_dir(self, path_dir, shift):
+        # make the mtime change explicit for filesystems with coarse resolution
+        mtime = os.stat(path_dir).st_mtime + shift
+        os.utime(path_dir, (mtime, mtime))
+
+    def test_cached_listing(self):
+        self.assertEqual(self._find_names(), ['a.png', 'b.png'])
+        with open(self.path_manifest, 'r') as fp:
+            manifest = json.load(fp)
+        self.assertEqual(len(manifest), 2)
+        # unchanged directories are not rescanned
+        for record in manifest.values():
+            record['names'] = ['a.png']
+        with open(self.path_manifest, 'w') as fp:
+            json.dump(manifest, fp)
+        self.assertEqual(self._find_names(), ['a.png'])
+
+    def test_stale_manifest(self):
+        self.assertEqual(self._find_names(), ['a.png', 'b.png'])
+        for d in ('image', 'segm'):
+            path_dir = os.path.join(self.path_dir, d)
+            open(os.path.join(path_dir, 'c.png'), 'w').close()
+            os.remove(os.path.join(path_dir, 'a.png'))
+            self._touch_dir(path_dir, 10)
+        self.assertEqual(self._find_names(), ['b.png', 'c.png'])
+        df = find_files_match_names_across_dirs(self.patterns)
+        self.assertEqual(sorted(os.path.basename(p) for p in df['path_1']),
+                         ['b.png', 'c.png'])
+
+    def test_corrupted_manifest(self):
+        with open(self.path_manifest, 'w') as fp:
+            fp.write('{"broken": ')
+        self.assertEqual(self._find_names(), ['a.png', 'b.png'])
+        with open(self.path_manifest, 'r') as fp:
+            self.assertEqual(len(json.load(fp)), 2)
+
+
+class TestImageExportService(unittest.TestCase):
+
+    def setUp(self):
+        self.path_dir = os.path.join(PATH_OUTPUT, 'temp_export')
+        os.mkdir(self.path_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.path_dir)
+
+    def test_flush_on_close(self):
+        event = threading.Event()
+        exporter = ImageExportService(nb_workers=1, queue_size=20)
+        # hold the writer so all the images are still pending on close
+        exporter.submit(event.wait)
+        paths = [exporter.save_image_png(os.path.join(self.path_dir, 'img-%i' % i),
+                                         np.full((20, 25), i * 20))
+                 for i in range(10)]
+        path_npz = exporter.save_segm_soft(os.path.join(self.path_dir, 'segm.npz'),
+                                           np.full((20, 25, 2), 0.25), dtype=None)
+        self.assertFalse(any(os.path.isfile(p) for p in paths + [path_npz]))
+        event.set()
+        exporter.close()
+        self.assertTrue(exporter.closed)
+        self.assertEqual([int(io_imread(p).mean()) for p in paths],
+                         list(range(0, 200, 20)))
+        np.testing.assert_array_equal(load_segm_soft(path_npz),
+                                      np.full((20, 25, 2), 0.25))
+        self.assertEqual(exporter.nb_failed, 0)
+        self.assertRaises(AssertionError, exporter.save_image_png,
+                          os.path.join(self.path_dir, 'late'), np.zeros((5, 5)))
+
+    def test_failed_jobs(self):
+        with ImageExportService(nb_workers=2, queue_size=1) as exporter:
+            exporter.save_image_png(os.path.join(self.path_dir, 'missing', 'img'),
+                                    np.zeros((5, 5)))
+            path_img = exporter.save_image_png(os.path.join(self.path_dir, 'img'),
+                                               np.zeros((5, 5)))
+        self.assertTrue(exporter.closed)
+        self.assertEqual(exporter.nb_failed, 1)
+        self.assertTrue(os.path.isfile(path_img))
+
+
+class TestImageIO(unittest.TestCase):
+
+    def test_logging_untouched(self):
+        path_img = os.path.join(PATH_OUTPUT, 'temp_io-image.png')
+        logger_root, logger_pil = logging.getLogger(), logging.getLogger('PIL')
+        levels = logger_root.level, logger_pil.level
+        filters = list(warnings.filters)
+        try:
+            for level in (logging.DEBUG, logging.WARNING):
+                logger_root.setLevel(level)
+                io_imsave(path_img, np.zeros((5, 5), dtype=np.uint8))
+                img = io_imread(path_img)
+                self.assertEqual(img.shape, (5, 5))
+                self.assertEqual(logger_root.level, level)
+                self.assertEqual(logger_pil.level, levels[1])
+                self.assertEqual(warnings.filters, filters)
+                # only PIL is muted while loading
+                levels_load = io_image_decorate(lambda: (
+                    logger_root.level, logger_pil.getEffectiveLevel()))()
+                self.assertEqual(levels_load, (level, max(level, logging.INFO)))
+        finally:
+            logger_root.setLevel(levels[0])
+            os.remove(path_img)
+
+
+class TestZviReader(unittest.TestCase):
+
+    def test_planes(self):
+        with read_zvi.ZviReader(PATH_IMAGE_ZVI) as zvi:
+            self.assertEqual(len(zvi), 4)
+            self.assertEqual(zvi.shape, (4, 488, 648))
+            for i in range(len(zvi)):
+                item = read_zvi.zvi_read(PATH_IMAGE_ZVI, i)
+                np.testing.assert_array_equal(zvi[i], item.Image.Array)
+            np.testing.assert_array_equal(zvi[-1], zvi[len(zvi) - 1])
+            self.assertRaises(IndexError, zvi.read_plane, len(zvi))
+            volume = zvi.read_volume()
+        np.testing.assert_array_equal(read_zvi.load_image(PATH_IMAGE_ZVI), volume)
+
+    def test_unsupported_format(self):
+        header = np.array([0, 2, 1, 1, 4, 9, 32], dtype='<i4').tobytes()
+        self.assertRaises(ValueError, read_zvi.parse_image, header + bytes(8))
+        header = np.array([0, 2, 1, 1, 2, 4, 16], dtype='<i4').tobytes()
+        img = read_zvi.parse_image(header + np.array([1, 2], dtype='<u2').tobytes())
+        self.assertEqual(img.Array.tolist(), [[1, 2]])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Unit testing for particular drawing module
+
+Copyright (C) 2014-2018 Jiri Borovec <jiri.borovec@fel.cvut.cz>
+"""
+
+import os
+import sys
+import pickle
+import unittest
+import logging
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
+from imsegm.utilities.drawing import LazyDebugVisual, set_debug_image
+
+
+class TestLazyDebugVisual(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def _render(self, shape, value):
+        self.calls.append(value)
+        return np.full(shape, value)
+
+    def test_render_on_access(self):
+        debug_visual = LazyDebugVisual(slic=np.zeros((2, 3), dtype=int))
+        set_debug_image(debug_visual, 'img', self._render, (2, 3), 5)
+        self.assertEqual(sorted(debug_visual), ['img', 'slic'])
+        self.assertFalse(debug_visual.is_rendered('img'))
+        self.assertTrue(debug_visual.is_rendered('slic'))
+        self.assertEqual(self.calls, [])
+        # rendered just once and cached
+        for _ in range(3):
+            np.testing.assert_array_equal(debug_visual['img'], np.full((2, 3), 5))
+        self.assertTrue(debug_visual.is_rendered('img'))
+        self.assertEqual(self.calls, [5])
+        self.assertIs(debug_visual.get('img'), debug_visual['img'])
+        self.assertIsNone(debug_visual.get('missing'))
+
+    def test_overwrite_lazy(self):
+        debug_visual = LazyDebugVisual()
+        set_debug_image(debug_visual, 'img', self._render, (2, 3), 5)
+        debug_visual['img'] = 'final'
+        self.assertEqual(debug_visual['img'], 'final')
+        set_debug_image(debug_visual, 'tmp', self._render, (2, 3), 7)
+        del debug_visual['tmp']
+        self.assertNotIn('tmp', debug_visual)
+        self.assertEqual(self.calls, [])
+
+    def test_render_all(self):
+        debug_visual = LazyDebugVisual()
+        for i in range(3):
+            set_debug_image(debug_visual, 'img-%i' % i, self._render, (2, 2), i)
+        np.testing.assert_array_equal(debug_visual.pop('img-0'), np.zeros((2, 2)))
+        self.assertEqual(self.calls, [0])
+        debug_visual.render()
+        self.assertTrue(all(debug_visual.is_rendered(k) for k in debug_visual))
+        self.assertEqual(sorted(self.calls), [0, 1, 2])
+        # plain copy with all the images rendered
+        debug_copy = debug_visual.copy()
+        self.assertEqual(type(debug_copy), dict)
+        self.assertEqual([v.tolist() for _, v in sorted(debug_copy.items())],
+                         [np.full((2, 2), i).tolist() for i in (1, 2)])
+
+    def test_pickle(self):
+        debug_visual = LazyDebugVisual(slic=np.ones((2, 2)))
+        # recipe with an unpicklable function is rendered before pickling
+        set_debug_image(debug_visual, 'img', lambda v: np.full((2, 2), v), 3)
+        debug_visual = pickle.loads(pickle.dumps(debug_visual))
+        self.assertIsInstance(debug_visual, LazyDebugVisual)
+        self.assertTrue(debug_visual.is_rendered('img'))
+        np.testing.assert_array_equal(debug_visual['img'], np.full((2, 2), 3))
+        np.testing.assert_array_equal(debug_visual['slic'], np.ones((2, 2)))
+
+    def test_plain_dict(self):
+        set_debug_image(None, 'img', self._render, (2, 2), 1)
+        self.assertEqual(self.calls, [])
+        debug_visual = {}
+        set_debug_image(debug_visual, 'img', self._render, (2, 2), 1)
+        self.assertEqual(self.calls, [1])
+        np.testing.assert_array_equal(debug_visual['img'], np.ones((2, 2)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
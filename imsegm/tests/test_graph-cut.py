@@ -11,6 +11,7 @@ import logging
 
 import numpy as np
 import pandas as pd
+from skimage import filters
 
 sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
 from imsegm.utilities.data_samples import (load_sample_image, IMAGE_DROSOPHILA_OVARY_2D,
@@ -19,7 +20,8 @@ from imsegm.utilities.data_io import update_path
 from imsegm.superpixels import segment_slic_img2d
 from imsegm.graph_cuts import (count_label_transitions_connected_segments,
                                compute_pairwise_cost_from_transitions,
-                               estim_class_model_gmm, segment_graph_cut_general)
+                               estim_class_model_gmm, segment_graph_cut_general,
+                               compute_otsu_thresholds)
 from imsegm.labeling import histogram_regions_labels_norm
 
 # set the output put directory
@@ -31,6 +33,18 @@ class TestGraphCut(unittest.TestCase):
     img = load_sample_image(IMAGE_DROSOPHILA_OVARY_2D)
     annot = load_sample_image(ANNOT_DROSOPHILA_OVARY_2D)
 
+    def test_otsu_thresholds(self):
+        # quantized values often fall right on the histogram bin edges
+        for seed in range(50):
+            np.random.seed(seed)
+            fts = np.random.randint(0, np.random.randint(2, 50), (200, 4))
+            fts = fts / float(np.random.randint(1, 7))
+            fts[:, -1] = 1.
+            thresholds = compute_otsu_thresholds(fts)
+            for i in range(fts.shape[1] - 1):
+                self.assertEqual(thresholds[i], filters.threshold_otsu(fts[:, i]))
+            self.assertEqual(thresholds[-1], 1.)
+
     def test_count_transitions_segment(self):
         img = self.img[:, :, 0]
         annot = self.annot.astype(int)
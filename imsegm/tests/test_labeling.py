@@ -16,7 +16,9 @@ import matplotlib.pyplot as plt
 sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
 from imsegm.utilities.data_samples import sample_segment_vertical_2d
 from imsegm.utilities.data_io import update_path
-from imsegm.labeling import binary_image_from_coords, contour_coords, compute_distance_map
+from imsegm.labeling import (binary_image_from_coords, contour_coords, compute_distance_map,
+                             contour_binary_map, contour_labels,
+                             compute_boundary_distance_stats)
 
 # set the output put directory
 PATH_OUTPUT = update_path('output', absolute=True)
@@ -46,6 +48,47 @@ class TestLabels(unittest.TestCase):
                 plt.show()
             plt.close(fig)
 
+    def test_label_contours_all(self):
+        seg = self.segm
+        for include_bound in [False, True]:
+            dict_masks = contour_labels(seg, include_boundary=include_bound, output='mask')
+            dict_coords = contour_labels(seg, include_boundary=include_bound)
+            for lb in np.unique(seg):
+                cnt = contour_binary_map(seg, lb, include_boundary=include_bound)
+                self.assertTrue(np.array_equal(cnt, dict_masks[lb]))
+                cnt_coords = binary_image_from_coords(dict_coords[lb], seg.shape)
+                self.assertTrue(np.array_equal(cnt, cnt_coords))
+                cnt_coords = binary_image_from_coords(
+                    contour_coords(seg, lb, include_boundary=include_bound), seg.shape)
+                self.assertTrue(np.array_equal(cnt, cnt_coords))
+
+    def test_boundary_distance_oversegm(self):
+        segm_ref = self.segm
+        # split the reference labels by horizontal cuts as superpixels would
+        rows = np.arange(segm_ref.shape[0])[:, np.newaxis] // 3
+        segm = segm_ref + rows * (segm_ref.max() + 1)
+
+        stat = compute_boundary_distance_stats(segm_ref, segm)
+        np.testing.assert_array_equal(stat['mean_ref2segm'], 0)
+        # the internal edges count in the symmetric statistics
+        self.assertTrue(np.all(stat['mean_segm2ref'] > 0))
+        self.assertTrue(np.all(stat['hausdorff'] > 0))
+        # but they are not matched to the reference boundary
+        np.testing.assert_array_equal(stat['mean_segm2ref_matched'], 0)
+        np.testing.assert_array_equal(stat['hausdorff_matched'], 0)
+
+    def test_boundary_distance_spurious(self):
+        segm_ref = np.zeros((50, 50), dtype=int)
+        segm_ref[5:15, 5:15] = 1
+        segm = segm_ref.copy()
+        # spurious object far from the reference one
+        segm[40:45, 40:45] = 1
+        stat = compute_boundary_distance_stats(segm_ref, segm)
+        dist_far = np.sqrt(np.sum((np.array([39, 39]) - [15, 15]) ** 2))
+        self.assertGreaterEqual(stat['hausdorff'][0], dist_far)
+        self.assertLess(stat['hausdorff_matched'][0], dist_far)
+        np.testing.assert_array_equal(stat['mean_ref2segm'], 0)
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
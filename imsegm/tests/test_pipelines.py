@@ -10,8 +10,10 @@ import sys
 import copy
 import unittest
 
+import numpy as np
 import matplotlib.pyplot as plt
 from scipy.misc import imresize
+from sklearn.ensemble import RandomForestClassifier
 
 sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
 import imsegm.descriptors
@@ -21,7 +23,8 @@ from imsegm.utilities.data_io import update_path
 from imsegm.utilities.drawing import figure_image_segm_results, figure_segm_graphcut_debug
 from imsegm.pipelines import (
     estim_model_classes_group, pipe_color2d_slic_features_model_graphcut,
-    train_classif_color2d_slic_features, segment_color2d_slic_features_model_graphcut)
+    train_classif_color2d_slic_features, segment_color2d_slic_features_model_graphcut,
+    predict_proba_batch)
 from imsegm.descriptors import FEATURES_SET_TEXTURE_SHORT
 
 PATH_OUTPUT = update_path('output', absolute=True)
@@ -179,6 +182,22 @@ class TestPipelinesClassif(unittest.TestCase):
     annot = load_sample_image(ANNOT_DROSOPHILA_OVARY_2D)
     img2 = load_sample_image(IMAGE_DROSOPHILA_OVARY_2D)[:, :, 0]
 
+    def test_predict_proba_batch(self):
+        np.random.seed(0)
+        classif = RandomForestClassifier(n_estimators=5, random_state=0)
+        classif.fit(np.random.random((50, 3)), np.random.randint(0, 3, 50))
+        list_features = [np.random.random((n, 3)) for n in (7, 0, 4)]
+        list_proba = predict_proba_batch(classif, list_features)
+        self.assertEqual([p.shape for p in list_proba], [(7, 3), (0, 3), (4, 3)])
+        for fts, proba in zip(list_features, list_proba):
+            if len(fts) > 0:
+                np.testing.assert_array_almost_equal(classif.predict_proba(fts),
+                                                     proba)
+        # batch without any features (e.g. images without superpixels)
+        list_proba = predict_proba_batch(classif, [np.empty((0, 3)), []])
+        self.assertEqual([p.shape for p in list_proba], [(0, 3), (0, 3)])
+        self.assertEqual(predict_proba_batch(classif, []), [])
+
     def test_segm_supervised(self):
         img = imresize(self.img, (256, 256))
         annot = imresize(self.annot, (256, 256), interp='nearest')
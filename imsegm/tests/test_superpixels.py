@@ -11,6 +11,10 @@ import logging
 
 import numpy as np
 import matplotlib.pyplot as plt
+import skimage.segmentation as ski_segm
+from scipy import ndimage
+from skimage import measure, color as sk_color
+from sklearn.metrics import adjusted_rand_score
 
 sys.path.append(os.path.abspath(os.path.join('..', '..')))  # Add path to root
 from imsegm.utilities.data_samples import (IMAGE_LENNA, load_sample_image,
@@ -18,7 +22,10 @@ from imsegm.utilities.data_samples import (IMAGE_LENNA, load_sample_image,
                                            sample_segment_vertical_3d)
 from imsegm.utilities.data_io import update_path
 from imsegm.superpixels import (segment_slic_img2d, make_graph_segm_connect_grid2d_conn4,
-                                make_graph_segm_connect_grid3d_conn6)
+                                make_graph_segm_connect_grid3d_conn6,
+                                segment_slic_img3d_gray, SlicSuperpixels,
+                                prepare_slic_image)
+import imsegm.superpixels
 
 # set default output path
 PATH_OUTPUT = update_path('output', absolute=True)
@@ -56,6 +63,63 @@ class TestSuperpixels(unittest.TestCase):
             plt.show()
         plt.close(fig)
 
+    def test_engine_sweep(self):
+        """ compare with plain SLIC on the normalised image with internal
+        smoothing, up to single float precision rounding """
+        img = self.img.astype(np.float32)
+        img = (img - img.min()) / (img.max() - img.min())
+        engine = SlicSuperpixels(self.img)
+        for sp_size in (10, 15, 25):
+            slic = engine.segment(sp_size, relative_compact=0.2)
+            nb_segments = int(np.prod(img.shape[:2]) / sp_size ** 2)
+            slic_ref = ski_segm.slic(img, n_segments=nb_segments,
+                                     compactness=(sp_size * 0.2) ** 1.5,
+                                     sigma=1, enforce_connectivity=True)
+            self.assertEqual(slic.shape, self.img.shape[:2])
+            self.assertGreater(adjusted_rand_score(slic_ref.ravel(), slic.ravel()), 0.99)
+
+        img_gray = np.mean(self.img, axis=2)
+        slic = SlicSuperpixels(img_gray).segment(15, relative_compact=0.2)
+        self.assertEqual(slic.shape, img_gray.shape)
+
+    def test_prepare_order(self):
+        """ smoothing and colour conversion in both orders of scikit-image
+        versions, the older one smooths the RGB image first """
+        img = self.img.astype(np.float32)
+        img = (img - img.min()) / (img.max() - img.min())
+        smooth_before_lab = imsegm.superpixels.SLIC_SMOOTH_BEFORE_LAB
+        try:
+            imsegm.superpixels.SLIC_SMOOTH_BEFORE_LAB = True
+            img_ref = sk_color.rgb2lab(ndimage.gaussian_filter(img, (1, 1, 0)))
+            np.testing.assert_allclose(prepare_slic_image(self.img), img_ref,
+                                       atol=1e-2)
+            imsegm.superpixels.SLIC_SMOOTH_BEFORE_LAB = False
+            img_ref = ndimage.gaussian_filter(sk_color.rgb2lab(img), (1, 1, 0))
+            np.testing.assert_allclose(prepare_slic_image(self.img), img_ref,
+                                       atol=1e-2)
+        finally:
+            imsegm.superpixels.SLIC_SMOOTH_BEFORE_LAB = smooth_before_lab
+
+    def test_slic_3d(self):
+        """ compare with plain SLIC and relabeling of connected components """
+        np.random.seed(0)
+        img = np.random.random((20, 60, 60)).astype(np.float32) * 0.1
+        img[:, 20:40, 20:40] += 1
+        img[5:15, 30:50, 10:30] += 0.5
+        slic = segment_slic_img3d_gray(img, 10, 0.2, (2, 1, 1))
+        sp_size = np.prod(10 / np.array([2., 1., 1.], dtype=np.float32))
+        slic_ref = ski_segm.slic(img[..., np.newaxis],
+                                 n_segments=int(img.size / sp_size),
+                                 compactness=int((sp_size * 0.2) ** 1.5),
+                                 spacing=np.array([2., 1., 1.]), sigma=1,
+                                 enforce_connectivity=True)
+        slic_ref = measure.label(slic_ref)
+        self.assertEqual(slic.shape, img.shape)
+        self.assertGreater(adjusted_rand_score(slic_ref.ravel(), slic.ravel()), 0.99)
+        # all superpixels are already connected components
+        self.assertEqual(len(np.unique(measure.label(slic, background=-1))),
+                         len(np.unique(slic)))
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
@@ -7,22 +7,57 @@ Copyright (C) 2015-2018 Jiri Borovec <jiri.borovec@fel.cvut.cz>
 import os
 import re
 import glob
+import json
+import atexit
+import fnmatch
+import time
 import logging
 import warnings
+import threading
+import collections
 from functools import wraps
+from multiprocessing import util as mproc_util
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 
 import numpy as np
 import pandas as pd
 from PIL import Image
 # import libtiff, nibabel
 from scipy import ndimage
-from skimage import exposure, io, color, measure
+from skimage import io, color, measure
 import nibabel
+try:
+    import tifffile
+except ImportError:  # older scikit-image bundles the tifffile
+    try:
+        from skimage.external import tifffile
+    except ImportError:
+        tifffile = None
 
 from imsegm.utilities import read_zvi
 
 COLUMNS_COORDS = ['X', 'Y']
 DEFAULT_PATTERN_SET_LIST_FILE = '*.txt'
+#: max range of integer image values to compute quantiles from histogram
+QUANTILE_HIST_MAX_BINS = 2 ** 20
+#: number of histogram bins of the approximate quantile sketch for floats
+QUANTILE_SKETCH_NB_BINS = 2 ** 14
+#: number of images loaded ahead by the prefetching loader
+PREFETCH_NB_IMAGES = 2
+#: number of background threads of the prefetching loader
+PREFETCH_NB_THREADS = 2
+#: max number of pending jobs of the background export service
+EXPORT_QUEUE_SIZE = 16
+#: number of background writer threads of the export service
+EXPORT_NB_THREADS = 2
+#: zlib compression level of exported PNG images, 6 is the PIL default
+EXPORT_PNG_COMPRESS_LEVEL = 3
+#: storage type of exported soft segmentations - None, 'float16' or 'uint8'
+EXPORT_SOFT_DTYPE = None
 DICT_CONVERT_COLOR_FROM_RGB = {
     'hsv': color.rgb2hsv,
     'luv': color.rgb2luv,
@@ -264,12 +299,249 @@ def scale_image_vals_in_range(img, im_range=1.):
     return img
 
 
-def scale_image_intensity(img, im_range=1., quantiles=(2, 98)):
+def _quantiles_from_histogram(hist, quantiles, offset=0):
+    """ quantiles with linear interpolation (as `np.percentile`)
+    from histogram of integer values starting at `offset` """
+    cum_hist = np.cumsum(hist)
+    positions = np.asarray(quantiles, dtype=float) / 100. * (cum_hist[-1] - 1)
+    idx_low = np.floor(positions)
+    v_low = np.searchsorted(cum_hist, idx_low, side='right')
+    v_high = np.searchsorted(cum_hist, idx_low + 1, side='right')
+    v_high = np.minimum(v_high, len(hist) - 1)
+    vals = v_low + (v_high - v_low) * (positions - idx_low)
+    return vals + offset
+
+
+class QuantileSketch(object):
+    """ histogram sketch for computing quantiles incrementally over tiles
+    or slices of data which do not fit in memory
+
+    Integer values are counted exactly per value (while the range is bellow
+    `QUANTILE_HIST_MAX_BINS`) so the quantiles equal `np.percentile`,
+    float values are binned into fixed number of bins with range doubling
+    as needed; both order statistics interpolated by `np.percentile` are
+    located in their bins, so the error is bellow a bin width `range / nb_bins`.
+
+    >>> np.random.seed(0)
+    >>> img = np.random.randint(0, 1000, (50, 40))
+    >>> sketch = QuantileSketch()
+    >>> for tile in np.array_split(img, 4):
+    ...     sketch.update(tile)
+    >>> sketch.exact, sketch.quantiles((2, 50, 98)).tolist()
+    (True, [24.0, 507.0, 977.02])
+    >>> np.percentile(img, (2, 50, 98)).tolist()
+    [24.0, 507.0, 977.02]
+    >>> sketch = QuantileSketch()
+    >>> for tile in np.array_split(img / 100., 4):
+    ...     sketch.update(tile)
+    >>> sketch.exact, sketch.quantiles((2, 50, 98)).round(2).tolist()
+    (False, [0.24, 5.07, 9.77])
+    """
+
+    def __init__(self, nb_bins=QUANTILE_SKETCH_NB_BINS):
+        """ initialise empty sketch
+
+        :param int nb_bins: number of bins for float values
+        """
+        self.nb_bins = nb_bins
+        self.exact = None
+        self.hist = None
+        self.offset = 0
+        self.bin_width = 1.
+
+    def _update_exact(self, values):
+        v_min, v_max = int(np.min(values)), int(np.max(values))
+        if self.hist is None:
+            if v_max - v_min >= QUANTILE_HIST_MAX_BINS:
+                # too large range from the beginning, nothing to convert
+                self.exact = False
+                self._update_bins(values)
+                return
+            self.offset, self.hist = v_min, np.zeros(1, dtype=np.int64)
+        range_max = max(v_max, self.offset + len(self.hist) - 1)
+        range_min = min(v_min, self.offset)
+        if range_max - range_min >= QUANTILE_HIST_MAX_BINS:
+            # too large range, continue with binned histogram
+            self._convert_to_bins(v_min, v_max)
+            self._update_bins(values)
+            return
+        if v_min < self.offset:
+            self.hist = np.pad(self.hist, (self.offset - v_min, 0), 'constant')
+            self.offset = v_min
+        if v_max >= self.offset + len(self.hist):
+            self.hist = np.pad(self.hist, (0, v_max - self.offset - len(self.hist) + 1),
+                               'constant')
+        self.hist += np.bincount((values - self.offset).astype(np.intp),
+                                 minlength=len(self.hist))
+
+    def _convert_to_bins(self, v_min, v_max):
+        """ switch from exact counting to binned histogram """
+        vals = self.offset + np.arange(len(self.hist))
+        nonzero = self.hist > 0
+        vals, counts = vals[nonzero], self.hist[nonzero]
+        self.exact, self.hist = False, None
+        if vals.size == 0:
+            self._init_bins(v_min, v_max)
+            return
+        self._init_bins(min(v_min, np.min(vals)), max(v_max, np.max(vals)))
+        idxs = self._bin_indexes(vals)
+        self.hist += np.bincount(idxs, weights=counts,
+                                 minlength=self.nb_bins).astype(np.int64)
+
+    def _init_bins(self, v_min, v_max):
+        self.offset = float(v_min)
+        self.bin_width = max(float(v_max - v_min), np.finfo(float).eps) \
+            / self.nb_bins * (1 + 1e-9)
+        self.hist = np.zeros(self.nb_bins, dtype=np.int64)
+
+    def _bin_indexes(self, values):
+        idxs = ((values - self.offset) / self.bin_width).astype(np.intp)
+        return np.clip(idxs, 0, self.nb_bins - 1)
+
+    def _update_bins(self, values):
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        v_min, v_max = float(np.min(values)), float(np.max(values))
+        if self.hist is None:
+            self._init_bins(v_min, v_max)
+        # double the range (merging pairs of bins) until the values fit in
+        while v_min < self.offset:
+            self.offset -= self.nb_bins * self.bin_width
+            self.hist = np.concatenate([np.zeros(self.nb_bins, dtype=np.int64),
+                                        self.hist])
+            self.hist = self.hist[0::2] + self.hist[1::2]
+            self.bin_width *= 2
+        while v_max >= self.offset + self.nb_bins * self.bin_width:
+            self.hist = np.concatenate([self.hist,
+                                        np.zeros(self.nb_bins, dtype=np.int64)])
+            self.hist = self.hist[0::2] + self.hist[1::2]
+            self.bin_width *= 2
+        self.hist += np.bincount(self._bin_indexes(values),
+                                 minlength=self.nb_bins)
+
+    def update(self, values):
+        """ add values (e.g. an image tile or volume slice) to the sketch
+
+        :param ndarray values: values of any shape
+        """
+        values = np.asarray(values).ravel()
+        if values.size == 0:
+            return
+        if self.hist is None:
+            # nothing collected yet (e.g. only non-finite values so far)
+            self.exact = values.dtype.kind in 'uib'
+        if values.dtype.kind == 'b':
+            values = values.astype(np.uint8)
+        if self.exact and values.dtype.kind in 'ui':
+            self._update_exact(values)
+        else:
+            if self.exact:
+                finite = values[np.isfinite(values)]
+                if finite.size == 0:
+                    return
+                self._convert_to_bins(np.min(finite), np.max(finite))
+            self._update_bins(values)
+
+    def quantiles(self, quantiles=(2, 98)):
+        """ estimate quantiles from the collected histogram
+
+        :param (int, int) quantiles: quantiles in range (0, 100)
+        :return ndarray:
+        """
+        assert self.hist is not None, 'no values were added'
+        if self.exact:
+            return _quantiles_from_histogram(self.hist, quantiles, self.offset)
+        cum_hist = np.cumsum(self.hist)
+        positions = np.asarray(quantiles, dtype=float) / 100. * (cum_hist[-1] - 1)
+        orders = np.floor(positions)
+
+        def _order_statistic(order):
+            # place the value evenly among the others within its bin
+            idxs = np.searchsorted(cum_hist, order, side='right')
+            counts_before = np.r_[0, cum_hist][idxs]
+            fractions = (order - counts_before + 0.5) / self.hist[idxs]
+            return self.offset + self.bin_width * (idxs + fractions)
+
+        # linear interpolation in between the order statistics as np.percentile
+        vals_low = _order_statistic(orders)
+        vals_high = _order_statistic(np.minimum(orders + 1, cum_hist[-1] - 1))
+        return vals_low + (positions - orders) * (vals_high - vals_low)
+
+
+def compute_image_quantiles(img, quantiles=(2, 98), approx=False):
+    """ compute quantiles of image values, for integer images from a histogram
+    which gives the same values as `np.percentile` without sorting a copy,
+    float images are exact (sorting) or approximated by histogram sketch
+
+    :param ndarray img: input image
+    :param (int, int) quantiles: quantiles in range (0, 100)
+    :param bool approx: approximate quantiles of float images
+    :return ndarray:
+
+    >>> np.random.seed(0)
+    >>> img = np.random.randint(10, 255, (25, 30))
+    >>> compute_image_quantiles(img, (2, 50, 98)).tolist()
+    [13.0, 128.0, 248.0]
+    >>> np.percentile(img, (2, 50, 98)).tolist()
+    [13.0, 128.0, 248.0]
+    >>> compute_image_quantiles(img / 255., (2, 98)).round(3).tolist()
+    [0.051, 0.973]
+    >>> compute_image_quantiles(img / 255., (2, 98), approx=True).round(3).tolist()
+    [0.051, 0.973]
+    """
+    img = np.asarray(img)
+    if img.size == 0 or (img.dtype.kind not in 'uib' and not approx):
+        return np.percentile(img, quantiles)
+    sketch = QuantileSketch()
+    sketch.update(img)
+    if img.dtype.kind in 'uib' and not sketch.exact:
+        return np.percentile(img, quantiles)
+    return sketch.quantiles(quantiles)
+
+
+def rescale_intensity_inplace(img, in_range, dtype=np.float64):
+    """ rescale image intensities from the given input range to (0, 1),
+    or to (-1, 1) for negative lower bound, as `exposure.rescale_intensity`
+    with `out_range='float'` but with single copy in the requested dtype
+
+    :param ndarray img: input image
+    :param (float, float) in_range: input range of values
+    :param dtype: output float type
+    :return ndarray:
+
+    >>> img = np.array([-5., 0, 3, 10, 20])
+    >>> rescale_intensity_inplace(img, (1, 15)).round(3).tolist()
+    [0.0, 0.0, 0.143, 0.643, 1.0]
+    >>> rescale_intensity_inplace(img, (-2, 15), np.float32).dtype
+    dtype('float32')
+    """
+    v_low, v_high = map(float, in_range)
+    out_low, out_high = (0., 1.) if v_low >= 0 else (-1., 1.)
+    img = np.array(img, dtype=dtype)
+    np.clip(img, v_low, v_high, out=img)
+    if v_low == v_high:
+        np.clip(img, out_low, out_high, out=img)
+        return img
+    img -= v_low
+    img /= (v_high - v_low)
+    if out_low != 0:
+        img *= (out_high - out_low)
+        img += out_low
+    return img
+
+
+def scale_image_intensity(img, im_range=1., quantiles=(2, 98), in_range=None,
+                          approx=False, dtype=np.float64):
     """ scale image values with in give quntile range to filter some outlaiers
 
     :param ndarray img: input image
     :param im_range: range to scale image values (1. or 255)
     :param (int, int) quantiles: scale image values in certain quantile range
+    :param (float, float) in_range: precomputed range of input values,
+        e.g. quantiles of whole volume to scale it slice by slice
+    :param bool approx: approximate quantiles of float images by histogram
+    :param dtype: float type of scaled image, e.g. `np.float32` to save memory
     :return ndarray:
 
     >>> np.random.seed(0)
@@ -279,12 +551,15 @@ def scale_image_intensity(img, im_range=1., quantiles=(2, 98)):
     0.0
     >>> im.max()
     1.0
+    >>> im = scale_image_intensity(img[:5], in_range=(13, 248))
+    >>> np.array_equal(im, scale_image_intensity(img)[:5])
+    True
+    >>> scale_image_intensity(img, dtype=np.float32).dtype
+    dtype('float32')
     """
-    p_low = np.percentile(img, quantiles[0])
-    p_high = np.percentile(img, quantiles[1])
-    img = exposure.rescale_intensity(img.astype(float),
-                                     in_range=(p_low, p_high),
-                                     out_range='float')
+    if in_range is None:
+        in_range = compute_image_quantiles(img, quantiles, approx=approx)
+    img = rescale_intensity_inplace(img, in_range, dtype=dtype)
     if im_range == 255:
         img = np.array(img * im_range).astype(np.uint8)
     return img
@@ -295,17 +570,24 @@ def io_image_decorate(func):
     to suppress PIl debug logging
     - DEBUG:PIL.PngImagePlugin:STREAM b'IHDR' 16 13
 
+    Only the PIL loggers are muted, so the logging of other computations
+    (e.g. running while images are loaded in prefetching threads) is kept.
+
     :param func:
     :return:
     """
     @wraps(func)
     def wrap(*args, **kwargs):
-        log_level = logging.getLogger().getEffectiveLevel()
-        logging.getLogger().setLevel(logging.INFO)
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            response = func(*args, **kwargs)
-        logging.getLogger().setLevel(log_level)
+        logger = logging.getLogger('PIL')
+        log_level = logger.level
+        if logger.getEffectiveLevel() < logging.INFO:
+            logger.setLevel(logging.INFO)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                response = func(*args, **kwargs)
+        finally:
+            logger.setLevel(log_level)
         return response
     return wrap
 
@@ -630,18 +912,154 @@ def convert_nifti_2_img(path_img_in, path_img_out):
 #     toolsTest.runCommandLine(cmdMatlab, fLog)
 
 
-def load_image_tiff_volume(path_img, im_range=None):
+class TiffVolume(object):
+    """ lazy access to a TIFF volume (stack of pages) without loading all,
+    if the file layout allows it, the data are memory-mapped (read-only)
+    otherwise the slices are decoded from pages on request
+
+    The first axis is sliced lazily so views like bands `volume[0::2]`
+    do not copy any data, slices may be streamed by iterating the volume.
+
+    >>> img = np.random.randint(0, 255, (6, 20, 25)).astype(np.uint8)
+    >>> p_img = './sample-volume.tif'
+    >>> tifffile.imwrite(p_img, img)
+    >>> vol = TiffVolume(p_img)
+    >>> vol.shape, vol.dtype, vol.is_memmap
+    ((6, 20, 25), dtype('uint8'), True)
+    >>> band = vol.view(slice(1, None, 2))
+    >>> band.shape
+    (3, 20, 25)
+    >>> np.array_equal(band[1], img[3]), np.array_equal(band[:, 5], img[1::2, 5])
+    (True, True)
+    >>> [sl.shape for sl in band]
+    [(20, 25), (20, 25), (20, 25)]
+    >>> np.array_equal(vol.quantiles((2, 98)), np.percentile(img, (2, 98)))
+    True
+    >>> np.array_equal(np.asarray(band), img[1::2])
+    True
+    >>> vol.close()
+    >>> os.remove(p_img)
+    """
+
+    def __init__(self, path_img, _parent=None, _range=None):
+        """ open the volume
+
+        :param str path_img: path to the TIFF image
+        """
+        assert tifffile is not None, 'missing `tifffile` package'
+        self.path_img = path_img
+        if _parent is not None:
+            self._data, self._tif = _parent._data, _parent._tif
+            self._shape, self.dtype = _parent._shape, _parent.dtype
+            self._range = _range
+            return
+        assert os.path.isfile(path_img), 'missing: %s' % path_img
+        self._tif = tifffile.TiffFile(path_img)
+        series = self._tif.series[0]
+        self._shape, self.dtype = tuple(series.shape), np.dtype(series.dtype)
+        try:
+            self._data = tifffile.memmap(path_img, mode='r')
+        except Exception:
+            self._data = None
+            # decode slices from pages only for one page per slice
+            if len(series.pages) != self._shape[0]:
+                self._data = series.asarray()
+        if self._data is not None:
+            self._tif.close()
+            self._tif = None
+        self._range = range(self._shape[0])
+
+    @property
+    def is_memmap(self):
+        return isinstance(self._data, np.memmap)
+
+    @property
+    def shape(self):
+        return (len(self._range), ) + self._shape[1:]
+
+    @property
+    def ndim(self):
+        return len(self._shape)
+
+    def __len__(self):
+        return len(self._range)
+
+    def _read_slice(self, idx):
+        if self._data is not None:
+            return self._data[idx]
+        return self._tif.series[0].pages[idx].asarray()
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key, )
+        key_first, key_rest = key[0], key[1:]
+        if isinstance(key_first, slice):
+            sub_range = self._range[key_first]
+            if self._data is not None:
+                stop = sub_range.stop if sub_range.stop >= 0 else None
+                img = self._data[slice(sub_range.start, stop, sub_range.step)]
+            else:
+                img = np.array([self._read_slice(i) for i in sub_range])
+                img = img.reshape((len(sub_range), ) + self._shape[1:])
+            key_rest = (slice(None), ) + key_rest
+        else:
+            img = self._read_slice(self._range[key_first])
+        return img[key_rest] if key_rest else img
+
+    def __iter__(self):
+        for idx in self._range:
+            yield self._read_slice(idx)
+
+    def __array__(self, dtype=None):
+        img = self[:]
+        return np.asarray(img, dtype=dtype)
+
+    def view(self, key):
+        """ lazy sub-volume along the first axis, e.g. a band `slice(0, None, 2)`
+
+        :param slice key: slice of the first axis
+        :return TiffVolume:
+        """
+        return TiffVolume(self.path_img, _parent=self, _range=self._range[key])
+
+    def quantiles(self, quantiles=(2, 98)):
+        """ compute quantiles of volume values streaming slice by slice,
+        exact for integer values otherwise approximated, see `QuantileSketch`
+
+        :param (int, int) quantiles: quantiles in range (0, 100)
+        :return ndarray:
+        """
+        sketch = QuantileSketch()
+        for img in self:
+            sketch.update(img)
+        return sketch.quantiles(quantiles)
+
+    def close(self):
+        if self._tif is not None:
+            self._tif.close()
+            self._tif = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_image_tiff_volume(path_img, im_range=None, lazy=False):
     """ loading TIFF image
 
     :param str path_img: path to the input image
     :param float im_range: range to scale image values (1. or 255)
-    :return ndarray:
+    :param bool lazy: return lazy (memory-mapped) volume without any scaling
+    :return ndarray|TiffVolume:
 
     >>> p_img = os.path.join(update_path('data_images'), 'drosophila_ovary_3D',
     ...                      'AU10-13_f0011.tif')
     >>> img = load_image_tiff_volume(p_img)
     >>> img.shape
     (30, 323, 512)
+    >>> load_image_tiff_volume(p_img, lazy=True).shape
+    (30, 323, 512)
     >>> p_img = os.path.join(update_path('data_images'),
     ...                      'drosophila_ovary_slice', 'image', 'insitu7545.tif')
     >>> img = load_image_tiff_volume(p_img)
@@ -651,6 +1069,9 @@ def load_image_tiff_volume(path_img, im_range=None):
     path_img = update_path(path_img)
     assert os.path.exists(path_img), 'given image "%s" not exist!' % path_img
 
+    if lazy:
+        return TiffVolume(path_img)
+
     img = io_imread(path_img)
 
     # special case of loading 2d tiff
@@ -665,13 +1086,48 @@ def load_image_tiff_volume(path_img, im_range=None):
     return img
 
 
-def load_tiff_volume_split_double_band(path_img, im_range=None):
+def _load_tiff_volume_double_band(path_img, im_range=None, lazy=False):
+    """ load two bands of a true volume (without RGB channels) as views
+    of a lazy volume, None if the volume does not have this layout """
+    if tifffile is None:
+        return None
+    try:
+        vol = TiffVolume(update_path(path_img))
+    except Exception:
+        logging.debug('TIFF image "%s" can not be opened lazily', path_img)
+        return None
+    if vol.ndim != 3 or vol.shape[0] < 4 or vol.shape[2] == 3:
+        vol.close()
+        return None
+    img_b1, img_b2 = vol.view(slice(0, None, 2)), vol.view(slice(1, None, 2))
+    assert len(img_b1) == len(img_b2), \
+        'not equal slice number for %r and %r' % (img_b1.shape, img_b2.shape)
+    if lazy:
+        return img_b1, img_b2
+    # the same scaling for both bands, as for the whole volume
+    in_range = vol.quantiles() if im_range is not None else None
+    imgs = []
+    for band in (img_b1, img_b2):
+        img = np.array(band)
+        if im_range is not None:
+            img = scale_image_intensity(img, im_range, in_range=in_range)
+        imgs.append(img)
+    vol.close()
+    return tuple(imgs)
+
+
+def load_tiff_volume_split_double_band(path_img, im_range=None, lazy=False):
     """ load TIFF volume  assuming that there are two bands in zip style:
     c1, c2, c1, c2, c1, ...
     and split each odd index belong to one of two bands
 
+    The true volumes are read lazily (memory-mapped if possible) so each band
+    is copied only once, or not at all for `lazy` where the bands
+    are returned as :class:`TiffVolume` views without any scaling.
+
     :param str path_img: path to the input image
     :param float im_range: range to scale image values (1. or 255)
+    :param bool lazy: return bands of true volumes as lazy views
     :return ndarray, ndarray:
 
     >>> p_img = os.path.join(update_path('data_images'), 'drosophila_ovary_3D',
@@ -691,7 +1147,22 @@ def load_tiff_volume_split_double_band(path_img, im_range=None):
     >>> img_b1.shape, img_b2.shape
     ((1, 250, 200), (1, 250, 200))
     >>> os.remove(p_img)
+    >>> img = np.random.randint(0, 255, (8, 30, 20)).astype(np.uint8)
+    >>> p_img = './sample-volume.tif'
+    >>> io.imsave(p_img, img)
+    >>> img_b1, img_b2 = load_tiff_volume_split_double_band(p_img, lazy=True)
+    >>> img_b1.shape, np.array_equal(img_b2[2], img[5])
+    ((4, 30, 20), True)
+    >>> img_b1, img_b2 = load_tiff_volume_split_double_band(p_img, im_range=1.)
+    >>> scaled = scale_image_intensity(img)
+    >>> np.array_equal(img_b1, scaled[::2]), np.array_equal(img_b2, scaled[1::2])
+    (True, True)
+    >>> os.remove(p_img)
     """
+    imgs = _load_tiff_volume_double_band(path_img, im_range, lazy)
+    if imgs is not None:
+        return imgs
+
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
         img = load_image_tiff_volume(path_img, im_range)
@@ -804,6 +1275,379 @@ def scale_image_size(path_img, size, path_out=None):
     return path_out
 
 
+def load_image_file(path_img):
+    """ load image of any supported type - PNG, JPEG, TIFF or ZVI
+
+    :param str path_img: path to the input image
+    :return ndarray:
+
+    >>> path_img = './testing-image.png'
+    >>> io.imsave(path_img, np.zeros((20, 25, 3), dtype=np.uint8))
+    >>> load_image_file(path_img).shape
+    (20, 25, 3)
+    >>> os.remove(path_img)
+    """
+    assert os.path.isfile(path_img), 'missing: %s' % path_img
+    img_ext = os.path.splitext(path_img)[1].lower()
+    if img_ext == '.zvi':
+        img = read_zvi.load_image(path_img)
+    elif img_ext in ['.tif', '.tiff']:
+        img = load_image_tiff_volume(path_img)
+    else:
+        img, _ = load_image_2d(path_img)
+    return img
+
+
+class ImagePrefetchLoader(object):
+    """ iterate over images as pairs (name, image), while the current image
+    is processed the next few are loaded ahead on background threads,
+    so the disk and decode latency overlap with computation
+
+    The number of images in memory is bounded by the `nb_prefetch`.
+    After the iteration the `timing` contains total time of loading
+    (summed over threads), waiting for an image and computing in between.
+
+    >>> paths = ['./temp_sample-image-%i.png' % i for i in range(5)]
+    >>> for i, path in enumerate(paths):
+    ...     io.imsave(path, np.full((20, 25), i, dtype=np.uint8))
+    >>> loader = ImagePrefetchLoader(paths, nb_prefetch=2)
+    >>> len(loader)
+    5
+    >>> [(name, int(img.mean())) for name, img in loader]  # doctest: +NORMALIZE_WHITESPACE
+    [('temp_sample-image-0', 0), ('temp_sample-image-1', 1),
+     ('temp_sample-image-2', 2), ('temp_sample-image-3', 3),
+     ('temp_sample-image-4', 4)]
+    >>> sorted(loader.timing.keys())
+    ['compute', 'load', 'wait']
+    >>> loader = ImagePrefetchLoader(paths, with_names=False)
+    >>> [int(img.mean()) for img in loader]
+    [0, 1, 2, 3, 4]
+    >>> _ = [os.remove(path) for path in paths]
+    """
+
+    def __init__(self, path_imgs, load_func=load_image_file,
+                 nb_prefetch=PREFETCH_NB_IMAGES, nb_workers=PREFETCH_NB_THREADS,
+                 with_names=True):
+        """ initialise the loader
+
+        :param [str] path_imgs: paths to the input images
+        :param load_func: function loading an image from given path
+        :param int nb_prefetch: number of images loaded ahead
+        :param int nb_workers: number of background threads
+        :param bool with_names: yield pairs (name, image), otherwise only images
+        """
+        self.path_imgs = list(path_imgs)
+        self.load_func = load_func
+        self.nb_prefetch = max(1, nb_prefetch)
+        self.nb_workers = max(1, nb_workers)
+        self.with_names = with_names
+        self.timing = {'load': 0., 'wait': 0., 'compute': 0.}
+
+    def _load(self, path_img):
+        t_start = time.time()
+        img = self.load_func(path_img)
+        return img, time.time() - t_start
+
+    def __iter__(self):
+        self.timing = {'load': 0., 'wait': 0., 'compute': 0.}
+        pool = ThreadPool(self.nb_workers)
+        queue = collections.deque()
+        paths = iter(self.path_imgs)
+        try:
+            for path_img in paths:
+                queue.append((path_img, pool.apply_async(self._load, (path_img, ))))
+                if len(queue) >= self.nb_prefetch:
+                    break
+            while queue:
+                path_img, res = queue.popleft()
+                t_start = time.time()
+                img, t_load = res.get()
+                self.timing['wait'] += time.time() - t_start
+                self.timing['load'] += t_load
+                # refill the queue before returning the image
+                for path_next in paths:
+                    queue.append((path_next,
+                                  pool.apply_async(self._load, (path_next, ))))
+                    break
+                name = os.path.splitext(os.path.basename(path_img))[0]
+                t_start = time.time()
+                yield (name, img) if self.with_names else img
+                self.timing['compute'] += time.time() - t_start
+        finally:
+            pool.terminate()
+        logging.debug('prefetching %i images took - load: %f, wait: %f, '
+                      'compute: %f seconds', len(self.path_imgs),
+                      self.timing['load'], self.timing['wait'],
+                      self.timing['compute'])
+
+    def __len__(self):
+        return len(self.path_imgs)
+
+
+@io_image_decorate
+def save_image_png(path_img, img, compress_level=EXPORT_PNG_COMPRESS_LEVEL):
+    """ save an 8-bit image (gray, RGB or RGBA) as PNG with given zlib level,
+    lower levels are much faster while the file is just slightly bigger
+
+    :param str path_img: path to the output image
+    :param ndarray img: image np.array<height, width(, channels)>
+    :param int compress_level: zlib compression level in range 0 - 9
+    :return str: path to the image
+
+    >>> img = np.random.randint(0, 255, (20, 30, 3)).astype(np.uint8)
+    >>> path_img = save_image_png('./testing-image.jpg', img, compress_level=1)
+    >>> path_img
+    './testing-image.png'
+    >>> np.array_equal(io_imread(path_img), img)
+    True
+    >>> os.remove(path_img)
+    """
+    path_img = os.path.splitext(path_img)[0] + '.png'
+    Image.fromarray(np.asarray(img, dtype=np.uint8)).save(
+        path_img, compress_level=compress_level)
+    return path_img
+
+
+def quantize_segm_soft(segm_soft, dtype=EXPORT_SOFT_DTYPE):
+    """ convert soft segmentation (probabilities) to storage type,
+    the `uint8` maps the range [0, 1] into 256 levels
+
+    :param ndarray segm_soft: probabilities np.array<height, width, nb_classes>
+    :param str|None dtype: None, 'float16' or 'uint8'
+    :return ndarray:
+
+    >>> quantize_segm_soft(np.array([0., 0.25, 1.]), 'uint8')
+    array([  0,  64, 255], dtype=uint8)
+    >>> quantize_segm_soft(np.array([0., 0.25, 1.]), 'float16')
+    array([ 0.  ,  0.25,  1.  ], dtype=float16)
+    """
+    if dtype is None:
+        return segm_soft
+    dtype = np.dtype(dtype)
+    assert dtype in (np.float16, np.uint8), 'not supported type: %r' % dtype
+    if dtype == np.uint8:
+        return np.round(np.clip(segm_soft, 0, 1) * 255).astype(np.uint8)
+    return segm_soft.astype(dtype)
+
+
+def save_segm_soft(path_npz, segm_soft, dtype=EXPORT_SOFT_DTYPE, compress=True):
+    """ save soft segmentation optionally quantized to smaller storage type
+
+    :param str path_npz: path to the output NPZ file
+    :param ndarray segm_soft: probabilities np.array<height, width, nb_classes>
+    :param str|None dtype: None, 'float16' or 'uint8', see `quantize_segm_soft`
+    :param bool compress: use ZIP compression
+    :return str: path to the file
+
+    >>> segm_soft = np.random.random((10, 15, 3))
+    >>> path_npz = save_segm_soft('./testing-segm.npz', segm_soft, dtype='uint8')
+    >>> segm = load_segm_soft(path_npz)
+    >>> segm.dtype, np.abs(segm - segm_soft).max() <= 0.5 / 255
+    (dtype('float64'), True)
+    >>> os.remove(path_npz)
+    """
+    segm_soft = quantize_segm_soft(segm_soft, dtype)
+    save_npz = np.savez_compressed if compress else np.savez
+    save_npz(path_npz, segm_soft)
+    return path_npz
+
+
+def load_segm_soft(path_npz):
+    """ load soft segmentation saved by `save_segm_soft` or `np.savez`
+    and convert quantized storage back to probabilities
+
+    :param str path_npz: path to the NPZ file
+    :return ndarray: probabilities np.array<height, width, nb_classes>
+    """
+    with np.load(path_npz) as npz:
+        segm_soft = npz[npz.files[0]]
+    if segm_soft.dtype == np.uint8:
+        segm_soft = segm_soft / 255.
+    elif segm_soft.dtype == np.float16:
+        segm_soft = segm_soft.astype(np.float64)
+    return segm_soft
+
+
+class ImageExportService(object):
+    """ write exported results on background threads, so PNG and ZIP
+    compression overlap with computation
+
+    The jobs are kept in a bounded queue, when it is full a new request blocks
+    till some job is finished, which limits the memory for pending images.
+    All pending jobs are written on `flush`, `close` or at the interpreter exit.
+    Note that the exported arrays should not be changed after submitting.
+
+    >>> paths = ['./temp_export-image-%i.png' % i for i in range(3)]
+    >>> with ImageExportService(nb_workers=2, queue_size=2) as exporter:
+    ...     for i, path in enumerate(paths):
+    ...         _= exporter.save_image_png(path, np.full((20, 25), i * 50))
+    ...     path_npz = exporter.save_segm_soft('./temp_export-segm.npz',
+    ...                                        np.full((20, 25, 2), 0.5),
+    ...                                        dtype='uint8')
+    >>> [int(io_imread(path).mean()) for path in paths]
+    [0, 50, 100]
+    >>> load_segm_soft(path_npz)[0, 0]
+    array([ 0.50196078,  0.50196078])
+    >>> exporter.nb_failed
+    0
+    >>> _ = [os.remove(path) for path in paths + [path_npz]]
+    """
+
+    def __init__(self, nb_workers=EXPORT_NB_THREADS, queue_size=EXPORT_QUEUE_SIZE,
+                 compress_level=EXPORT_PNG_COMPRESS_LEVEL,
+                 soft_dtype=EXPORT_SOFT_DTYPE):
+        """ initialise the service and start the writer threads
+
+        :param int nb_workers: number of background writer threads
+        :param int queue_size: max number of pending jobs
+        :param int compress_level: default zlib level for PNG images
+        :param str|None soft_dtype: default storage type of soft segmentations
+        """
+        self.compress_level = compress_level
+        self.soft_dtype = soft_dtype
+        self.nb_failed = 0
+        self.timing = {'write': 0., 'wait': 0.}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = [threading.Thread(target=self._worker)
+                         for _ in range(max(1, nb_workers))]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.close)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            func, args, kwargs = job
+            t_start = time.time()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logging.exception('export by %s', func.__name__)
+                with self._lock:
+                    self.nb_failed += 1
+            finally:
+                with self._lock:
+                    self.timing['write'] += time.time() - t_start
+                self._queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        """ add an export job, blocks if the queue is full
+
+        :param func: function performing the export
+        """
+        assert not self._closed, 'the export service is already closed'
+        t_start = time.time()
+        self._queue.put((func, args, kwargs))
+        self.timing['wait'] += time.time() - t_start
+
+    def save_image_png(self, path_img, img, compress_level=None):
+        """ export image as PNG, see `save_image_png`
+
+        :param str path_img: path to the output image
+        :param ndarray img: image np.array<height, width(, channels)>
+        :param int|None compress_level: zlib level, None uses the default
+        :return str: path to the image
+        """
+        path_img = os.path.splitext(path_img)[0] + '.png'
+        if compress_level is None:
+            compress_level = self.compress_level
+        self.submit(save_image_png, path_img, img, compress_level)
+        return path_img
+
+    def save_render_png(self, path_img, render_func, *args, **kwargs):
+        """ render an image in the writer thread and export it as PNG,
+        the rendering function has to be thread-safe (e.g. not matplotlib)
+
+        :param str path_img: path to the output image
+        :param render_func: function returning image np.array<height, width(, 3)>
+        :return str: path to the image
+        """
+        path_img = os.path.splitext(path_img)[0] + '.png'
+
+        def _render_save():
+            save_image_png(path_img, render_func(*args, **kwargs),
+                           self.compress_level)
+
+        _render_save.__name__ = getattr(render_func, '__name__', 'render')
+        self.submit(_render_save)
+        return path_img
+
+    def save_segm_soft(self, path_npz, segm_soft, dtype='default', compress=True):
+        """ export soft segmentation, see `save_segm_soft`
+
+        :param str path_npz: path to the output NPZ file
+        :param ndarray segm_soft: probabilities np.array<height, width, nb_classes>
+        :param str|None dtype: storage type, 'default' uses the service one
+        :param bool compress: use ZIP compression
+        :return str: path to the file
+        """
+        if dtype == 'default':
+            dtype = self.soft_dtype
+        self.submit(save_segm_soft, path_npz, segm_soft, dtype, compress)
+        return path_npz
+
+    def flush(self):
+        """ wait till all pending jobs are written """
+        self._queue.join()
+
+    def close(self):
+        """ write all pending jobs and stop the writer threads """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if hasattr(atexit, 'unregister'):
+            atexit.unregister(self.close)
+        logging.debug('exporting took - write: %f, wait: %f seconds (failed %i)',
+                      self.timing['write'], self.timing['wait'], self.nb_failed)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_EXPORT_SERVICE = {'pid': None, 'service': None}
+
+
+def get_export_service(**kwargs):
+    """ get export service shared in current process, it is created on the first
+    use and closed at the process exit, also in workers of multiprocessing pool
+    (the keyword arguments are used only for creating a new service)
+
+    :return ImageExportService:
+
+    >>> exporter = get_export_service()
+    >>> exporter is get_export_service()
+    True
+    >>> exporter.close()
+    >>> exporter is get_export_service()
+    False
+    """
+    service = _EXPORT_SERVICE['service']
+    if _EXPORT_SERVICE['pid'] != os.getpid() or service is None or service.closed:
+        service = ImageExportService(**kwargs)
+        # pool workers do not run `atexit`, but they do run mproc finalizers
+        mproc_util.Finalize(service, service.close, exitpriority=10)
+        _EXPORT_SERVICE.update({'pid': os.getpid(), 'service': service})
+    return service
+
+
 def load_complete_image_folder(path_dir, img_name_pattern='*.png',
                                nb_sample=None, im_range=255, skip=None):
     """ load complete image folder with specific name pattern
@@ -857,9 +1701,11 @@ def load_images_list(path_imgs, im_range=255):
     ['temp_sample-image']
     >>> os.remove(path_in)
     """
+    def _load(path_im):
+        return load_image(path_im, im_range)[0]
+
     list_images, list_names = [], []
-    for path_im in path_imgs:
-        im, name = load_image(path_im, im_range)
+    for name, im in ImagePrefetchLoader(path_imgs, load_func=_load):
         if im is None:
             continue
         list_images.append(im)
@@ -924,13 +1770,119 @@ def merge_image_channels(img_ch1, img_ch2, img_ch3=None):
     return img_rgb
 
 
-def find_files_match_names_across_dirs(list_path_pattern, drop_none=True):
+def _scan_dir_names(path_dir):
+    """ list names of all entries in a directory using a single `os.scandir`
+    pass (falling back to `os.listdir`), keeping the OS order as `glob` does
+
+    :param str path_dir: path to directory
+    :return [str]: entry names
+    """
+    if hasattr(os, 'scandir'):
+        with os.scandir(path_dir) as it:
+            return [entry.name for entry in it]
+    return os.listdir(path_dir)
+
+
+def load_files_manifest(path_manifest):
+    """ load manifest of scanned directories, missing or broken file gives empty
+
+    :param str path_manifest: path to the JSON manifest
+    :return dict: {path_dir: {'mtime': float, 'size': int, 'names': [str]}}
+    """
+    if not path_manifest or not os.path.isfile(path_manifest):
+        return {}
+    try:
+        with open(path_manifest, 'r') as fp:
+            manifest = json.load(fp)
+    except ValueError:
+        logging.warning('corrupted files manifest "%s", rescanning', path_manifest)
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_files_manifest(path_manifest, manifest):
+    """ save manifest of scanned directories (atomically via temporary file)
+
+    :param str path_manifest: path to the JSON manifest
+    :param dict manifest: {path_dir: {'mtime': float, 'size': int, 'names': [str]}}
+    """
+    path_tmp = path_manifest + '.tmp'
+    with open(path_tmp, 'w') as fp:
+        json.dump(manifest, fp)
+    replace = getattr(os, 'replace', os.rename)
+    replace(path_tmp, path_manifest)
+
+
+def list_dir_names(path_dir, manifest=None):
+    """ list names in a directory, reusing the manifest record if the directory
+    mtime and size did not change since the last scan
+
+    :param str path_dir: path to directory
+    :param dict|None manifest: manifest of scanned directories, updated in place
+    :return [str]: entry names
+
+    >>> path_dir = os.path.join('.', 'sample-dir-manifest')
+    >>> os.mkdir(path_dir)
+    >>> for n in ('b', 'a'):
+    ...     open(os.path.join(path_dir, n + '.txt'), 'w').close()
+    >>> manifest = {}
+    >>> sorted(list_dir_names(path_dir, manifest))
+    ['a.txt', 'b.txt']
+    >>> sorted(manifest[os.path.abspath(path_dir)])
+    ['mtime', 'names', 'size']
+    >>> manifest[os.path.abspath(path_dir)]['names'] = ['cached.txt']
+    >>> list_dir_names(path_dir, manifest)
+    ['cached.txt']
+    >>> import shutil
+    >>> shutil.rmtree(path_dir)
+    """
+    if manifest is None:
+        return _scan_dir_names(path_dir)
+    key = os.path.abspath(path_dir)
+    stat = os.stat(path_dir)
+    record = manifest.get(key)
+    if record and record.get('mtime') == stat.st_mtime \
+            and record.get('size') == stat.st_size:
+        return record['names']
+    names = _scan_dir_names(path_dir)
+    manifest[key] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'names': names}
+    return names
+
+
+def glob_dir_files(path_pattern, manifest=None):
+    """ equivalent of `glob.glob` for patterns with wildcards only in the file
+    name, listing the directory at most once (or not at all with manifest hit)
+
+    :param str path_pattern: path with file name pattern
+    :param dict|None manifest: manifest of scanned directories, updated in place
+    :return [str]: matching paths in the same order as `glob.glob`
+    """
+    path_dir, pattern = os.path.split(path_pattern)
+    if glob.has_magic(path_dir) or not glob.has_magic(pattern):
+        return glob.glob(path_pattern)
+    if not os.path.isdir(path_dir or os.curdir):
+        return []
+    names = list_dir_names(path_dir or os.curdir, manifest)
+    if not pattern.startswith('.'):
+        names = [n for n in names if not n.startswith('.')]
+    return [os.path.join(path_dir, n) for n in fnmatch.filter(names, pattern)]
+
+
+def find_files_match_names_across_dirs(list_path_pattern, drop_none=True,
+                                       path_manifest=None,
+                                       nb_workers=PREFETCH_NB_THREADS):
     """ walk over dir with images and segmentation and pair those with the same
     name and if the folder with centers exists also add to each par a center
     NOTE: returns just paths
 
+    The directories are scanned concurrently and the names are matched
+    through a dictionary index, so the pairing is linear in number of files.
+    With a manifest, directories with unchanged mtime and size are not rescanned.
+
     :param [str] list_path_pattern: list of paths with image name patterns
     :param bool drop_none: drop if there are some none - missing values in rows
+    :param str|None path_manifest: path to JSON manifest caching directory listings
+    :param int nb_workers: number of threads scanning directories
     :return: DF<path_1, path_2, ...>
 
     >>> def _mp(d, n):
@@ -955,32 +1907,47 @@ def find_files_match_names_across_dirs(list_path_pattern, drop_none=True):
         assert os.path.exists(os.path.dirname(p)), \
             'missing "%s"' % os.path.dirname(p)
 
-    def _get_name(path, pattern='*'):
+    def _get_name(path, pattern_parts):
         name = os.path.splitext(os.path.basename(path))[0]
-        for s in pattern.split('*'):
+        for s in pattern_parts:
             name = name.replace(s, '')
         return name
 
-    def _get_paths_names(path_pattern):
-        paths_ = glob.glob(path_pattern)
-        if not paths_:
-            return [None], [None]
-        names_ = [_get_name(p, os.path.basename(path_pattern)) for p in paths_]
-        return paths_, names_
+    manifest = load_files_manifest(path_manifest) if path_manifest else None
+
+    def _glob(path_pattern):
+        return glob_dir_files(path_pattern, manifest)
 
     logging.info('find match files...')
-    paths_0, names_0 = _get_paths_names(list_path_pattern[0])
+    nb_workers = max(1, min(nb_workers, len(list_path_pattern)))
+    if nb_workers > 1:
+        pool = ThreadPool(nb_workers)
+        list_files = pool.map(_glob, list_path_pattern)
+        pool.close()
+        pool.join()
+    else:
+        list_files = list(map(_glob, list_path_pattern))
+    if manifest is not None:
+        save_files_manifest(path_manifest, manifest)
+
+    paths_0 = list_files[0]
+    if not paths_0:
+        paths_0 = [None]
+        index_0 = {}
+    else:
+        parts = os.path.basename(list_path_pattern[0]).split('*')
+        index_0 = {}
+        for i, path in enumerate(paths_0):
+            index_0.setdefault(_get_name(path, parts), i)
     list_paths = [paths_0]
 
-    for path_pattern_n in list_path_pattern[1:]:
+    for path_pattern_n, files_n in zip(list_path_pattern[1:], list_files[1:]):
         paths_n = [None] * len(paths_0)
-        name_pattern = os.path.basename(path_pattern_n)
-        list_files = glob.glob(path_pattern_n)
-        logging.debug('found %i files in %s', len(list_files), path_pattern_n)
-        for path_n in list_files:
-            name_n = _get_name(path_n, name_pattern)
-            if name_n in names_0:
-                idx = names_0.index(name_n)
+        parts = os.path.basename(path_pattern_n).split('*')
+        logging.debug('found %i files in %s', len(files_n), path_pattern_n)
+        for path_n in files_n:
+            idx = index_0.get(_get_name(path_n, parts))
+            if idx is not None:
                 paths_n[idx] = path_n
         list_paths.append(paths_n)
 
@@ -150,6 +150,102 @@ def ellipse(r, c, r_radius, c_radius, orientation=0., shape=None):
     return rr, cc
 
 
+def ellipse_row_spans(r, c, r_radius, c_radius, orientation=0., shape=None,
+                      inclusive=False):
+    """ rasterize ellipse only in its bounding box as horizontal spans,
+    for each row return the first and behind last column inside the ellipse,
+    so the mask is never allocated and sums over the ellipse may be taken
+    from row-wise cumulative sums in O(ellipse height)
+
+    :param float r: center position in rows
+    :param float c: center position in columns
+    :param float r_radius: ellipse diam in rows
+    :param float c_radius: ellipse diam in columns
+    :param float orientation: ellipse orientation
+    :param (int, int) shape: size of output mask
+    :param bool inclusive: include also pixels lying exactly on the boundary,
+        by default it is the same rasterisation as :func:`ellipse`
+    :return ([int], [int], [int]): rows and columns begin and end of each span
+
+    >>> rows, begins, ends = ellipse_row_spans(7, 10, 3, 9, np.deg2rad(30), (14, 20))
+    >>> rows
+    array([ 2,  3,  4,  5,  6,  7,  8,  9, 10, 11, 12])
+    >>> begins
+    array([15, 12, 10,  8,  7,  5,  4,  3,  3,  3,  3])
+    >>> ends
+    array([18, 18, 18, 18, 17, 16, 14, 13, 11,  9,  6])
+    >>> img = np.zeros((14, 20), dtype=int)
+    >>> img[ellipse_spans_indices(rows, begins, ends)] = 1
+    >>> rr, cc = ellipse(7, 10, 3, 9, np.deg2rad(30), img.shape)
+    >>> np.array_equal(np.argwhere(img), np.array([rr, cc]).T)
+    True
+    """
+    r_radius, c_radius = abs(r_radius), abs(c_radius)
+    if r_radius == 0 or c_radius == 0:
+        return (np.array([], dtype=int), ) * 3
+    orientation %= np.pi
+    sin_alpha, cos_alpha = np.sin(orientation), np.cos(orientation)
+    # rows of the smallest rectangle containing the ellipse
+    r_radius_rot = abs(r_radius * cos_alpha) + c_radius * sin_alpha
+    r_begin = int(np.ceil(r - r_radius_rot))
+    r_end = int(np.floor(r + r_radius_rot)) + 1
+    if shape is not None:
+        r_begin, r_end = max(r_begin, 0), min(r_end, shape[0])
+    rows = np.arange(r_begin, max(r_begin, r_end))
+
+    def _dist(rs, cs):
+        d_r, d_c = rs - r, cs - c
+        return ((d_r * cos_alpha + d_c * sin_alpha) / r_radius) ** 2 \
+            + ((d_r * sin_alpha - d_c * cos_alpha) / c_radius) ** 2
+
+    def _inside(rs, cs):
+        dist = _dist(rs, cs)
+        return dist <= 1 if inclusive else dist < 1
+
+    # solve the quadratic equation in columns for each row
+    coef_a = (sin_alpha / r_radius) ** 2 + (cos_alpha / c_radius) ** 2
+    d_r = rows - r
+    coef_b = 2 * d_r * sin_alpha * cos_alpha * (1. / r_radius ** 2 - 1. / c_radius ** 2)
+    coef_c = d_r ** 2 * ((cos_alpha / r_radius) ** 2 + (sin_alpha / c_radius) ** 2) - 1
+    discrim = np.sqrt(np.clip(coef_b ** 2 - 4 * coef_a * coef_c, 0, None))
+    c_low = c + (-coef_b - discrim) / (2 * coef_a)
+    c_high = c + (-coef_b + discrim) / (2 * coef_a)
+
+    # fix numerical imprecision on the boundary by the exact test
+    eps = 1e-6
+    begins = np.ceil(c_low - eps).astype(int)
+    begins[~_inside(rows, begins)] += 1
+    ends = np.floor(c_high + eps).astype(int)
+    ends[~_inside(rows, ends)] -= 1
+    ends += 1
+    if shape is not None:
+        begins = np.clip(begins, 0, shape[1])
+        ends = np.clip(ends, 0, shape[1])
+    # skip empty rows in the bounding box
+    filled = ends > begins
+    return rows[filled], begins[filled], ends[filled]
+
+
+def ellipse_spans_indices(rows, begins, ends):
+    """ expand horizontal spans to indexes of filled positions
+
+    :param [int] rows: row index of each span
+    :param [int] begins: first column of each span
+    :param [int] ends: column behind the last one of each span
+    :return ([int], [int]): indexes of filled positions
+
+    >>> ellipse_spans_indices([1, 2, 3], [2, 1, 5], [4, 3, 5])
+    (array([1, 1, 2, 2]), array([2, 3, 1, 2]))
+    """
+    rows, begins, ends = np.asarray(rows), np.asarray(begins), np.asarray(ends)
+    lengths = ends - begins
+    rr = np.repeat(rows, lengths)
+    # column offsets within each span
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cc = np.repeat(begins, lengths) + offsets
+    return rr, cc
+
+
 # Should be solved in skimage v0.14
 def ellipse_perimeter(r, c, r_radius, c_radius, orientation=0., shape=None):
     """ see New version scikit-image v0.14
@@ -228,6 +324,44 @@ def figure_image_adjustment(fig, img_size):
     return fig
 
 
+def figure_to_image(fig, crop_tight=False, pad_inches=0.1):
+    """ rasterize figure into RGB image, so it can be exported without
+    touching the (not thread-safe) figure from other threads;
+    the crop imitates `savefig(..., bbox_inches='tight')`
+
+    :param fig: Figure
+    :param bool crop_tight: crop uniform background around the content
+    :param float pad_inches: padding around the content kept by the crop
+    :return ndarray: image np.array<height, width, 3>
+
+    >>> fig = plt.figure(figsize=(2, 1), dpi=50)
+    >>> _= plt.plot([0, 1], [1, 0])
+    >>> figure_to_image(fig).shape
+    (50, 100, 3)
+    >>> img = figure_to_image(fig, crop_tight=True, pad_inches=0)
+    >>> img.shape[0] < 50 and img.shape[1] < 100
+    True
+    >>> plt.close(fig)
+    """
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    img = np.frombuffer(fig.canvas.tostring_rgb(), dtype=np.uint8)
+    img = img.reshape(height, width, 3)
+    if not crop_tight:
+        return img.copy()
+    mask = np.any(img != img[0, 0], axis=-1)
+    if not mask.any():
+        return img.copy()
+    rows, cols = np.where(mask.any(axis=1))[0], np.where(mask.any(axis=0))[0]
+    pad = int(round(pad_inches * fig.dpi))
+    bg = np.empty((rows[-1] - rows[0] + 1 + 2 * pad,
+                   cols[-1] - cols[0] + 1 + 2 * pad, 3), dtype=np.uint8)
+    bg[...] = img[0, 0]
+    bg[pad:bg.shape[0] - pad, pad:bg.shape[1] - pad] = \
+        img[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    return bg
+
+
 def figure_image_segm_results(img, seg, subfig_size=9, mid_labels_alpha=0.2,
                               mid_image_gray=True):
     """ creating subfigure with original image, overlapped segmentation contours
@@ -601,11 +735,10 @@ def draw_graphcut_unary_cost_segments(segments, unary_cost):
     [(100, 150, 3), (100, 150, 3), (100, 150, 3)]
     """
     clrs = plt.get_cmap('Greens')
-    imgs_u_cost = [None] * unary_cost.shape[-1]
-    for i in range(unary_cost.shape[-1]):
-        pw_c_norm = 1 - (unary_cost[:, i] / unary_cost.max())
-        lut = np.asarray([clrs(p) for p in pw_c_norm])[:, :3]
-        imgs_u_cost[i] = lut[segments]
+    # colours for all superpixels and classes in a single colormap call
+    pw_c_norm = 1 - (unary_cost / unary_cost.max())
+    lut = clrs(pw_c_norm)[..., :3]
+    imgs_u_cost = [lut[:, i][segments] for i in range(unary_cost.shape[-1])]
     return imgs_u_cost
 
 
@@ -877,10 +1010,57 @@ def figure_image_segm_centres(img, segm, centers=None, cmap_contour=plt.cm.Blues
     return fig
 
 
+def _lines_aa_coords(starts, ends):
+    """ rasterize many anti-aliased lines at once in the manner of `draw.line_aa`,
+    each line is sampled once per pixel along its major axis and split between
+    two neighbouring pixels along the minor axis
+
+    :param ndarray starts: points np.array<nb_lines, 2> in (row, column)
+    :param ndarray ends: points np.array<nb_lines, 2> in (row, column)
+    :return (ndarray, ndarray, ndarray, ndarray): rows, columns, intensities
+        and index of the line for each pixel
+
+    >>> rr, cc, val, idx = _lines_aa_coords([[0, 0]], [[2, 4]])
+    >>> np.array([rr, cc]).tolist()
+    [[0, 0, 1, 1, 2, 1, 2], [0, 1, 2, 3, 4, 1, 3]]
+    >>> val.tolist()
+    [1.0, 0.5, 1.0, 0.5, 1.0, 0.5, 0.5]
+    """
+    starts = np.asarray(starts, dtype=int).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=int).reshape(-1, 2)
+    diffs = ends - starts
+    nb_steps = np.abs(diffs).max(axis=1)
+    lengths = nb_steps + 1
+    idx = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    steps = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    frac = steps / np.maximum(np.repeat(nb_steps, lengths), 1).astype(float)
+    coords = starts[idx] + frac[:, np.newaxis] * diffs[idx]
+    # the minor axis is the one with smaller difference
+    minor = (np.abs(diffs[:, 1]) < np.abs(diffs[:, 0]))[idx].astype(int)
+    pos = coords[np.arange(len(idx)), minor]
+    pos_floor = np.floor(pos)
+    weight = pos - pos_floor
+    major_vals = np.round(coords[np.arange(len(idx)), 1 - minor]).astype(int)
+    pts = np.empty((2, len(idx), 2), dtype=int)
+    for k, (p_minor, val) in enumerate([(pos_floor, 1 - weight),
+                                        (pos_floor + 1, weight)]):
+        pts[k, np.arange(len(idx)), minor] = p_minor
+        pts[k, np.arange(len(idx)), 1 - minor] = major_vals
+    vals = np.concatenate([1 - weight, weight])
+    pts = pts.reshape(-1, 2)
+    idx = np.concatenate([idx, idx])
+    mask = vals > 0
+    return pts[mask, 0], pts[mask, 1], vals[mask], idx[mask]
+
+
 def draw_graphcut_weighted_edges(segments, centers, edges, edge_weights,
                                  img_bg=None, img_alpha=0.5):
     """ visualise the edges on the overlapping a background image
 
+    All edges are rasterized at once and blended in a single step, where more
+    edges overlap the pixel takes the colour of the most covering one.
+
     :param [(int, int)] centers: list of centers
     :param ndarray segments: np.array<h, w>
     :param ndarray edges: list of edges of shape <nb_edges, 2>
@@ -909,34 +1089,48 @@ def draw_graphcut_weighted_edges(segments, centers, edges, edge_weights,
             img_bg = np.rollaxis(np.tile(img_bg, (3, 1, 1)), 0, 3)
         # convert to range 0,1 so the drawing is correct
         max_val = 1.
-        if img_bg.dtype != np.float:
+        if img_bg.dtype != float:
             max_val = max(255., img_bg.max())
-        img = img_bg.astype(np.float) / max_val
+        img = img_bg.astype(float) / max_val
         # make it partialy transparent
         img = (1. - img_alpha) + img * img_alpha
     else:
         img = np.zeros(segments.shape + (3,))
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+    if not len(edges):
+        return img
+    edge_weights = np.asarray(edge_weights, dtype=float).ravel()
     clrs = plt.get_cmap('Greens')
     diff = (edge_weights.max() - edge_weights.min())
     if diff > 0:
         edge_ratio = (edge_weights - edge_weights.min()) / diff
     else:
         edge_ratio = np.zeros(edge_weights.shape)
-    for i, edge in enumerate(edges):
-        n1, n2 = edge
-        y1, x1 = map(int, centers[n1])
-        y2, x2 = map(int, centers[n2])
-
-        # line = draw.line(y1, x1, y2, x2)  # , shape=img.shape[:2]
-        # img[line] = clrs(edge_ratio[i])[:3]
-
-        # using anti-aliasing
-        rr, cc, val = draw.line_aa(y1, x1, y2, x2)  # , shape=img.shape[:2]
-        color_w = np.tile(val, (3, 1)).T
-        img[rr, cc, :] = color_w * clrs(edge_ratio[i])[:3] + (1 - color_w) * img[rr, cc, :]
-
-        circle = draw.circle(y1, x1, radius=2, shape=img.shape[:2])
-        img[circle] = 1., 1., 0.
+    lut_colors = clrs(edge_ratio)[:, :3]
+    if not isinstance(centers, np.ndarray):
+        # missing superpixels in `superpixel_centers` have empty centre
+        centers = [tuple(c) or (0, 0) for c in centers]
+    centers = np.asarray(centers).astype(int)
+
+    rr, cc, val, idx = _lines_aa_coords(centers[edges[:, 0]], centers[edges[:, 1]])
+    mask = (rr >= 0) & (rr < img.shape[0]) & (cc >= 0) & (cc < img.shape[1])
+    rr, cc, val, idx = rr[mask], cc[mask], val[mask], idx[mask]
+    # for each pixel keep the strongest (and the latest) of overlapping edges
+    pixels = rr * img.shape[1] + cc
+    order = np.lexsort((idx, val, pixels))
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = pixels[order][1:] != pixels[order][:-1]
+    sel = order[last]
+    rr, cc, val, idx = rr[sel], cc[sel], val[sel, np.newaxis], idx[sel]
+    img[rr, cc, :] = val * lut_colors[idx] + (1 - val) * img[rr, cc, :]
+
+    # mark the centres which start some edge, as disc with radius 2
+    d_r, d_c = np.nonzero(np.ones((3, 3)))
+    pts = centers[np.unique(edges[:, 0])]
+    rr = (pts[:, 0, np.newaxis] + d_r - 1).ravel()
+    cc = (pts[:, 1, np.newaxis] + d_c - 1).ravel()
+    mask = (rr >= 0) & (rr < img.shape[0]) & (cc >= 0) & (cc < img.shape[1])
+    img[rr[mask], cc[mask]] = 1., 1., 0.
     return img
 
 
@@ -1019,6 +1213,441 @@ def figure_rg2sp_debug_complete(seg, slic, debug_rg2sp, iter_index=-1,
     return fig
 
 
+class LazyDebugVisual(dict):
+    """ dictionary of debug images which keeps just the raw arrays with
+    a recipe for each image, the image is rendered on the first access
+    (e.g. later in the export thread) and cached
+
+    >>> debug_visual = LazyDebugVisual(slic=np.zeros((2, 3), dtype=int))
+    >>> set_debug_image(debug_visual, 'img', np.full, (2, 3), 5)
+    >>> sorted(debug_visual.keys()), debug_visual.is_rendered('img')
+    (['img', 'slic'], False)
+    >>> debug_visual['img']
+    array([[5, 5, 5],
+           [5, 5, 5]])
+    >>> debug_visual.is_rendered('img')
+    True
+    """
+
+    def set_lazy(self, key, func, *args, **kwargs):
+        """ insert recipe for an image rendered on demand
+
+        :param str key: name of the debug image
+        :param func: function rendering the image
+        """
+        self.__dict__.setdefault('_lazy', {})[key] = (func, args, kwargs)
+        dict.__setitem__(self, key, None)
+
+    def is_rendered(self, key):
+        """ whether the image is already rendered (or it was not lazy)
+
+        :param str key: name of the debug image
+        :return bool:
+        """
+        return key not in self.__dict__.get('_lazy', {})
+
+    def render(self):
+        """ render all lazy images, e.g. before pickling """
+        for key in list(self.__dict__.get('_lazy', {})):
+            self[key]
+
+    def __getitem__(self, key):
+        lazy = self.__dict__.get('_lazy', {})
+        if key in lazy:
+            func, args, kwargs = lazy[key]
+            dict.__setitem__(self, key, func(*args, **kwargs))
+            del lazy[key]
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.__dict__.get('_lazy', {}).pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.__dict__.get('_lazy', {}).pop(key, None)
+        dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def copy(self):
+        self.render()
+        return dict(self)
+
+
+def set_debug_image(debug_visual, key, func, *args, **kwargs):
+    """ insert debug image to the dictionary, for `LazyDebugVisual` only
+    the recipe is recorded and the image is rendered on demand
+
+    :param dict|None debug_visual: dictionary with debug images
+    :param str key: name of the debug image
+    :param func: function rendering the image
+    """
+    if debug_visual is None:
+        return
+    if isinstance(debug_visual, LazyDebugVisual):
+        debug_visual.set_lazy(key, func, *args, **kwargs)
+    else:
+        debug_visual[key] = func(*args, **kwargs)
+
+
+def image_to_rgb8(img):
+    """ convert an image to 8-bit RGB as it would be shown by `imshow`,
+    gray images are stretched to full range and float RGB assumed in (0, 1),
+    the output is always a new array so it can be drawn into in place
+
+    :param ndarray img: image np.array<height, width(, 3)>
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> image_to_rgb8(np.array([[0., 0.5], [1., 2.]]))[..., 0]
+    array([[  0,  64],
+           [128, 255]], dtype=uint8)
+    >>> image_to_rgb8(np.ones((2, 3, 3)) * 0.5).shape
+    (2, 3, 3)
+    >>> img = np.zeros((2, 3, 3), dtype=np.uint8)
+    >>> image_to_rgb8(img) is img, np.shares_memory(image_to_rgb8(img), img)
+    (False, False)
+    """
+    img = np.asarray(img)
+    if img.ndim == 2:
+        img = np.asarray(img, dtype=np.float32)
+        vmin, vmax = img.min(), img.max()
+        img = (img - vmin) / (vmax - vmin) if vmax > vmin else img * 0
+        img = np.round(img * 255).astype(np.uint8)
+        return np.repeat(img[..., np.newaxis], 3, axis=2)
+    img = img[..., :3]
+    if img.dtype == np.uint8:
+        return img.copy()
+    if img.dtype == bool or np.issubdtype(img.dtype, np.floating):
+        img = np.clip(img.astype(np.float32), 0, 1) * 255
+    return np.round(np.clip(img, 0, 255)).astype(np.uint8)
+
+
+def draw_colormap(img, cmap=plt.cm.jet, vmin=None, vmax=None):
+    """ map a scalar image to 8-bit RGB colours with linear normalisation
+    as `imshow`, integer labels are converted through per label table
+
+    :param ndarray img: scalar image np.array<height, width>
+    :param cmap: matplotlib colormap
+    :param float vmin: value mapped to the first colour, default image minimum
+    :param float vmax: value mapped to the last colour, default image maximum
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> draw_colormap(np.array([[0, 1], [2, 2]]), plt.cm.gray)[..., 0]
+    array([[  0, 128],
+           [255, 255]], dtype=uint8)
+    """
+    img = np.asarray(img)
+    vmin = img.min() if vmin is None else vmin
+    vmax = img.max() if vmax is None else vmax
+    lut = np.round(cmap(np.linspace(0, 1, cmap.N))[:, :3] * 255).astype(np.uint8)
+
+    def _norm_index(vals):
+        vals = (np.asarray(vals, dtype=np.float64) - vmin) / float(max(vmax - vmin, 1e-12))
+        return np.clip((vals * cmap.N).astype(int), 0, cmap.N - 1)
+
+    if np.issubdtype(img.dtype, np.integer) and img.size > vmax - vmin:
+        lbs = np.arange(int(vmin), int(vmax) + 1)
+        lut_labels = lut[_norm_index(lbs)]
+        return lut_labels[np.clip(img, vmin, vmax) - int(vmin)]
+    return lut[_norm_index(img)]
+
+
+def draw_boundaries(img, segm, color=None, alpha=1., mode='thick'):
+    """ draw boundaries of segmentation into RGB image (in place)
+
+    :param ndarray img: 8-bit RGB image np.array<height, width, 3>
+    :param ndarray segm: segmentation np.array<height, width>
+    :param color: boundary colour (R, G, B) in (0, 255) or RGB image
+        with colour for each pixel, e.g. colorised labels
+    :param float alpha: transparency of the boundary
+    :param str mode: boundary mode, see `segmentation.find_boundaries`
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> seg = np.zeros((6, 6), dtype=int)
+    >>> seg[2:4, 2:4] = 1
+    >>> draw_boundaries(np.zeros((6, 6, 3), dtype=np.uint8), seg, (255, 0, 0),
+    ...                 mode='inner')[..., 0]
+    array([[  0,   0,   0,   0,   0,   0],
+           [  0,   0,   0,   0,   0,   0],
+           [  0,   0, 255, 255,   0,   0],
+           [  0,   0, 255, 255,   0,   0],
+           [  0,   0,   0,   0,   0,   0],
+           [  0,   0,   0,   0,   0,   0]], dtype=uint8)
+    """
+    mask = segmentation.find_boundaries(segm, mode=mode)
+    color = (255, 255, 255) if color is None else color
+    color = np.asarray(color)
+    color = color[mask] if color.ndim == 3 else color[np.newaxis]
+    if alpha >= 1:
+        img[mask] = color
+    else:
+        img[mask] = np.round((1 - alpha) * img[mask] + alpha * color)
+    return img
+
+
+def draw_overlay_labels(img, segm, alpha=0.2, cmap=plt.cm.jet, boundaries=True):
+    """ blend colorised segmentation with an image and draw label boundaries
+
+    :param ndarray img: image np.array<height, width(, 3)>
+    :param ndarray segm: segmentation np.array<height, width>
+    :param float alpha: transparency of the labels
+    :param cmap: matplotlib colormap for labels
+    :param bool boundaries: draw also boundaries in colour of the labels
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> seg = np.zeros((10, 15), dtype=int)
+    >>> seg[3:7, 4:9] = 1
+    >>> img = draw_overlay_labels(np.zeros((10, 15)), seg, alpha=0.5)
+    >>> img.shape, img.dtype
+    ((10, 15, 3), dtype('uint8'))
+    >>> img[5, 6].tolist(), img[0, 0].tolist(), img[3, 4].tolist()
+    ([64, 0, 0], [0, 0, 64], [128, 0, 0])
+    """
+    img = image_to_rgb8(img)
+    img_segm = draw_colormap(segm, cmap)
+    img = ((1 - alpha) * img + alpha * img_segm).round().astype(np.uint8)
+    if boundaries:
+        draw_boundaries(img, segm, img_segm)
+    return img
+
+
+def draw_points(img, points, color=(255, 0, 0), radius=3):
+    """ draw disc markers into RGB image (in place)
+
+    :param ndarray img: 8-bit RGB image np.array<height, width, 3>
+    :param ndarray points: points np.array<nb_points, 2> in (row, column)
+    :param color: marker colour (R, G, B) in (0, 255)
+    :param int radius: marker radius
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> draw_points(np.zeros((5, 5, 3), dtype=np.uint8), [[2, 2]], radius=1)[..., 0]
+    array([[  0,   0,   0,   0,   0],
+           [  0,   0, 255,   0,   0],
+           [  0, 255, 255, 255,   0],
+           [  0,   0, 255,   0,   0],
+           [  0,   0,   0,   0,   0]], dtype=uint8)
+    """
+    d_r, d_c = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+    disc = np.array(np.nonzero(d_r ** 2 + d_c ** 2 <= radius ** 2)).T - radius
+    for pt in np.round(np.asarray(points, dtype=float)).astype(int).reshape(-1, 2):
+        coords = disc + pt
+        coords = coords[np.all((coords >= 0) & (coords < img.shape[:2]), axis=1)]
+        img[coords[:, 0], coords[:, 1]] = color
+    return img
+
+
+def draw_lines(img, starts, ends, color=(255, 255, 255)):
+    """ draw line segments into RGB image (in place)
+
+    :param ndarray img: 8-bit RGB image np.array<height, width, 3>
+    :param ndarray starts: points np.array<nb_lines, 2> in (row, column)
+    :param ndarray ends: points np.array<nb_lines, 2> in (row, column)
+    :param color: line colour (R, G, B) in (0, 255)
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> draw_lines(np.zeros((4, 5, 3), dtype=np.uint8), [[0, 0]], [[3, 9]])[..., 0]
+    array([[255, 255,   0,   0,   0],
+           [  0,   0, 255, 255, 255],
+           [  0,   0,   0,   0,   0],
+           [  0,   0,   0,   0,   0]], dtype=uint8)
+    """
+    starts = np.round(np.asarray(starts, dtype=float)).astype(int).reshape(-1, 2)
+    ends = np.round(np.asarray(ends, dtype=float)).astype(int).reshape(-1, 2)
+    for (r0, c0), (r1, c1) in zip(starts, ends):
+        rr, cc = draw.line(r0, c0, r1, c1)
+        mask = (rr >= 0) & (rr < img.shape[0]) & (cc >= 0) & (cc < img.shape[1])
+        img[rr[mask], cc[mask]] = color
+    return img
+
+
+def draw_curve(values, shape, index=None, color=(0, 0, 255),
+               color_index=(0, 255, 0)):
+    """ draw a simple text-free plot of a sequence of values
+
+    :param [float] values: plotted values
+    :param (int, int) shape: size of the plot image
+    :param int index: highlighted value
+    :param color: curve colour (R, G, B) in (0, 255)
+    :param color_index: marker colour (R, G, B) in (0, 255)
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> draw_curve([3, 1, 2], (20, 30), index=1).shape
+    (20, 30, 3)
+    """
+    img = np.full(tuple(shape[:2]) + (3, ), 255, dtype=np.uint8)
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return img
+    margin = max(2, int(0.05 * min(shape[:2])))
+    height, width = shape[0] - 2 * margin - 1, shape[1] - 2 * margin - 1
+    vmin, vmax = np.min(values), np.max(values)
+    rows = (vmax - values) / float(max(vmax - vmin, 1e-12)) * height + margin
+    cols = np.arange(len(values)) / float(max(len(values) - 1, 1)) * width + margin
+    pts = np.array([rows, cols]).T
+    draw_lines(img, [[margin, margin], [margin + height, margin]],
+               [[margin + height, margin], [margin + height, margin + width]],
+               color=(191, 191, 191))
+    if len(pts) > 1:
+        draw_lines(img, pts[:-1], pts[1:], color=color)
+    if index is not None:
+        draw_points(img, pts[index], color=color_index,
+                    radius=max(2, margin // 2))
+    return img
+
+
+def draw_image_panels(panels, nb_cols=None, spacing=4, bg_color=255):
+    """ tile images into grid, missing (None) panels are left empty
+
+    :param [ndarray] panels: images np.array<height, width(, 3)>
+    :param int nb_cols: number of columns, default all in one row
+    :param int spacing: gap between panels in pixels
+    :param int bg_color: gray level of the background
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> img = draw_image_panels([np.zeros((10, 15)), None, np.ones((5, 15, 3))],
+    ...                         nb_cols=2, spacing=2)
+    >>> img.shape
+    (22, 32, 3)
+    """
+    panels = [None if p is None else image_to_rgb8(p) for p in panels]
+    nb_cols = len(panels) if nb_cols is None else nb_cols
+    nb_rows = int(np.ceil(len(panels) / float(nb_cols)))
+    height = max(p.shape[0] for p in panels if p is not None)
+    width = max(p.shape[1] for p in panels if p is not None)
+    img = np.full((nb_rows * (height + spacing) - spacing,
+                   nb_cols * (width + spacing) - spacing, 3), bg_color,
+                  dtype=np.uint8)
+    for i, panel in enumerate(panels):
+        if panel is None:
+            continue
+        row, col = (i // nb_cols) * (height + spacing), (i % nb_cols) * (width + spacing)
+        img[row:row + panel.shape[0], col:col + panel.shape[1]] = panel
+    return img
+
+
+def render_image_segm_results(img, seg, mid_labels_alpha=0.2,
+                              mid_image_gray=True):
+    """ fast raster variant of `figure_image_segm_results`: original image,
+    overlapped segmentation with boundaries and the segmentation itself
+
+    :param ndarray img: image
+    :param ndarray seg: segmentation
+    :param float mid_labels_alpha: alpha for middle segmentation overlap
+    :param bool mid_image_gray: used gray image as background in middle
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> img = np.random.random((100, 150, 3))
+    >>> seg = np.random.randint(0, 2, (100, 150))
+    >>> render_image_segm_results(img, seg).shape
+    (308, 150, 3)
+    """
+    assert img.shape[:2] == seg.shape[:2], \
+        'different image %r & seg_pipe %r sizes' % (img.shape, seg.shape)
+    img_rgb = image_to_rgb8(img)
+    img_bg = color.rgb2gray(img_rgb) if mid_image_gray else img_rgb
+    panels = [img_rgb,
+              draw_overlay_labels(img_bg, seg, alpha=mid_labels_alpha),
+              draw_colormap(seg)]
+    # the same orientation as `create_figure_by_image`
+    nb_cols = 3 if seg.shape[0] >= seg.shape[1] else 1
+    return draw_image_panels(panels, nb_cols=nb_cols)
+
+
+def render_segm_graphcut_debug(dict_imgs):
+    """ fast raster variant of `figure_segm_graphcut_debug`: slic, graph edges
+    and results in the first row and class unary terms in the second row
+
+    :param dict_imgs:
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> dict_imgs = {
+    ...     'image': np.random.random((100, 150, 3)),
+    ...     'slic': np.random.randint(0, 2, (100, 150)),
+    ...     'slic_mean': np.random.random((100, 150, 3)),
+    ...     'img_graph_edges': np.random.random((100, 150, 3)),
+    ...     'img_graph_segm': np.random.random((100, 150, 3)),
+    ...     'imgs_unary_cost': [np.random.random((100, 150, 3))],
+    ... }
+    >>> render_segm_graphcut_debug(dict_imgs).shape
+    (204, 458, 3)
+    """
+    assert all(n in dict_imgs for n in ['image', 'slic', 'slic_mean',
+                                        'img_graph_edges', 'img_graph_segm',
+                                        'imgs_unary_cost']), 'missing keys'
+    nb_cols = max(3, len(dict_imgs['imgs_unary_cost']))
+    img_slic = draw_boundaries(image_to_rgb8(dict_imgs['image']),
+                               dict_imgs['slic'], (255, 255, 0), mode='inner')
+    panels = [img_slic, dict_imgs['img_graph_edges'], dict_imgs['img_graph_segm']]
+    panels += [None] * (nb_cols - len(panels))
+    panels += list(dict_imgs['imgs_unary_cost'])
+    return draw_image_panels(panels, nb_cols=nb_cols)
+
+
+def render_rg2sp_debug_complete(seg, slic, debug_rg2sp, iter_index=-1):
+    """ fast raster variant of `figure_rg2sp_debug_complete` showing labels,
+    energy evolution, data cost and shape cost for each object
+
+    :param ndarray seg: segmentation
+    :param ndarray slic: superpixels
+    :param debug_rg2sp: dictionary with some debug parameters
+    :param int iter_index: iteration index
+    :return ndarray: np.array<height, width, 3> of uint8
+
+    >>> seg = np.random.randint(0, 4, (100, 150))
+    >>> slic = np.random.randint(0, 80, (100, 150))
+    >>> dict_debug = {
+    ...     'lut_data_cost': np.random.random((80, 3)),
+    ...     'lut_shape_cost': np.random.random((15, 80, 3)),
+    ...     'labels': np.random.randint(0, 4, (15, 80)),
+    ...     'centres': [np.array([np.random.randint(0, 100, 80),
+    ...                           np.random.randint(0, 150, 80)]).T] * 15,
+    ...     'shifts': np.random.random((15, 3)),
+    ...     'criteria': np.random.random(15),
+    ... }
+    >>> render_rg2sp_debug_complete(seg, slic, dict_debug).shape
+    (204, 458, 3)
+    """
+    nb_objects = debug_rg2sp['lut_data_cost'].shape[1] - 1
+    nb_cols = max(3, nb_objects)
+    centres = np.asarray(debug_rg2sp['centres'][iter_index])
+    lut_shape_cost = debug_rg2sp['lut_shape_cost'][iter_index]
+    clr_gray = (191, 191, 191)
+
+    img_labels = draw_colormap(debug_rg2sp['labels'][iter_index][slic])
+    draw_boundaries(img_labels, seg, clr_gray)
+    rot = np.deg2rad(np.asarray(debug_rg2sp['shifts'][iter_index], dtype=float))
+    shifts = np.array([np.sin(rot), np.cos(rot)]).T * 50.
+    draw_lines(img_labels, centres[:len(shifts)],
+               centres[:len(shifts)] + shifts[:len(centres)])
+    draw_points(img_labels, centres, color=(255, 255, 255))
+    iter_index = iter_index % len(debug_rg2sp['criteria'])
+    panels = [img_labels,
+              draw_curve(debug_rg2sp['criteria'], seg.shape, iter_index),
+              draw_colormap(lut_shape_cost[:, 0][slic])]
+    panels += [None] * (nb_cols - len(panels))
+
+    img_seg = draw_colormap(seg)
+    for i in range(nb_objects):
+        img = draw_colormap(lut_shape_cost[:, i + 1][slic], plt.cm.bone)
+        draw_boundaries(img, seg, img_seg)
+        panels.append(draw_points(img, centres[i:i + 1]))
+    return draw_image_panels(panels, nb_cols=nb_cols)
+
+
 def make_overlap_images_optical(images):
     """ overlap images and show them
 
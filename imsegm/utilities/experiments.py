@@ -326,24 +326,42 @@ class WrapExecuteSequence:
     >>> it = WrapExecuteSequence(min, ([0, 1] for i in range(5)))
     >>> [o for o in it]
     [0, 0, 0, 0, 0]
+    >>> it = WrapExecuteSequence(abs, [-1, 2], nb_workers=2, ordered=True,
+    ...                          initializer=logging.debug, initargs=('init', ))
+    >>> list(it)
+    [1, 2]
+    >>> pool = mproc.Pool(2)
+    >>> [sorted(WrapExecuteSequence(abs, [-i, 2], pool=pool)) for i in range(2)]
+    [[0, 2], [1, 2]]
+    >>> pool.close()
     """
 
     def __init__(self, wrap_func, iterate_vals, nb_workers=NB_THREADS, desc='',
-                 ordered=False):
+                 ordered=False, initializer=None, initargs=(), pool=None):
         """ the init of this wrapper fro parallelism
 
         :param wrap_func: function which will be excited in the iterations
-        :param [] iterate_vals: list or iterator which will ide in iterations
+        :param [] iterate_vals: list or iterator which will ide in iterations,
+            sized iterables (e.g. prefetching loader) are consumed lazily
         :param int nb_workers: number og jobs running in parallel
         :param str desc: deception for the bar,
             if it is set None, bar is suppressed
         :param bool ordered: whether enforce ordering in the parallelism
+        :param initializer: function called once in each worker before
+            the iterations, e.g. loading a shared model
+        :param tuple initargs: arguments of the initializer
+        :param pool: existing process pool to be used (and not closed),
+            so a sequence of calls does not fork new workers each time
         """
         self.wrap_func = wrap_func
-        self.iterate_vals = list(iterate_vals)
+        self.iterate_vals = iterate_vals if hasattr(iterate_vals, '__len__') \
+            else list(iterate_vals)
         self.nb_workers = nb_workers
         self.desc = desc
         self.ordered = ordered
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pool = pool
 
     def __iter__(self):
         tqdm_bar = None
@@ -351,18 +369,24 @@ class WrapExecuteSequence:
             desc = '%r @%i-threads' % (self.desc, self.nb_workers)
             tqdm_bar = tqdm.tqdm(total=len(self), desc=desc)
 
-        if self.nb_workers > 1:
+        if self.pool is not None or self.nb_workers > 1:
             logging.debug('perform parallel in %i threads', self.nb_workers)
-            pool = mproc.Pool(self.nb_workers)
+            pool = self.pool
+            if pool is None:
+                pool = mproc.Pool(self.nb_workers, initializer=self.initializer,
+                                  initargs=self.initargs)
 
             pooling = pool.imap if self.ordered else pool.imap_unordered
 
             for out in pooling(self.wrap_func, self.iterate_vals):
                 tqdm_bar.update() if tqdm_bar is not None else None
                 yield out
-            pool.close()
-            pool.join()
+            if self.pool is None:
+                pool.close()
+                pool.join()
         else:
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
             for out in map(self.wrap_func, self.iterate_vals):
                 tqdm_bar.update() if tqdm_bar is not None else None
                 yield out
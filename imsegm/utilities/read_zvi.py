@@ -30,6 +30,13 @@ read ZVI (Zeiss) image file
 >>> img = load_image(path_file)
 >>> img.shape
 (4, 488, 648)
+>>> with ZviReader(path_file) as zvi:
+...     len(zvi), zvi.shape, zvi.dtype
+...     np.array_equal(zvi[-1], img[-1])
+...     [plane.shape for plane in zvi]
+(4, (4, 488, 648), dtype('uint16'))
+True
+[(488, 648), (488, 648), (488, 648), (488, 648)]
 
 """
 
@@ -50,6 +57,13 @@ def get_hex(data, n=16):
     return '|'.join(['%02x' % (ord(data[i])) for i in range(n)])
 
 
+def _stream_buffer(stream):
+    """ zero-copy view to the content of (in-memory) OLE stream """
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return memoryview(stream.read())
+
+
 def read_struct(data, t):
     """ read a t type from data(str)"""
 #    vartype = (ord(data[0]), ord(data[1]))
@@ -70,7 +84,7 @@ def read_struct(data, t):
         return [r, next_data[4:]]
     elif t == 'BLOB':
         size = i32(next_data[:4])
-        r = next_data[4:4 + size]
+        r = bytes(next_data[4:4 + size])
         return [r, next_data[4 + size:]]
     elif t == 'BSTR':
         # ! 4 extra bytes escaped
@@ -136,11 +150,25 @@ PIXEL_FORMAT = {
     8: (6, 'WordBGR'),
     9: (4, 'LongBGR'),
 }
+#: numpy type and number of channels (in stored BGR order) of pixel formats,
+#: 'LongBGR' is not included as its channel layout is not documented
+PIXEL_FORMAT_DTYPE = {
+    1: ('<u1', 3),
+    2: ('<u1', 4),
+    3: ('<u1', 1),
+    4: ('<u2', 1),
+    5: ('<i4', 1),
+    6: ('<f4', 1),
+    7: ('<f8', 1),
+    8: ('<u2', 3),
+}
+#: size of the header of raw image data
+IMAGE_HEADER_SIZE = 28
 
 
 def read_item_storage_content(stream):
     """ returns ZviItemTuple from the stream"""
-    data = stream.read()
+    data = _stream_buffer(stream)
     next_data = data
     [version, next_data] = read_struct(next_data, 'I4')
 #    [Type, next] = read_struct(next, 'I4')
@@ -156,7 +184,7 @@ def read_item_storage_content(stream):
     [layers, next_data] = read_struct(next_data, 'BLOB')
     [scaling, _] = read_struct(next_data, 'BLOB')
     # offset is image size + header size(28)
-    offset = width * height * PIXEL_FORMAT[pixel_format][0] + 28
+    offset = width * height * PIXEL_FORMAT[pixel_format][0] + IMAGE_HEADER_SIZE
     # parse the actual image data
     image = parse_image(data[-offset:])
     # group results into one single structure (namedtuple)
@@ -173,8 +201,29 @@ ImageTuple = namedtuple(
 )
 
 
+def get_pixel_format_dtype(pixel_format):
+    """ numpy type and number of channels for the ZVI pixel format
+
+    :param int pixel_format: code of the pixel format
+    :return (str, int):
+
+    >>> get_pixel_format_dtype(8)
+    ('<u2', 3)
+    >>> get_pixel_format_dtype(9)
+    Traceback (most recent call last):
+    ...
+    ValueError: not supported pixel format 9 (LongBGR)
+    """
+    if pixel_format not in PIXEL_FORMAT_DTYPE:
+        name = PIXEL_FORMAT.get(pixel_format, (None, 'unknown'))[1]
+        raise ValueError('not supported pixel format %r (%s)'
+                         % (pixel_format, name))
+    return PIXEL_FORMAT_DTYPE[pixel_format]
+
+
 def parse_image(data):
-    """ returns ImageTuple from raw image data(header+image)"""
+    """ returns ImageTuple from raw image data(header+image),
+    the pixel array is a view to the given buffer (no copy) """
     version = i32(data[:4])
     width = i32(data[4:8])
     height = i32(data[8:12])
@@ -182,8 +231,11 @@ def parse_image(data):
     pixel_width = i32(data[16:20])
     pixel_format = i32(data[20:24])
     valid_bits_per_pixel = i32(data[24:28])
-    raw = np.fromstring(data[28:], 'uint16')
-    array = np.reshape(raw, (height, width))
+    dtype, nb_channels = get_pixel_format_dtype(pixel_format)
+    raw = np.frombuffer(data, dtype, count=height * width * nb_channels,
+                        offset=IMAGE_HEADER_SIZE)
+    shape = (height, width) if nb_channels == 1 else (height, width, nb_channels)
+    array = np.reshape(raw, shape)
     image = ImageTuple(version, width, height, depth, pixel_width,
                        pixel_format, valid_bits_per_pixel, array)
     return image
@@ -206,8 +258,7 @@ def get_dir(file_name, ole=None):
     if ole is None:
         ole = OleFileIO_PL.OleFileIO(file_name)
     for s in ole.listdir():
-        stream = ole.openstream(s)
-        dirs.append('%10d %s' % (len(stream.read()), s))
+        dirs.append('%10d %s' % (ole.get_size(s), s))
     return dirs
 
 
@@ -220,13 +271,81 @@ def zvi_read(fname, plane, ole=None):
     return read_item_storage_content(stream)
 
 
+class ZviReader(object):
+    """ reader of ZVI image which parses the container header once
+    and decodes the image planes lazily by index, each plane is a view
+    to its own stream buffer so the whole volume does not have to be loaded
+    """
+
+    def __init__(self, path_img):
+        """ open the ZVI file
+
+        :param str path_img: path to the ZVI image
+        """
+        self._ole = OleFileIO_PL.OleFileIO(path_img)
+        stream = self._ole.openstream(['Image', 'Contents'])
+        self.header = read_image_container_content(stream)
+        dtype, nb_channels = get_pixel_format_dtype(self.header.PIXEL_FORMAT)
+        self.dtype = np.dtype(dtype)
+        self._plane_shape = (self.header.Height, self.header.Width)
+        if nb_channels > 1:
+            self._plane_shape += (nb_channels, )
+
+    def __len__(self):
+        return self.header.Count
+
+    @property
+    def shape(self):
+        return (len(self), ) + self._plane_shape
+
+    def read_plane(self, idx):
+        """ decode single image plane
+
+        :param int idx: index of the plane
+        :return ndarray:
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('plane index %i out of range %i' % (idx, len(self)))
+        stream = self._ole.openstream(['Image', 'Item(%d)' % idx, 'Contents'])
+        data = _stream_buffer(stream)
+        # the image (header + pixels) is at the end of the stream
+        size = int(np.prod(self._plane_shape)) * self.dtype.itemsize
+        return parse_image(data[-(size + IMAGE_HEADER_SIZE):]).Array
+
+    __getitem__ = read_plane
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.read_plane(idx)
+
+    def read_volume(self):
+        """ read all planes into a single preallocated volume
+
+        :return ndarray:
+        """
+        volume = np.empty(self.shape, dtype=self.dtype)
+        for idx, plane in enumerate(self):
+            volume[idx] = plane
+        return volume
+
+    def close(self):
+        self._ole.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 def load_image(path_img):
-    ole = OleFileIO_PL.OleFileIO(path_img)
-    nb = get_layer_count('', ole=ole)
-    # logging.debug('Count layers = %i', nb)
-    image = []
-    for i in range(nb):
-        zvi = zvi_read('', i, ole=ole)
-        image.append(zvi.Image.Array)
-    image = np.array(image)
+    """ load all image planes as a volume
+
+    :param str path_img: path to the ZVI image
+    :return ndarray:
+    """
+    with ZviReader(path_img) as zvi:
+        image = zvi.read_volume()
     return image